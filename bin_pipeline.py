@@ -0,0 +1,68 @@
+import os
+import sys
+import shlex
+import shutil
+import subprocess
+import tempfile
+import time
+import argparse
+
+from file_schema.handoff import serve_queue
+
+# Runs the simulator and the render side by side on one machine, handing the scenes over through a bounded
+# in-memory queue instead of the JSON files of the simulation folder.
+#
+#   python bin_pipeline.py --config config.json --runs 100 --queue-size 8 --render-args "--img-amount 4 --batch-size 2"
+
+
+def start_process(script: str, arguments: list) -> subprocess.Popen:
+    blenderproc = shutil.which("blenderproc")
+    if blenderproc is None:
+        raise FileNotFoundError("The blenderproc command is needed to launch the simulator and render")
+    return subprocess.Popen([blenderproc, "run", os.path.abspath(script)] + arguments)
+
+
+parser = argparse.ArgumentParser(description='Simulate and render in one go, without the simulation queue folder.')
+parser.add_argument('--config', nargs='?', default='config.json', help='filepath to configuration JSON file')
+parser.add_argument('--runs', nargs='?', default='5', help='The number of scenes to simulate and render')
+parser.add_argument('--queue-size', nargs='?', default='8', help='Maximum amount of simulated scenes waiting for the render')
+parser.add_argument('--simulator-args', nargs='?', default='', help='Extra arguments for bin_simulator.py, as one string')
+parser.add_argument('--render-args', nargs='?', default='', help='Extra arguments for bin_render.py, as one string')
+args = parser.parse_args()
+
+with tempfile.TemporaryDirectory() as socket_dir:
+    address = os.path.join(socket_dir, "handoff.sock")
+    manager = serve_queue(address, maxsize=int(args.queue_size))
+    handoff = manager.get_queue()
+    start = time.time()
+
+    render = start_process("bin_render.py", ["--handoff", address] + shlex.split(args.render_args))
+    simulator = start_process("bin_simulator.py", ["--handoff", address, "--config", str(args.config), "--runs", str(args.runs)] + shlex.split(args.simulator_args))
+
+    try:
+        # The simulator only blocks on a full queue, stop it if the render is gone
+        while simulator.poll() is None:
+            if render.poll() is not None:
+                print(f"Render stopped with exit code {render.returncode}, stopping the simulator")
+                simulator.terminate()
+                simulator.wait()
+                break
+            time.sleep(1)
+
+        # Let the render finish the queued scenes and stop
+        if render.poll() is None:
+            handoff.put(None)
+            render.wait()
+
+    except KeyboardInterrupt:
+        simulator.terminate()
+        render.terminate()
+        simulator.wait()
+        render.wait()
+        print("\n Pipeline stopped by user")
+
+    finally:
+        manager.shutdown()
+
+    print(f"Simulator exited with {simulator.returncode} and render with {render.returncode} after {time.time() - start:.1f} seconds")
+    sys.exit(simulator.returncode or render.returncode)
@@ -9,41 +9,63 @@ sys.path.append(myDir)
 
 from file_schema.scene import PositionData, SceneData
 from file_schema.config import ConfigData
-from file_schema.schema_logic import get_next_sim_folder, load_config_from_folder, load_schema_from_file, save_schema_to_folder
+from file_schema.schema_logic import get_folder_name, get_next_sim_folder, get_subdirectories, load_config_from_folder, load_scene_from_file, load_schema_from_file, save_scene_to_folder, scene_from_arrays
+from file_schema.handoff import connect_queue
+from file_schema.queue_logic import ScenePrefetcher, SceneQueue
+from file_schema.scene_store import SceneStore
+from file_schema.bop_shards import commit_shard, finalize_shards, new_shard_path
 from entities.component import Component
 from entities.bin import Bin
-from typing import List
+from entities.material_pool import MaterialPool, TexturePool
+from entities.visibility import get_visible_objects
+from entities.phase_timer import PhaseTimer
+from entities.memory_watchdog import MemoryWatchdog
+from entities.camera_planner import CameraPlanner, euler_to_matrix
+from entities.render_profile import RenderProfile, apply_render_profile, get_render_profile, get_scaled_intrinsics
+from typing import List, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import math
 import colorsys
 import argparse
 import numpy as np
-
 import time
-import shutil
+import queue
+import threading
 
 
 haven_path = "resources/haven"
 output_dir = "data"
 
 class Render:
+    
+    # bproc.init() clears the scene, so it may only run once per Blender process
+    initialized = False
                            
-    def __init__(self, config_data: ConfigData, use_metadata: bool):
-        bproc.init()
+    def __init__(self, config_data: ConfigData, use_metadata: bool, texture_pool_size: int = 16, texture_max_resolution: int = 1024, max_instances: Optional[int] = None, timer: Optional[PhaseTimer] = None, sharded_output: bool = False,
+                 render_profile: Optional[str] = None, camera_planner: Optional[CameraPlanner] = None, min_visible_fraction: float = 0.0):
+        if not Render.initialized:
+            bproc.init()
+            bproc.renderer.enable_depth_output(activate_antialiasing=False)
+            Render.initialized = True
+            
         self.use_metadata = use_metadata
         self.config_data = config_data
         self.camera = config_data.camera
-        self.components = [ Component(comp_data) for comp_data in config_data.components ] 
+        self.components = [ Component(comp_data, max_instances=max_instances) for comp_data in config_data.components ] 
         self.bins = [Bin(bin_data) for bin_data in config_data.bins ]
         self.bin = self.bins[0]
 
-        K = [
-            [self.camera.fx, 0, self.camera.cx],
-            [0, self.camera.fy, self.camera.cy],
-            [0, 0, 1]
-        ]
+
+        # The profile given on the command line overrides the one of the config
+        self.set_profile(get_render_profile(render_profile or config_data.render_profile))
         
         self.light = bproc.types.Light()
+        self.min_visible_fraction = min_visible_fraction
+        self.timer = timer or PhaseTimer("render")
+        self.sharded_output = sharded_output
+        self.camera_planner = camera_planner
 
 
         # Collect all texture images 
@@ -52,53 +74,106 @@ class Render:
         for subdir, dirs, files in os.walk(textures_path):
             for file in files:
                 self.texure_images.append(os.path.join(subdir, file))
+
+        # Reuse a bounded set of textures and one material per entity across scenes
+        use_textures = any(entity.random_texture for entity in self.bins + self.components)
+        self.texture_pool = TexturePool(self.texure_images, max_textures=texture_pool_size, max_resolution=texture_max_resolution, preload=use_textures)
+        self.material_pool = MaterialPool(self.texture_pool)
         
         self.bin.load(build_convex=False)
         
         for entities in self.components:
             entities.load(build_convex=False, downsample_mesh=False)
             
-        bproc.camera.set_intrinsics_from_K_matrix(K=K, image_height=self.camera.height, image_width=self.camera.width)
-        bproc.renderer.enable_depth_output(activate_antialiasing=False)
-        bproc.renderer.set_max_amount_of_samples(50)
+        self.apply_profile()
+
+    def set_profile(self, profile: RenderProfile):
+        self.profile = profile
+        self.K, self.width, self.height = get_scaled_intrinsics(self.camera, profile.resolution_scale)
+
+    def apply_profile(self):
+        apply_render_profile(self.profile)
+        bproc.camera.set_intrinsics_from_K_matrix(K=self.K, image_height=self.height, image_width=self.width)
 
 
     def get_all_comp_objs(self): 
-        return sum([comp.obj_list for comp in self.components], [])
+        return [obj for comp in self.components for obj in comp.obj_list]
+    
+    def get_all_objs(self):
+        # Bins and all component instances, including the pooled ones
+        return [bin.obj for bin in self.bins] + [obj for comp in self.components for obj in comp.get_instances()]
+    
+    def set_active(self, active: bool):
+        # Hide objects of inactive renders from rendering and raycasting, several renders may share a Blender scene
+        if active:
+            for obj in [bin.obj for bin in self.bins] + self.get_all_comp_objs():
+                obj.hide(False)
+        else:
+            for obj in self.get_all_objs():
+                obj.hide(True)
+        self.light.blender_obj.hide_render = not active
+        self.light.blender_obj.hide_viewport = not active
+        
+        if active:
+            self.apply_profile()
+            
+    def unload(self):
+        # Remove all objects of this render from the Blender scene
+        for obj in self.get_all_objs():
+            obj.delete()
+        self.light.delete()
+        self.material_pool.clear()
     
     def get_amount_of_components(self):
         return sum([len(comp.obj_list) for comp in self.components])
     
-    def randomize_light(self):
+    def randomize_light(self, frames: Optional[List[int]] = None):
         # Randomize light source
         light_type = np.random.choice(["POINT", "SUN", "SPOT", "AREA"])
-        self.light.set_type(light_type)
+        location = np.random.uniform([-1, -1, 5], [1, 1, 20])
+        rotation = np.random.uniform([-0.5, -0.5, -0.5], [0.5, 0.5, 61])
+        energy = np.random.uniform(0.5, 1)
+
+        # Keyframe the same light for every given frame
+        for frame in frames or [None]:
+            self.light.set_type(light_type, frame=frame)
+            self.light.set_location(location, frame=frame)
+            self.light.set_rotation_euler(rotation, frame=frame)
+            self.light.set_color([1, 1, 1], frame=frame)
+            self.light.set_energy(energy, frame=frame)
 
-        # Move the light
-        self.light.set_location(np.random.uniform([-1, -1, 5], [1, 1, 20]))
-        self.light.set_rotation_euler(np.random.uniform([-0.5, -0.5, -0.5], [0.5, 0.5, 61]))
-        self.light.set_color([1, 1, 1])
-        self.light.set_energy(np.random.uniform(0.5, 1))
+    def randomize_materials(self, random_texture, name: str):
+        # Get the pooled material of the entity, with a random texture if needed
+        material = self.material_pool.get(name, random_texture)
 
-    def randomize_materials(self, random_texture):
-        # Make a random material
-        material = bproc.material.create('RandomMat')
+        self.randomize_material_values(material, random_texture)
+
+        return material
+
+    def randomize_material_values(self, material, random_texture, frames: Optional[List[int]] = None):
+        values = {}
         
-        if random_texture:
-            # Assign a random texture
-            image = bpy.data.images.load(filepath=str(np.random.choice(self.texure_images)))
-            material.set_principled_shader_value("Base Color", image)
-        else:
+        if not random_texture:
             # Assign a random color
             h, l, s = np.random.uniform(0.1, 0.9, 3)
             r, g, b = colorsys.hls_to_rgb(h, l, s)
-            material.set_principled_shader_value("Base Color", [r, g, b, 1])
+            values["Base Color"] = [r, g, b, 1]
 
-        material.set_principled_shader_value("Roughness", np.random.uniform(1, 10.0))
-        material.set_principled_shader_value("Specular", np.random.uniform(0, 1))
-        material.set_principled_shader_value("Metallic", np.random.uniform(0, .2))
+        values["Roughness"] = np.random.uniform(1, 10.0)
+        values["Specular"] = np.random.uniform(0, 1)
+        values["Metallic"] = np.random.uniform(0, .2)
 
-        return material
+        if frames is None:
+            for name, value in values.items():
+                material.set_principled_shader_value(name, value)
+            return
+        
+        # Keyframe the values, so one material can change between the scenes of a batch
+        bsdf = material.get_the_one_node_with_type("BsdfPrincipled")
+        for name, value in values.items():
+            bsdf.inputs[name].default_value = value
+            for frame in frames:
+                bsdf.inputs[name].keyframe_insert(data_path="default_value", frame=frame)
 
     def calculate_camera_pose(self, bin_dimensions: List[float]):
         x, y, z = bin_dimensions
@@ -125,96 +200,559 @@ class Render:
         cam2world = bproc.math.build_transformation_mat(location, rotation_matrix)
 
         return cam2world
-    
-    def get_visible_components_from_camera(self, cam2world):
 
-        # Compute raycasting to only show visible objects
-        sqrt_rays = round(math.sqrt(self.camera.height * self.camera.width) / 4)
-        obj_visible = bproc.camera.visible_objects(cam2world, sqrt_rays)
+    def get_camera_poses(self, scene: SceneData, img_amount: int, include_fallen = False) -> List[np.ndarray]:
+        if self.camera_planner is None:
+            return [self.calculate_camera_pose(self.bin.dimensions) for i in range(img_amount) ]
 
-        # Filter visible components
-        all_comps = set(self.get_all_comp_objs())
-        comp_visible = obj_visible.intersection(all_comps)
-        
-        return comp_visible
+        # The planner works on the poses of the scene, so it does not depend on the keyframes of a batch
+        centers, radii = [], []
+        for comp in self.components:
+            positions = [pos for element in scene.comps if element.name == comp.name for pos in element.pos]
+            if not include_fallen:
+                positions = [pos for pos in positions if pos.location[2] > 0]
+            positions = positions[:comp.max_instances]
+            centers += [pos.location for pos in positions]
+            radii += [comp.radius] * len(positions)
+
+        bin2world = np.eye(4)
+        bin2world[:3, :3] = euler_to_matrix(scene.bin.pos[0].orientation)
+        bin2world[:3, 3] = scene.bin.pos[0].location
+
+        return self.camera_planner.plan(self.camera.positioning, bin2world, self.bin.dimensions, np.reshape(centers, (-1, 3)), np.array(radii),
+                                        self.K, self.width, self.height, img_amount)
+    
+    def get_visible_components(self, cameras):
 
-    def run(self, scene: SceneData, 
-            random_background = True, img_amount = 4, random_camera_positions = True, include_fallen = False) -> List[PositionData]:
+        # Cull components against all camera frustums at once, then raycast only the remaining ones
+        sqrt_rays = round(math.sqrt(self.height * self.width) / 4)
+        comp_visible, visible_fractions = get_visible_objects(
+            self.get_all_comp_objs(), cameras, self.K, self.width, self.height, sqrt_rays
+        )
         
+        # Leave heavily occluded components unannotated, they are still rendered
+        return {obj for obj in comp_visible if visible_fractions[obj] >= self.min_visible_fraction}
+
+    def set_scene_poses(self, scene: SceneData, include_fallen = False, frame: Optional[int] = None):
         # Set bin location
         for bin in self.bins:
             if bin.name == scene.bin.name:
-                bin.from_element(scene.bin.pos[0])
+                bin.from_element(scene.bin.pos[0], frame=frame)
                 
-        # Find matching components and set their position. 
-        for element in scene.comps:
-            for comp in self.components:
-                if comp.name == element.name:
-                    comp.from_element(element.pos, include_fallen = include_fallen)
+        # Find matching components and set their position, components missing from the scene are moved away.
+        for comp in self.components:
+            positions = [pos for element in scene.comps if element.name == comp.name for pos in element.pos]
+            comp.from_element(positions, include_fallen = include_fallen, frame=frame)
+
+    def get_objects_to_annotate(self, cameras) -> set[MeshObject]:
+        objects_to_annotate = self.get_visible_components(cameras)
+        
+        # Add bin to be annotated
+        if self.bin.obj_id != 0: 
+            objects_to_annotate.add(self.bin.obj)
+
+        return objects_to_annotate
+
+    def write_scene(self, objects_to_annotate, colors, depths):
+        # With sharded output every scene is written on its own, and merged into the chunks by finalize_shards
+        scene_output_dir = new_shard_path(output_dir) if self.sharded_output else output_dir
+        
+        bproc.writer.write_bop(
+            output_dir=os.path.join(scene_output_dir),
+            dataset=self.config_data.dataset_name,
+            target_objects= objects_to_annotate,
+            colors=colors,
+            depths=depths,
+            color_file_format="JPEG",
+            append_to_existing_output=not self.sharded_output,
+            save_world2cam=True,
+            depth_scale=0.1, 
+            calc_mask_info_coco= self.use_metadata,
+
+            )
+        
+        if self.sharded_output:
+            commit_shard(scene_output_dir)
+
+    def reset(self):
+        # Reset keyframe and restart.
+        bproc.utility.reset_keyframes()
+        
+        # Return all component instances to the pool
+        for comp in self.components:
+            comp.set_amount(0)
+
+    def setup_scene(self, scene: SceneData, 
+                    random_background = True, img_amount = 4, random_camera_positions = True, include_fallen = False):
+        # Set bin and component locations
+        with self.timer.phase("poses"):
+            self.set_scene_poses(scene, include_fallen = include_fallen)
                     
         # Randomize material for bin
         if self.bin.random_color or self.bin.random_texture:
-            material = self.randomize_materials(self.bin.random_texture)
-            self.bin.obj.replace_materials(material)
-            self.bin.obj.add_uv_mapping("smart")
+            with self.timer.phase("materials"):
+                material = self.randomize_materials(self.bin.random_texture, self.bin.name)
+            with self.timer.phase("uv_mapping"):
+                MaterialPool.assign(self.bin.obj, material)
 
         # Randomize material for components.
         for comp in self.components:
             if comp.random_color or comp.random_texture:
-                material = self.randomize_materials(comp.random_texture)
-                for comp in comp.obj_list:
-                    comp.replace_materials(material)
-                    comp.add_uv_mapping("smart")
+                with self.timer.phase("materials"):
+                    material = self.randomize_materials(comp.random_texture, comp.name)
+                with self.timer.phase("uv_mapping"):
+                    for obj in comp.obj_list:
+                        MaterialPool.assign(obj, material)
                     
         # Randomize lighting
-        self.randomize_light()    
+        with self.timer.phase("light"):
+            self.randomize_light()    
                 
         # Set a random background
         if random_background: 
-            haven_hdri_path = bproc.loader.get_random_world_background_hdr_img_path_from_haven(haven_path)
-            bproc.world.set_world_background_hdr_img(haven_hdri_path)
+            with self.timer.phase("hdri"):
+                haven_hdri_path = bproc.loader.get_random_world_background_hdr_img_path_from_haven(haven_path)
+                bproc.world.set_world_background_hdr_img(haven_hdri_path)
 
         # Randomize camera positions
-        if not scene.cameras or random_camera_positions:
-            scene.cameras = [self.calculate_camera_pose(self.bin.dimensions) for i in range(img_amount) ]
+        with self.timer.phase("cameras"):
+            if not scene.cameras or random_camera_positions:
+                scene.cameras = self.get_camera_poses(scene, img_amount, include_fallen=include_fallen)
+            
+            # Render the scene for each camera viewpoint and save it in the bop format
+            for cam2world in scene.cameras:
+                bproc.camera.add_camera_pose(cam2world)
+
+    def run(self, scene: SceneData, 
+            random_background = True, img_amount = 4, random_camera_positions = True, include_fallen = False) -> List[PositionData]:
+        self.timer.start_scene()
         
-        # Render the scene for each camera viewpoint and save it in the bop format
-        all_visible_comp: set[MeshObject] = set()
+        self.setup_scene(scene, random_background=random_background, img_amount=img_amount, 
+                         random_camera_positions=random_camera_positions, include_fallen=include_fallen)
         
-        for cam2world in scene.cameras:
-            bproc.camera.add_camera_pose(cam2world)
-            visible_comps = self.get_visible_components_from_camera(cam2world)
-            all_visible_comp = all_visible_comp.union(visible_comps)
+        with self.timer.phase("visibility"):
+            objects_to_annotate = self.get_objects_to_annotate(scene.cameras)
+            
+        # Render Pipeline
+        with self.timer.phase("render"):
+            data = bproc.renderer.render()
         
-        objects_to_annotate = all_visible_comp
+        with self.timer.phase("write_bop"):
+            self.write_scene(objects_to_annotate, colors=data['colors'], depths=data['depth'])
         
-        # Add bin to be annotated
-        if self.bin.obj_id != 0: 
-            objects_to_annotate.add(self.bin.obj)
+        components = self.get_amount_of_components()
+        with self.timer.phase("reset"):
+            self.reset()
+        
+        self.timer.end_scene(scenes=1, images=len(scene.cameras), components=components, annotated=len(objects_to_annotate))
+
+    def run_batch(self, scenes: List[SceneData], 
+            random_background = True, img_amount = 4, random_camera_positions = True, include_fallen = False):
+        # Render several scenes with a single render call, every scene gets its own range of keyframes.
+        self.timer.start_scene()
+
+        # Materials are created once per batch and their parameters keyframed per scene. 
+        # Textures and the background can not be keyframed, so they are shared by the scenes of the batch.
+        materials = []
+        
+        if self.bin.random_color or self.bin.random_texture:
+            with self.timer.phase("materials"):
+                material = self.randomize_materials(self.bin.random_texture, self.bin.name)
+            with self.timer.phase("uv_mapping"):
+                MaterialPool.assign(self.bin.obj, material)
+            materials.append((material, self.bin.random_texture))
+
+        # Create enough objects for the largest scene before assigning materials
+        for comp in self.components:
+            with self.timer.phase("poses"):
+                amounts = [len(element.pos) for scene in scenes for element in scene.comps if element.name == comp.name]
+                comp.add_to_obj_list(max= max(amounts, default=0))
             
+            if comp.random_color or comp.random_texture:
+                with self.timer.phase("materials"):
+                    material = self.randomize_materials(comp.random_texture, comp.name)
+                with self.timer.phase("uv_mapping"):
+                    for obj in comp.obj_list:
+                        MaterialPool.assign(obj, material)
+                materials.append((material, comp.random_texture))
+                
+        if random_background: 
+            with self.timer.phase("hdri"):
+                haven_hdri_path = bproc.loader.get_random_world_background_hdr_img_path_from_haven(haven_path)
+                bproc.world.set_world_background_hdr_img(haven_hdri_path)
+
+        # Keyframe poses, lights, materials and cameras of every scene
+        scene_frames: List[List[int]] = []
+        next_frame = 0
+        
+        for scene in scenes:
+            if not scene.cameras or random_camera_positions:
+                scene.cameras = self.get_camera_poses(scene, img_amount, include_fallen=include_fallen)
+
+            frames = list(range(next_frame, next_frame + len(scene.cameras)))
+            next_frame += len(scene.cameras)
+            scene_frames.append(frames)
+
+            with self.timer.phase("poses"):
+                for frame in frames:
+                    self.set_scene_poses(scene, include_fallen = include_fallen, frame=frame)
+                
+            with self.timer.phase("light"):
+                self.randomize_light(frames)
+            with self.timer.phase("materials"):
+                for material, random_texture in materials:
+                    self.randomize_material_values(material, random_texture, frames)
+            
+            with self.timer.phase("cameras"):
+                for frame, cam2world in zip(frames, scene.cameras):
+                    bproc.camera.add_camera_pose(cam2world, frame=frame)
+
+        # Raycast the visible objects of each scene with the poses of that scene
+        annotations = []
+        with self.timer.phase("visibility"):
+            for frames, scene in zip(scene_frames, scenes):
+                bpy.context.scene.frame_set(frames[0])
+                annotations.append(self.get_objects_to_annotate(scene.cameras))
+
         # Render Pipeline
-        data = bproc.renderer.render()
+        with self.timer.phase("render"):
+            data = bproc.renderer.render()
+
+        # Write every scene on its own, shifting its keyframes to start at frame 0 as for a single scene
+        shifted = 0
+        for frames, objects_to_annotate in zip(scene_frames, annotations):
+            with self.timer.phase("shift_keyframes"):
+                shift_keyframes(shifted - frames[0])
+                shifted = frames[0]
+                bpy.context.scene.frame_start = 0
+                bpy.context.scene.frame_end = len(frames)
+
+            with self.timer.phase("write_bop"):
+                self.write_scene(
+                    objects_to_annotate, 
+                    colors=data['colors'][frames[0]:frames[-1] + 1], 
+                    depths=data['depth'][frames[0]:frames[-1] + 1],
+                )
         
-        bproc.writer.write_bop(
-            output_dir=os.path.join(output_dir),
-            dataset=self.config_data.dataset_name,
-            target_objects= objects_to_annotate,
-            colors=data['colors'],
-            depths=data['depth'],
-            color_file_format="JPEG",
-            append_to_existing_output=True,
-            save_world2cam=True,
-            depth_scale=0.1, 
-            calc_mask_info_coco= self.use_metadata,
+        with self.timer.phase("reset"):
+            self.reset()
+        
+        self.timer.end_scene(scenes=len(scenes), images=next_frame, components=sum(len(element.pos) for scene in scenes for element in scene.comps),
+                             annotated=sum(len(objects) for objects in annotations))
 
-            )
+
+def shift_keyframes(offset: int):
+    # Move every keyframe in the blend file by offset frames
+    for action in bpy.data.actions:
+        for fcurve in action.fcurves:
+            for keyframe in fcurve.keyframe_points:
+                keyframe.co.x += offset
+                keyframe.handle_left.x += offset
+                keyframe.handle_right.x += offset
+            fcurve.update()
+
+
+class RenderCache:
+    """ Keeps up to `max_loaded` Render scenes in one Blender process, keyed by their config folder, and evicts the least recently used. """
+    
+    def __init__(self, max_loaded: int, use_metadata: bool, **render_options):
+        self.max_loaded = max_loaded
+        self.use_metadata = use_metadata
+        self.render_options = render_options
+        self.renders: OrderedDict[str, Render] = OrderedDict()
+        self.active: Render | None = None
         
-        # Reset keyframe and restart.
-        bproc.utility.reset_keyframes()
+    def get(self, folder_path: str) -> Render:
+        # Config folders are named after the config hash
+        key = get_folder_name(folder_path)
+        
+        if key in self.renders:
+            self.renders.move_to_end(key)
+            rend = self.renders[key]
+        else:
+            if len(self.renders) >= self.max_loaded:
+                evicted_key, evicted = self.renders.popitem(last=False)
+                print(f"Unloading {evicted_key}")
+                evicted.unload()
+                if evicted is self.active:
+                    self.active = None
+            
+            print(f"Loading {key}")
+            if self.active:
+                self.active.set_active(False)
+            rend = Render(config_data=load_config_from_folder(folder_path), use_metadata=self.use_metadata, **self.render_options)
+            self.renders[key] = rend
+            self.active = rend
         
-        # Reset location. 
-        for obj in self.get_all_comp_objs():
-            obj.set_location([1000,1000,100])
+        if rend is not self.active:
+            if self.active:
+                self.active.set_active(False)
+            rend.set_active(True)
+            self.active = rend
+            
+        return rend
+
+
+class CompletionWriter:
+    """ Saves rendered scenes and completes their leases in a background thread, while the next scene renders.
+
+        At most `max_pending` batches wait to be written, rendering blocks until the writer catches up.
+    """
+
+    def __init__(self, max_pending: int = 4):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = threading.BoundedSemaphore(max_pending)
+        self.futures = []
+
+    def submit(self, function, *args):
+        self.pending.acquire()
+        future = self.executor.submit(function, *args)
+        future.add_done_callback(lambda _: self.pending.release())
+        self.futures.append(future)
+
+        # Surface errors of finished writes in the render loop
+        for future in [future for future in self.futures if future.done()]:
+            self.futures.remove(future)
+            future.result()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for future in self.futures:
+            future.result()
+        self.futures = []
+
+
+def complete_scenes(scene_queue: SceneQueue, scenes: List[SceneData], lease_paths: List[str], complete_store: Optional[SceneStore] = None):
+    for scene, lease_path in zip(scenes, lease_paths):
+        # Save scene to complete folder or store (with new camera positions)
+        if complete_store:
+            complete_store.append(scene)
+        else:
+            save_scene_to_folder(scene, scene_queue.complete_dir)
+        
+        # Remove lease from tmp dir
+        scene_queue.complete(lease_path)
+
+
+def archive_scenes(archive: SceneStore, scenes: List[SceneData]):
+    for scene in scenes:
+        archive.append(scene)
+
+
+def render_scenes(rend: Render, scene_queue: SceneQueue, lease_paths: List[str], args, complete_store: Optional[SceneStore] = None, 
+                  scenes: Optional[List[SceneData]] = None, writer: Optional[CompletionWriter] = None):
+    # Load the scenes from the files, unless they were prefetched, and set aside the ones that fail to load
+    if scenes is None:
+        loaded_paths, scenes = [], []
+        for lease_path in lease_paths:
+            try:
+                scenes.append(load_scene_from_file(lease_path))
+                loaded_paths.append(lease_path)
+            except Exception as e:
+                scene_queue.fail(lease_path, e)
+        lease_paths = loaded_paths
+        if not scenes:
+            return
+
+    # Render the scenes
+    if len(scenes) == 1:
+        rend.run(scenes[0], 
+                 img_amount= int(args.img_amount), 
+                 random_background= args.random_bg, 
+                 random_camera_positions = args.random_cam,
+                 include_fallen=args.include_fallen)
+    else:
+        rend.run_batch(scenes, 
+                       img_amount= int(args.img_amount), 
+                       random_background= args.random_bg, 
+                       random_camera_positions = args.random_cam,
+                       include_fallen=args.include_fallen)
+    
+    if writer:
+        writer.submit(complete_scenes, scene_queue, scenes, lease_paths, complete_store)
+    else:
+        complete_scenes(scene_queue, scenes, lease_paths, complete_store)
+
+
+def claim_batch(scene_queue: SceneQueue, lease_path: str, batch_size: int) -> List[str]:
+    # Add already queued scenes to the claimed one, without waiting for new ones
+    lease_paths = [lease_path]
+    while len(lease_paths) < batch_size:
+        lease_path = scene_queue.try_claim()
+        if not lease_path:
+            break
+        lease_paths.append(lease_path)
+    return lease_paths
+
+
+def get_complete_store(folder_path: str, args) -> Optional[SceneStore]:
+    if not args.scene_store:
+        return None
+    return SceneStore(os.path.join(folder_path, "complete_store"))
+
+
+def finalize_output(args):
+    if args.sharded_output:
+        print(f"Merged {finalize_shards(output_dir)} images into the BOP chunks of {output_dir}")
+
+
+def get_timer(args) -> PhaseTimer:
+    return PhaseTimer("render", log_path=args.timing_log, profile_every=int(args.profile), profile_dir=args.profile_dir)
+
+
+def get_watchdog(args) -> MemoryWatchdog:
+    return MemoryWatchdog(max_scenes=int(args.max_scenes), max_rss_mb=float(args.max_rss), purge_orphans=args.purge_orphans, log_path=args.memory_log)
+
+
+def get_render_options(args) -> dict:
+    return dict(
+        texture_pool_size=int(args.texture_pool_size),
+        texture_max_resolution=int(args.texture_max_resolution),
+        max_instances=int(args.max_instances) if args.max_instances else None,
+        timer=get_timer(args),
+        sharded_output=args.sharded_output,
+        render_profile=args.render_profile,
+        min_visible_fraction=float(args.min_visible_fraction),
+        camera_planner=CameraPlanner(candidates_per_image=int(args.camera_candidates), min_visible_parts=int(args.min_visible_parts)) if args.camera_planner else None,
+    )
+
+
+def run_daemon(args):
+    # Serve the queues of every config folder from a single Blender process
+    cache = RenderCache(max_loaded=int(args.max_loaded), use_metadata=args.metadata, **get_render_options(args))
+    queues: dict[str, SceneQueue] = {}
+    stores: dict[str, Optional[SceneStore]] = {}
+    scenes_per_config = int(args.scenes_per_config)
+    idle_timeout = float(args.idle_timeout)
+    last_work = time.monotonic()
+    turn = 0
+    writer = CompletionWriter(int(args.write_queue)) if args.pipeline else None
+    watchdog = get_watchdog(args)
+    
+    try:
+        while not watchdog.should_recycle:
+            for folder in get_subdirectories(args.sim_path):
+                if folder not in queues:
+                    queues[folder] = SceneQueue(folder, lease_timeout=float(args.lease_timeout))
+                    stores[folder] = get_complete_store(folder, args)
+            
+            # Round robin over the configs, rendering a batch of scenes per config to limit scene switching
+            folders = sorted(queues)
+            start = turn % len(folders) if folders else 0
+            order = folders[start:] + folders[:start]
+            turn += 1
+            
+            rendered = 0
+            for folder in order:
+                scene_queue = queues[folder]
+                for _ in range(scenes_per_config):
+                    if watchdog.should_recycle:
+                        break
+                    lease_path = scene_queue.claim(timeout=0)
+                    if not lease_path:
+                        break
+                    lease_paths = claim_batch(scene_queue, lease_path, int(args.batch_size))
+                    print(f"{len(lease_paths)} scene(s) found in {get_folder_name(folder)}! Processing...")
+                    render_scenes(cache.get(folder), scene_queue, lease_paths, args, stores[folder], writer=writer)
+                    rendered += len(lease_paths)
+                    watchdog.after_render(len(lease_paths))
+            
+            if rendered:
+                last_work = time.monotonic()
+            elif idle_timeout > 0 and time.monotonic() - last_work > idle_timeout:
+                print(f"Timeout, no new scenes to render for {args.idle_timeout} seconds")
+                break
+            else:
+                time.sleep(1)
+                
+    except KeyboardInterrupt:
+        # Save the scenes that were already rendered before handing the other claimed scenes back
+        if writer:
+            writer.close()
+            writer = None
+        for scene_queue in queues.values():
+            scene_queue.release_all()
+        print("\n Render stopped by user")
+        
+    finally:
+        if writer:
+            writer.close()
+        for scene_queue in queues.values():
+            if watchdog.should_recycle:
+                scene_queue.release_all()
+            scene_queue.close()
+        # The shards are finalized by the last process, not by every recycled one
+        if not watchdog.should_recycle:
+            finalize_output(args)
+    
+    if watchdog.should_recycle:
+        watchdog.recycle()
+
+
+def run_handoff(args):
+    # Render the scenes sent by the simulator through the in-memory queue of bin_pipeline.py, until it sends None
+    handoff = connect_queue(args.handoff)
+    archive = SceneStore(args.archive) if args.archive else None
+    writer = CompletionWriter(int(args.write_queue)) if archive else None
+    renders: dict[str, Render] = {}
+    watchdog = get_watchdog(args)
+    rendered = 0
+    start = time.time()
+    
+    try:
+        while not watchdog.should_recycle:
+            scene_arrays = handoff.get()
+            if scene_arrays is None:
+                break
+            
+            # Add the scenes that are already waiting to the batch
+            batch = [scene_arrays]
+            while len(batch) < int(args.batch_size):
+                try:
+                    scene_arrays = handoff.get_nowait()
+                except queue.Empty:
+                    break
+                if scene_arrays is None:
+                    handoff.put(None)
+                    break
+                batch.append(scene_arrays)
+            scenes = [scene_from_arrays(scene_arrays) for scene_arrays in batch]
+            
+            # The simulator sends the path of its config with every scene
+            config_path = scenes[0].config_path
+            if config_path not in renders:
+                config = load_schema_from_file(file_path=config_path, data_class=ConfigData)
+                renders[config_path] = Render(config_data=config, use_metadata=args.metadata, **get_render_options(args))
+            rend = renders[config_path]
+            
+            if len(scenes) == 1:
+                rend.run(scenes[0], img_amount=int(args.img_amount), random_background=args.random_bg, 
+                         random_camera_positions=args.random_cam, include_fallen=args.include_fallen)
+            else:
+                rend.run_batch(scenes, img_amount=int(args.img_amount), random_background=args.random_bg, 
+                               random_camera_positions=args.random_cam, include_fallen=args.include_fallen)
+            rendered += len(scenes)
+            watchdog.after_render(len(scenes))
+            
+            # Archiving is optional, the scenes of a handoff are never written to a queue folder
+            if writer:
+                writer.submit(archive_scenes, archive, scenes)
+                
+    except KeyboardInterrupt:
+        print("\n Render stopped by user")
+        
+    finally:
+        if writer:
+            writer.close()
+        if not watchdog.should_recycle:
+            finalize_output(args)
+        
+    elapsed = time.time() - start
+    print(f"Rendered {rendered} handed off scenes in {elapsed:.1f} seconds")
+    
+    # The queue is served by bin_pipeline.py, the new process connects to it again
+    if watchdog.should_recycle:
+        watchdog.recycle()
 
 
 if __name__ == "__main__":
@@ -226,14 +764,46 @@ if __name__ == "__main__":
     parser.add_argument('--random-bg', action=argparse.BooleanOptionalAction, default=True, help="Add a random background to the skybox from the haven benchmark")
     parser.add_argument('--metadata', action=argparse.BooleanOptionalAction, default=True, help="Calculate masks, info and coco annotations")
     parser.add_argument('--include-fallen', action=argparse._StoreTrueAction, help="Flag to ignore fallen objects")
+    parser.add_argument('--idle-timeout', nargs='?', default=30, help="Seconds to wait for new scenes before stopping, 0 waits forever")
+    parser.add_argument('--lease-timeout', nargs='?', default=120, help="Seconds without a heartbeat before a claimed scene is handed back to the queue")
+    parser.add_argument('--batch-size', nargs='?', default=1, help="Amount of queued scenes rendered together in one render call")
+    parser.add_argument('--texture-pool-size', nargs='?', default=16, help="Maximum amount of random textures kept in memory")
+    parser.add_argument('--texture-max-resolution', nargs='?', default=1024, help="Random textures are downscaled to at most this many pixels per side")
+    parser.add_argument('--max-instances', nargs='?', default=None, help="Maximum amount of instances per component")
+    parser.add_argument('--scene-store', action=argparse.BooleanOptionalAction, default=False, help="Append completed scenes to a binary store in complete_store instead of writing one JSON file each")
+    parser.add_argument('--daemon', action=argparse.BooleanOptionalAction, default=False, help="Serve the queues of all config folders from one process")
+    parser.add_argument('--max-loaded', nargs='?', default=2, help="Maximum amount of configs kept loaded in daemon mode")
+    parser.add_argument('--scenes-per-config', nargs='?', default=20, help="Scenes rendered from one config before moving to the next in daemon mode")
+    parser.add_argument('--sharded-output', action=argparse.BooleanOptionalAction, default=False, help="Write every scene into its own shard folder, and merge the shards into BOP chunks when the render stops")
+    parser.add_argument('--pipeline', action=argparse.BooleanOptionalAction, default=True, help="Prefetch the next scenes and save finished scenes in background threads while rendering")
+    parser.add_argument('--prefetch', nargs='?', default=1, help="Maximum amount of batches claimed and loaded ahead of the render")
+    parser.add_argument('--write-queue', nargs='?', default=4, help="Maximum amount of rendered batches waiting to be saved")
+    parser.add_argument('--handoff', nargs='?', default=None, help="Render the scenes sent through the queue served at this socket, see bin_pipeline.py")
+    parser.add_argument('--archive', nargs='?', default=None, help="Append the handed off scenes to a scene store in this folder")
+    parser.add_argument('--render-profile', nargs='?', default=None, help="Render quality profile: draft, train or eval. Overrides the profile of the config, train if neither sets one")
+    parser.add_argument('--min-visible-fraction', nargs='?', default=0, help="Only annotate components with at least this fraction of their projected bounding box visible in some image")
+    parser.add_argument('--camera-planner', action=argparse.BooleanOptionalAction, default=False, help="Pick the camera poses that see the most parts from a batch of candidates, instead of sampling them blindly")
+    parser.add_argument('--camera-candidates', nargs='?', default=8, help="Candidate poses scored by the camera planner per image")
+    parser.add_argument('--min-visible-parts', nargs='?', default=1, help="The camera planner discards candidates that see fewer parts")
+    parser.add_argument('--max-scenes', nargs='?', default=0, help="Restart the render process after this many scenes to free leaked memory, 0 never restarts")
+    parser.add_argument('--max-rss', nargs='?', default=0, help="Restart the render process once it uses more than this many MB, 0 never restarts")
+    parser.add_argument('--purge-orphans', action=argparse.BooleanOptionalAction, default=True, help="Remove unused Blender datablocks after every render call")
+    parser.add_argument('--memory-log', nargs='?', default=None, help="Append the memory use and Blender datablock counts after every render call to this JSONL file")
+    parser.add_argument('--timing-log', nargs='?', default=None, help="Append the phase durations, object counts and peak memory of every render call to this JSONL file")
+    parser.add_argument('--profile', nargs='?', default=0, const=50, help="Run under cProfile and dump the statistics every N render calls, 50 if N is left out")
+    parser.add_argument('--profile-dir', nargs='?', default='profiles', help="Folder for the cProfile dumps")
 
     args = parser.parse_args()
 
-    simulation_path = args.sim_path
-    use_metadata = args.metadata
-    include_fallen = args.include_fallen
+    if args.handoff:
+        run_handoff(args)
+        exit()
+    
+    if args.daemon:
+        run_daemon(args)
+        exit()
     
-    folder_path = get_next_sim_folder(folder_path= simulation_path)
+    folder_path = get_next_sim_folder(folder_path= args.sim_path)
 
     if not folder_path:
         print("No available scenes to render")
@@ -241,50 +811,63 @@ if __name__ == "__main__":
     
     config = load_config_from_folder(folder_path)
     # Create an instance of the Renderer class
-    rend = Render(config_data=config, use_metadata= use_metadata)
+    rend = Render(config_data=config, use_metadata= args.metadata, **get_render_options(args))
 
-    complete_dir = folder_path + "/complete/"
-    queue_dir = folder_path + "/queue/"
-    tmp_dir = folder_path + "/tmp/"
+    scene_queue = SceneQueue(folder_path, lease_timeout=float(args.lease_timeout))
+    complete_store = get_complete_store(folder_path, args)
+    idle_timeout = float(args.idle_timeout) if float(args.idle_timeout) > 0 else None
+
+    # Claim and load the next batch while the current one renders, and save finished scenes in the background
+    prefetcher = None
+    writer = None
+    watchdog = get_watchdog(args)
+    if args.pipeline:
+        prefetcher = ScenePrefetcher(scene_queue, load_scene_from_file, batch_size=int(args.batch_size), idle_timeout=idle_timeout, depth=int(args.prefetch))
+        writer = CompletionWriter(int(args.write_queue))
 
-    i = 0
     try:
-        while i < 6:
-            files = os.listdir(queue_dir)
-            files.sort()
-
-            if not files:
-                print("No Scenes to render, waiting...")
-                i = i + 1
-                time.sleep(5)
+        while True:
+            if prefetcher:
+                batch = prefetcher.get()
+                lease_paths, scenes = batch if batch else (None, None)
             else:
-                print("Scene found! Processing...")
-                file = files[0]
-
-                # Move the file to the tmp directory
-                shutil.move(queue_dir + file, tmp_dir + file)
+                # Claim the next scene, waking up as soon as a new one is queued
+                lease_path = scene_queue.claim(timeout=idle_timeout)
+                lease_paths = claim_batch(scene_queue, lease_path, int(args.batch_size)) if lease_path else None
+                scenes = None
 
-                # Load the scene from the file
-                scene = load_schema_from_file(file_path= tmp_dir + file, data_class=SceneData)
+            if not lease_paths:
+                print(f"Timeout, no new scenes to render for {args.idle_timeout} seconds")
+                break
 
-                # Render the scene
-                rend.run(scene, 
-                         img_amount= int(args.img_amount), 
-                         random_background= args.random_bg, 
-                         random_camera_positions = args.random_cam,
-                         include_fallen=include_fallen)
-                
-                # Save scene to complete folder (with new camera positions)
-                save_schema_to_folder(scene, complete_dir)
-                
-                # Remove file from tmp dir
-                os.remove(path= tmp_dir + file)
-                
-                i = 0
-
-        print("Timeout, no new scenes to render for 30 seconds")
+            print(f"{len(lease_paths)} scene(s) found! Processing...")
+            render_scenes(rend, scene_queue, lease_paths, args, complete_store, scenes=scenes, writer=writer)
+            
+            if watchdog.after_render(len(lease_paths)):
+                break
 
     except KeyboardInterrupt:
+        # Hand the claimed scene back instead of waiting for the lease to expire
+        if prefetcher:
+            prefetcher.close()
+            prefetcher = None
+        if writer:
+            writer.close()
+            writer = None
+        scene_queue.release_all()
         print("\n Render stopped by user")
-        
 
+    finally:
+        # Closing the prefetcher hands its claimed scenes back to the queue
+        if prefetcher:
+            prefetcher.close()
+        if writer:
+            writer.close()
+        if watchdog.should_recycle:
+            scene_queue.release_all()
+        scene_queue.close()
+        if not watchdog.should_recycle:
+            finalize_output(args)
+    
+    if watchdog.should_recycle:
+        watchdog.recycle()
@@ -9,13 +9,23 @@ sys.path.append(myDir)
 
 from file_schema.scene import SceneData
 from file_schema.config import ConfigData
-from file_schema.schema_logic import load_schema_from_file, save_scene
+from file_schema.schema_logic import load_schema_from_file, save_scene, scene_to_arrays
+from file_schema.handoff import connect_queue
 from blenderproc.python.types.MeshObjectUtility import MeshObject
 from entities.component import Component
 from entities.bin import Bin
+from entities.pose_sampler import BatchPoseSampler
+from entities.phase_timer import PhaseTimer
+from entities.slot_layout import get_parked_component_location, get_parked_wall_offset, get_slot_offset, get_wall_locations
 import argparse
 import numpy as np
 import random
+import shutil
+import subprocess
+import time
+import json
+from itertools import zip_longest
+from typing import List, Optional
 
 # Global variables
 vhacd_path = 'resources/vhacd'
@@ -23,133 +33,435 @@ cache_path = vhacd_path + '/decomp_cache'
 
 class Walls:
     
-    def __init__(self):
-        self.planes = [
-            bproc.object.create_primitive('PLANE', scale=[20, 20, 1], rotation=[-1.570796, 0, 0]),
-            bproc.object.create_primitive('PLANE', scale=[20, 20, 1],  rotation=[1.570796, 0, 0]),
-            bproc.object.create_primitive('PLANE', scale=[20, 20, 1],  rotation=[0, -1.570796, 0]),
-            bproc.object.create_primitive('PLANE', scale=[20, 20, 1],  rotation=[0, 1.570796, 0])
+    def __init__(self, parked_offset = (0, -1000, 0)):
+        self.parked_offset = parked_offset
+        rotations = [
+            [-1.570796, 0, 0],
+            [1.570796, 0, 0],
+            [0, -1.570796, 0],
+            [0, 1.570796, 0],
         ]
-        self.set_home_pos()
         
-        for wall in self.planes:
-            wall.enable_rigidbody(active=False, collision_shape="COMPOUND")
-            wall.build_convex_decomposition_collision_shape(vhacd_path, cache_dir=cache_path)
+        # The walls are identical planes, so decompose one and duplicate it with its collision shape
+        wall = bproc.object.create_primitive('PLANE', scale=[20, 20, 1], rotation=rotations[0])
+        wall.enable_rigidbody(active=False, collision_shape="COMPOUND")
+        wall.build_convex_decomposition_collision_shape(vhacd_path, cache_dir=cache_path)
+        
+        self.planes = [wall]
+        for rotation in rotations[1:]:
+            plane = wall.duplicate()
+            plane.set_rotation_euler(rotation)
+            self.planes.append(plane)
+            
+        self.set_home_pos()
             
-    def set_pos(self, bin_shape):
-        self.planes[0].set_location([0, bin_shape[1]/2, 0])
-        self.planes[1].set_location([0, -bin_shape[1]/2, 0])
-        self.planes[2].set_location([bin_shape[0]/2,0 , 0])
-        self.planes[3].set_location([-bin_shape[0]/2, 0, 0])
+    def set_pos(self, bin_shape, offset = (0, 0, 0)):
+        for plane, location in zip(self.planes, get_wall_locations(bin_shape, offset)):
+            plane.set_location(location)
         
     def set_home_pos(self):
-        self.set_pos([-1000, -1000, 0])
+        # Out of reach of every bin slot, see entities/slot_layout.py
+        self.set_pos([0, 0, 0], offset=self.parked_offset)
+
+class SettlingEngine:
+    """ Settles dropped components with sleeping rigid bodies, early stopping and optional waves. 
+    
+        Resting bodies are put to sleep by Bullet, so they cost nothing until something hits them, and the
+        simulation stops at the first check where every object is at rest. With a wave size, the components 
+        are dropped a few at a time and every settled wave is frozen as kinematic, so each simulation only 
+        has a small number of active bodies.
+    """
+    
+    def __init__(self, wave_size: int = 0, min_simulation_time: float = 1.0, max_simulation_time: float = 2.0, check_object_interval: float = 0.25,
+                 sleep_linear_velocity: float = 0.01, sleep_angular_velocity: float = 0.05, substeps_per_frame: int = 30, solver_iters: int = 20):
+        self.wave_size = wave_size
+        self.min_simulation_time = min_simulation_time
+        self.max_simulation_time = max_simulation_time
+        self.check_object_interval = check_object_interval
+        self.sleep_linear_velocity = sleep_linear_velocity
+        self.sleep_angular_velocity = sleep_angular_velocity
+        self.substeps_per_frame = substeps_per_frame
+        self.solver_iters = solver_iters
+        
+    def get_waves(self, objs: List[MeshObject]) -> List[List[MeshObject]]:
+        if self.wave_size <= 0:
+            return [objs]
+        return [objs[i:i + self.wave_size] for i in range(0, len(objs), self.wave_size)]
+    
+    def enable_sleep(self, objs: List[MeshObject]):
+        for obj in objs:
+            rigid_body = obj.blender_obj.rigid_body
+            rigid_body.use_deactivation = True
+            rigid_body.use_start_deactivated = False
+            rigid_body.deactivate_linear_velocity = self.sleep_linear_velocity
+            rigid_body.deactivate_angular_velocity = self.sleep_angular_velocity
+            
+    def set_frozen(self, objs: List[MeshObject], frozen: bool):
+        # Kinematic bodies collide with the active ones, but are not moved by the solver
+        for obj in objs:
+            obj.blender_obj.rigid_body.kinematic = frozen
+    
+    def simulate(self, location_threshold: float):
+        bproc.object.simulate_physics_and_fix_final_poses(
+            min_simulation_time=self.min_simulation_time,
+            max_simulation_time=self.max_simulation_time,
+            check_object_interval=self.check_object_interval,
+            object_stopped_location_threshold=location_threshold,
+            object_stopped_rotation_threshold=0.05,
+            substeps_per_frame=self.substeps_per_frame,
+            solver_iters=self.solver_iters,
+        )
+
+
+class BinSlot:
+    """ One bin with its own walls and components, placed at an offset in the shared physics world. """
+    
+    def __init__(self, bin: Bin, components: List[Component], walls: Walls, offset: np.ndarray):
+        self.bin = bin
+        self.components = components
+        self.walls = walls
+        self.offset = offset
+        self.volume_frac = 0.0
+        
+        self.bin.obj.set_location(offset)
+                  
+    def update_volume_frac(self):
+        # Calculate volume diffrence between components and bin
+        x, y, z =  (self.bin.dimensions)
+        total_volume = sum([comp.volume * len(comp.obj_list) for comp in self.components])
+        box_volume = x * y * z
+        self.volume_frac = total_volume / box_volume
+        
+    def get_sample_region(self):
+        # Region above the bin where the components are dropped from
+        x, y, z =  (self.bin.dimensions)
+        low = np.array([ -x*0.35, -y*0.35, z * 1.1 ]) + self.offset
+        high = np.array([ x*0.35,  y*0.35,  z * 10 * self.volume_frac ]) + self.offset
+        return low, high
+                  
+    def sample_pose(self, obj: MeshObject):
+        low, high = self.get_sample_region()
+        obj.set_rotation_euler(bproc.sampler.uniformSO3())
+        obj.set_location(np.random.uniform(low, high))
+        
+    def set_walls(self):
+        self.walls.set_pos(self.bin.dimensions, offset=self.offset)
+        
+    def get_all_comp_objs(self): 
+        return [obj for comp in self.components for obj in comp.obj_list]
+    
+    def get_amount_of_components(self):
+        return sum([len(comp.obj_list) for comp in self.components])
+    
+    def to_scene(self, config_path: str) -> SceneData:
+        # Poses are stored relative to the bin slot, as if the bin was simulated on its own
+        comps = [ comp.to_element() for comp in self.components ]
+        bin = self.bin.to_element()
+        for element in comps + [bin]:
+            for pos in element.pos:
+                pos.location = (np.asarray(pos.location) - self.offset).tolist()
+        return SceneData(config_path= config_path, comps=comps, bin=bin, cameras= None)
+
 
 class Simulator:
-    def __init__(self, config_path: str, config_data: ConfigData  ):       
+    
+    def __init__(self, config_path: str, config_data: ConfigData, settling: Optional[SettlingEngine] = None, pose_sampler: Optional[BatchPoseSampler] = None, 
+                 max_instances: Optional[int] = None, timer: Optional[PhaseTimer] = None, bins_per_run: int = 1):       
         self.config_path = config_path   
-        self.components = [Component(comp_data) for comp_data in config_data.components]
+        self.components = [Component(comp_data, max_instances=max_instances) for comp_data in config_data.components]
         self.bins = [Bin(bin_data) for bin_data in config_data.bins]        
         
         self.bin = self.bins[0]
-        self.walls = Walls()
+        
+        # Use the fixed simulation schedule when no settling engine is given
+        self.settling = settling
+        self.settle_time = 0.0
+        
+        # Use bproc.object.sample_poses when no batch pose sampler is given
+        self.pose_sampler = pose_sampler
+        self.timer = timer or PhaseTimer("simulator")
         
         self.bin.load(build_convex=True, downsample_mesh=True)
         
         for entities in self.components:
             entities.load(build_convex=True, downsample_mesh= True)
-                  
-    def sample_pose(self, obj: MeshObject):
-        # Get dimensions of bin
-        x, y, z =  (self.bin.dimensions)
-
-        # Calculate volume diffrence between components and bin
-        total_volume = sum([comp.volume * len(comp.obj_list) for comp in self.components])
-        box_volume = x * y * z
-        volume_frac = total_volume / box_volume
-
-        obj.set_rotation_euler(bproc.sampler.uniformSO3())
-        obj.set_location(np.random.uniform(
-            [ -x*0.35, -y*0.35, z * 1.1 ], 
-            [ x*0.35,  y*0.35,  z * 10 * volume_frac  ]
-        ))
+        
+        # Every run simulates a scene in each slot, the extra slots share the meshes and collision shapes of the first one
+        self.parked_location = get_parked_component_location(bins_per_run)
+        parked_offset = get_parked_wall_offset(bins_per_run)
+        self.slots = [BinSlot(self.bin, self.components, Walls(parked_offset), offset=get_slot_offset(0))]
+        for index in range(1, bins_per_run):
+            self.slots.append(BinSlot(self.bin.duplicate(), [comp.duplicate() for comp in self.components], Walls(parked_offset), 
+                                      offset=get_slot_offset(index)))
+        self.active_slots = self.slots[:1]
         
     def get_all_comp_objs(self): 
-        return sum([comp.obj_list for comp in self.components], [])
+        return [obj for slot in self.active_slots for obj in slot.get_all_comp_objs()]
     
     def get_amount_of_components(self):
-        return sum([len(comp.obj_list) for comp in self.components])
+        return sum([slot.get_amount_of_components() for slot in self.active_slots])
     
     def to_scene(self):
-        comps = [ comp.to_element() for comp in self.components ]
-        bin = self.bin.to_element()         
-        return SceneData(config_path= self.config_path, comps=comps, bin=bin, cameras= None)
+        return self.active_slots[0].to_scene(self.config_path)
+    
+    def to_scenes(self) -> List[SceneData]:
+        # One scene per bin of the last run
+        return [slot.to_scene(self.config_path) for slot in self.active_slots]
         
     def run(self, amount_of_components, use_walls = False):
+        self.run_slots([amount_of_components], use_walls= use_walls)
+        
+    def run_slots(self, amounts_of_components: List[int], use_walls = False):
+        # Fill one bin per amount, and simulate them all together
+        self.timer.start_scene()
+        self.active_slots = self.slots[:len(amounts_of_components)]
+        
+        # Slots left over in a smaller last run put their components back into the pool and park their walls
+        for slot in self.slots[len(amounts_of_components):]:
+            for comp in slot.components:
+                comp.set_amount(0)
+            slot.walls.set_home_pos()
         
         # Add components to list
-        comp = random.choice(self.components)
-        comp.add_to_obj_list(max= amount_of_components)
+        for slot, amount_of_components in zip(self.active_slots, amounts_of_components):
+            comp = random.choice(slot.components)
+            with self.timer.phase("instances"):
+                comp.add_to_obj_list(max= amount_of_components)
         
-        # Set walls for sampling
-        self.walls.set_pos(self.bin.dimensions)
+        if self.settling:
+            self.settle(use_walls)
+        else:
+            self.simulate_fixed(use_walls)
         
-        # Sample the poses of all component objects above the ground without any collisions in-between
+        # Only the physics passes count as settling, pose sampling is timed on its own
+        self.settle_time = self.timer.phases.get("physics_walls", 0.0) + self.timer.phases.get("physics", 0.0)
+        
+        self.timer.end_scene(components=self.get_amount_of_components(), bins=len(self.active_slots), adaptive=self.settling is not None, walls=use_walls, settle_time=self.settle_time)
+        
+    def sample_poses(self, slot: BinSlot, objs: List[MeshObject]):
+        slot.update_volume_frac()
+        
+        if self.pose_sampler:
+            # Objects that are not sampled keep their pose and must not be hit
+            sampled = set(objs)
+            fixed_objs = [obj for obj in slot.get_all_comp_objs() if obj not in sampled and np.linalg.norm(obj.get_location() - slot.offset) < 100]
+            low, high = slot.get_sample_region()
+            x, y, _ = slot.bin.dimensions
+            self.pose_sampler.sample(objs, np.minimum(low, high), np.maximum(low, high), fixed_objs, slot.bin.obj, slot.walls.planes, 
+                                     wall_extent=(x / 2, y / 2), wall_center=(slot.offset[0], slot.offset[1]))
+            return
+        
+        # Sample the poses of the objects above the ground without any collisions in-between
         bproc.object.sample_poses(
-            objects_to_sample= self.get_all_comp_objs(),
-            sample_pose_func=self.sample_pose,
-            objects_to_check_collisions=self.get_all_comp_objs() + [self.bin.obj] + self.walls.planes,
+            objects_to_sample= objs,
+            sample_pose_func=slot.sample_pose,
+            objects_to_check_collisions=slot.get_all_comp_objs() + [slot.bin.obj] + slot.walls.planes,
             max_tries= 1000,
             mode_on_failure='last_pose',
         )
         
+    def set_walls(self, active: bool):
+        for slot in self.active_slots:
+            if active:
+                slot.set_walls()
+            else:
+                slot.walls.set_home_pos()
+        
+    def simulate_fixed(self, use_walls = False):
+        
+        # Set walls for sampling
+        self.set_walls(True)
+        
+        # Sample the poses of all component objects above the ground without any collisions in-between
+        with self.timer.phase("sampling"):
+            for slot in self.active_slots:
+                self.sample_poses(slot, slot.get_all_comp_objs())
+        
         # Remove walls if not used in sim
         if use_walls: 
             # Run the physics simulation without
-            bproc.object.simulate_physics(
-                min_simulation_time=1,
-                max_simulation_time=2,
+            with self.timer.phase("physics_walls"):
+                bproc.object.simulate_physics(
+                    min_simulation_time=1,
+                    max_simulation_time=2,
+                    check_object_interval= 0.5,
+                    object_stopped_location_threshold = 0.01,
+                    object_stopped_rotation_threshold = 0.05,
+                    substeps_per_frame = 30,
+                    solver_iters= 20,
+                ) 
+        
+        self.set_walls(False)
+            
+        # Run the physics simulation without
+        with self.timer.phase("physics"):
+            bproc.object.simulate_physics_and_fix_final_poses(
+                min_simulation_time=0.99,
+                max_simulation_time=1.5,
                 check_object_interval= 0.5,
-                object_stopped_location_threshold = 0.01,
+                object_stopped_location_threshold = 0.001,
                 object_stopped_rotation_threshold = 0.05,
                 substeps_per_frame = 30,
                 solver_iters= 20,
-            ) 
+            )  
         
-        self.walls.set_home_pos()
+    def settle(self, use_walls = False):
+        objs = self.get_all_comp_objs()
+        # The n-th waves of all bins are dropped together
+        waves = list(zip_longest(*[self.settling.get_waves(slot.get_all_comp_objs()) for slot in self.active_slots], fillvalue=[]))
+        self.settling.enable_sleep(objs)
+        
+        # Park and freeze the components of later waves, so they do not fall during earlier waves
+        for obj in objs:
+            obj.set_location(self.parked_location)
+        self.settling.set_frozen(objs, True)
+        
+        for slot_waves in waves:
+            wave = [obj for slot_wave in slot_waves for obj in slot_wave]
+            self.settling.set_frozen(wave, False)
+            self.set_walls(True)
+            with self.timer.phase("sampling"):
+                for slot, slot_wave in zip(self.active_slots, slot_waves):
+                    if slot_wave:
+                        self.sample_poses(slot, slot_wave)
             
-        # Run the physics simulation without
-        bproc.object.simulate_physics_and_fix_final_poses(
-            min_simulation_time=0.99,
-            max_simulation_time=1.5,
-            check_object_interval= 0.5,
-            object_stopped_location_threshold = 0.001,
-            object_stopped_rotation_threshold = 0.05,
-            substeps_per_frame = 30,
-            solver_iters= 20,
-        )  
+            # Settle against the walls first, the final poses are kept so the second pass starts close to rest
+            if use_walls:
+                with self.timer.phase("physics_walls"):
+                    self.settling.simulate(location_threshold=0.01)
+            
+            self.set_walls(False)
+            with self.timer.phase("physics"):
+                self.settling.simulate(location_threshold=0.001)
+            self.settling.set_frozen(wave, True)
+            
+        self.settling.set_frozen(objs, False)
+        
+def run_workers(args, comp_amount_list, workers: int):
+    # Launch independent simulator processes, each with its own seed and share of the component amounts
+    blenderproc = shutil.which("blenderproc")
+    if blenderproc is None:
+        raise FileNotFoundError("The blenderproc command is needed to launch simulator workers")
+    
+    seeds = np.random.SeedSequence(args.seed).spawn(workers)
+    processes = []
+    
+    for index, seed in enumerate(seeds):
+        # Deal the sorted amounts out round robin, so every worker gets a similar load
+        comp_amounts = comp_amount_list[index::workers]
+        if len(comp_amounts) == 0:
+            continue
         
+        command = [
+            blenderproc, "run", os.path.abspath(__file__),
+            "--config", str(args.config),
+            "--comp-amounts", ",".join(str(amount) for amount in comp_amounts),
+            "--seed", str(seed.generate_state(1)[0]),
+            "--workers", "1",
+            "--walls" if args.walls else "--no-walls",
+            "--adaptive-settling" if args.adaptive_settling else "--no-adaptive-settling",
+            "--wave-size", str(args.wave_size),
+            "--batch-sampler" if args.batch_sampler else "--no-batch-sampler",
+            "--bins-per-run", str(args.bins_per_run),
+        ]
+        if args.max_instances:
+            command += ["--max-instances", str(args.max_instances)]
+        if args.settle_log:
+            command += ["--settle-log", str(args.settle_log)]
+        if args.timing_log:
+            command += ["--timing-log", str(args.timing_log)]
+        if args.handoff:
+            command += ["--handoff", str(args.handoff)]
+        command += ["--profile", str(args.profile), "--profile-dir", str(args.profile_dir)]
+        processes.append((subprocess.Popen(command), len(comp_amounts)))
+    
+    start = time.time()
+    scenes = 0
+    for process, amount in processes:
+        if process.wait() == 0:
+            scenes += amount
+        else:
+            print(f"Simulator worker {process.pid} failed with exit code {process.returncode}")
+    
+    elapsed = time.time() - start
+    print(f"Simulated {scenes} scenes with {len(processes)} workers in {elapsed:.1f} seconds ({scenes / elapsed:.2f} scenes per second)")
+
+
 parser = argparse.ArgumentParser()
 parser.add_argument('--comp-amount-min', nargs='?', default='1', help='The min amount of components that should be in the bin')
 parser.add_argument('--comp-amount-max', nargs='?', default='15', help='The max amount of components that can be in the bin')
 parser.add_argument('--runs',  nargs='?', default='5', help='The number of simulations you would like to do')
 parser.add_argument('--walls', action=argparse.BooleanOptionalAction, default=False, help="Simulate twice, first with walls, afterwards without")
 parser.add_argument('--config',     nargs='?', default='config.json', help='filepath to configuration JSON file')
+parser.add_argument('--workers', nargs='?', default='1', help='The number of simulator processes to run in parallel')
+parser.add_argument('--seed', nargs='?', default=None, type=int, help='Seed for the random number generators, workers get seeds derived from it')
+parser.add_argument('--adaptive-settling', action=argparse.BooleanOptionalAction, default=False, help="Let resting components sleep and stop the simulation as soon as everything is at rest")
+parser.add_argument('--wave-size', nargs='?', default='0', help='Drop the components in waves of this size with adaptive settling, 0 drops all at once')
+parser.add_argument('--settle-log', nargs='?', default=None, help='Append the settle time of every scene to this JSONL file')
+parser.add_argument('--batch-sampler', action=argparse.BooleanOptionalAction, default=True, help="Sample candidate poses in batches with a bounding sphere pre-check instead of one BVH check per candidate")
+parser.add_argument('--max-instances', nargs='?', default=None, help='Maximum amount of instances per component')
+parser.add_argument('--comp-amounts', nargs='?', default=None, help='Comma separated amounts of components, one per run. Overrides the min, max and runs arguments')
+parser.add_argument('--timing-log', nargs='?', default=None, help='Append the phase durations, component count and peak memory of every scene to this JSONL file')
+parser.add_argument('--profile', nargs='?', default=0, const=50, help='Run under cProfile and dump the statistics every N scenes, 50 if N is left out')
+parser.add_argument('--profile-dir', nargs='?', default='profiles', help='Folder for the cProfile dumps')
+parser.add_argument('--bins-per-run', nargs='?', default='1', help='Simulate this many bins side by side in one physics world, each giving its own scene')
+parser.add_argument('--handoff', nargs='?', default=None, help='Send the scenes to the render through the queue served at this socket instead of the queue folder, see bin_pipeline.py')
 args = parser.parse_args()
 
 config_file = str(args.config)
 
+np.random.seed(np.random.SeedSequence(args.seed).generate_state(1)[0])
+random.seed(int(np.random.randint(2**31)))
+
+if args.comp_amounts:
+    comp_amount_list = np.array([int(amount) for amount in args.comp_amounts.split(",")])
+else:
+    low = int(args.comp_amount_min)
+    high= int(args.comp_amount_max)
+    size= int(args.runs)
+
+    comp_amount_list = np.random.randint(low=low, high=high, size=size)
+    comp_amount_list.sort()
+
+workers = int(args.workers)
+if workers > 1:
+    run_workers(args, comp_amount_list, workers)
+    sys.exit()
+
 config_data = load_schema_from_file(file_path=config_file, data_class= ConfigData)
-simulator = Simulator(config_path= config_file, config_data= config_data)
+settling = SettlingEngine(wave_size=int(args.wave_size)) if args.adaptive_settling else None
+pose_sampler = BatchPoseSampler() if args.batch_sampler else None
+simulator = Simulator(config_path= config_file, config_data= config_data, settling= settling, pose_sampler= pose_sampler,
+                      max_instances= int(args.max_instances) if args.max_instances else None,
+                      timer= PhaseTimer("simulator", log_path=args.timing_log, profile_every=int(args.profile), profile_dir=args.profile_dir),
+                      bins_per_run= int(args.bins_per_run))
 
-low = int(args.comp_amount_min)
-high= int(args.comp_amount_max)
-size= int(args.runs)
+handoff = connect_queue(args.handoff) if args.handoff else None
 
-comp_amount_list = np.random.randint(low=low, high=high, size=size)
-comp_amount_list.sort()
+start = time.time()
+bins_per_run = int(args.bins_per_run)
+for index in range(0, len(comp_amount_list), bins_per_run):
+    # The amounts are sorted, so the bins of a run hold similar amounts of components
+    simulator.run_slots(comp_amount_list[index:index + bins_per_run].tolist(), use_walls= args.walls)
+    for scene in simulator.to_scenes():
+        if handoff:
+            # Blocks while the render is behind
+            handoff.put(scene_to_arrays(scene))
+        else:
+            save_scene(scene= scene, config= config_data, folder_path= "./resources/simulations")
+    
+    print(f"Settled {simulator.get_amount_of_components()} components in {len(simulator.active_slots)} bin(s) in {simulator.settle_time:.2f} seconds")
+    if args.settle_log:
+        with open(args.settle_log, 'a') as f:
+            record = {
+                "components": simulator.get_amount_of_components(),
+                "bins": len(simulator.active_slots),
+                "adaptive": bool(args.adaptive_settling),
+                "wave_size": int(args.wave_size),
+                "walls": bool(args.walls),
+                "settle_time": simulator.settle_time,
+            }
+            f.write(json.dumps(record) + "\n")
 
-for comp_amount in comp_amount_list:
-    simulator.run(comp_amount, use_walls= args.walls)
-    scene = simulator.to_scene()
-    save_scene(scene= scene, config= config_data, folder_path= "./resources/simulations")
\ No newline at end of file
+elapsed = time.time() - start
+print(f"Simulated {len(comp_amount_list)} scenes in {elapsed:.1f} seconds ({len(comp_amount_list) / elapsed:.2f} scenes per second)")
\ No newline at end of file
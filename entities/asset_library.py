@@ -0,0 +1,76 @@
+import os
+import hashlib
+import json
+import bpy
+import blenderproc.api.loader as loader
+from blenderproc.python.types.MeshObjectUtility import MeshObject
+from entities.entities_logic import get_content_hash
+
+# Bump when the import pipeline below changes, so existing libraries are rebuilt
+LIBRARY_VERSION = 1
+
+
+def get_library_path(input_file: str, cache_folder: str, options: dict) -> str:
+    # Keyed by the content of the source mesh and by everything that changes how it is prepared
+    options_key = json.dumps({"version": LIBRARY_VERSION, **options}, sort_keys=True)
+    options_hash = hashlib.sha1(options_key.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_folder, f"{get_content_hash(input_file)}_{options_hash}.blend")
+
+
+def prepare_mesh(input_file: str) -> MeshObject:
+    # Import the mesh with a UV-mapping and vertex color materials
+    obj = loader.load_obj(input_file)[0]
+
+    # Check if mesh has a valid UV-mapping
+    if not obj.has_uv_mapping:
+        # Add UV-mapping
+        obj.add_uv_mapping("smart")
+
+    # Use vertex color for texturing
+    for mat in obj.get_materials():
+        mat.map_vertex_color()
+
+    return obj
+
+
+def append_from_library(library_path: str) -> MeshObject:
+    # Append instead of link, the object and its materials are changed after loading
+    with bpy.data.libraries.load(library_path, link=False) as (data_from, data_to):
+        data_to.objects = data_from.objects
+
+    blender_obj = data_to.objects[0]
+    bpy.context.collection.objects.link(blender_obj)
+
+    # The library is written with fake users, drop them so replaced materials and unused meshes can be purged
+    for datablock in [blender_obj, blender_obj.data] + list(blender_obj.data.materials):
+        if datablock is not None:
+            datablock.use_fake_user = False
+    return MeshObject(blender_obj)
+
+
+def write_to_library(obj: MeshObject, library_path: str):
+    # Write the object with its mesh, materials and images into a .blend file of its own, the fake user
+    # keeps the object in the file although no scene uses it, and is dropped again in append_from_library
+    os.makedirs(os.path.dirname(library_path), exist_ok=True)
+    part_path = f"{library_path}.{os.getpid()}.part.blend"
+    bpy.data.libraries.write(part_path, {obj.blender_obj}, path_remap='ABSOLUTE', fake_user=True)
+    os.replace(part_path, library_path)
+
+
+def load_prepared_mesh(input_file: str, cache_folder: str = "./resources/blend_cache/", use_library: bool = True) -> MeshObject:
+    """ Load a mesh prepared for rendering and simulation, from the asset library if it was prepared before.
+
+        Object transforms, physics and custom properties are left to the caller, so the library only
+        holds the expensive part of loading: the import, the UV unwrap and the vertex color materials.
+    """
+    if not use_library:
+        return prepare_mesh(input_file)
+
+    library_path = get_library_path(input_file, cache_folder, {"uv_mapping": "smart", "vertex_color": True})
+    if os.path.isfile(library_path):
+        return append_from_library(library_path)
+
+    print("Adding " + input_file + " to the asset library")
+    obj = prepare_mesh(input_file)
+    write_to_library(obj, library_path)
+    return obj
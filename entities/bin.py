@@ -1,8 +1,10 @@
+import copy
+from typing import Optional
 import numpy as np
-import blenderproc.api.loader as loader
 from file_schema.config import BinData
 from file_schema.scene import ElementData, PositionData
 from entities.entities_logic import get_downsampled_mesh
+from entities.asset_library import load_prepared_mesh
 
 class Bin():
     def __init__(self, data: BinData):
@@ -17,29 +19,20 @@ class Bin():
         if self.mm_2_m:
                 self.dimensions =np.multiply(self.dimensions, 1 / 1000)
                 
-    def load(self, build_convex: bool, downsample_mesh = False, ): 
+    def load(self, build_convex: bool, downsample_mesh = False, use_library = True): 
         
         # Downsample mesh if necesarry
         if downsample_mesh:
             self.path = get_downsampled_mesh(self.path)
         
-        # Load mesh
-        self.obj = loader.load_obj(self.path)[0]
+        # Load mesh with UV-mapping and vertex color materials, from the asset library when possible
+        self.obj = load_prepared_mesh(self.path, use_library=use_library)
         
         # Enable physics and construct decomposition.
         if build_convex:
             self.obj.enable_rigidbody(active= False, collision_shape="COMPOUND", friction = 100.0, linear_damping = 0.99, angular_damping = 0.99)
             self.obj.build_convex_decomposition_collision_shape(vhacd_path='resources/vhacd', cache_dir='resources/vhacd/decomp_cache/')
         
-        # Check if mesh has a valid UV-mapping
-        if not self.obj.has_uv_mapping:
-            # Add UV-mapping
-            self.obj.add_uv_mapping("smart")
-
-        # Use vertex color for texturing
-        for mat in self.obj.get_materials():
-            mat.map_vertex_color()
-
         # Scale down
         if self.mm_2_m:
             self.obj.set_scale([1/1000, 1/1000, 1/1000])
@@ -51,6 +44,12 @@ class Bin():
         self.obj.set_cp("category_id", self.obj_id)
         
 
+    def duplicate(self) -> "Bin":
+        # Another bin sharing the mesh and collision shape, to simulate several bins in the same physics world
+        bin = copy.copy(self)
+        bin.obj = self.obj.duplicate(linked=True)
+        return bin
+
     def to_element(self):
         name = self.name
         pos = PositionData(
@@ -60,7 +59,7 @@ class Bin():
         
         return ElementData(name= name, pos=[pos])
     
-    def from_element(self, position: PositionData):
-        self.obj.set_location(position.location)
-        self.obj.set_rotation_euler(position.orientation)
+    def from_element(self, position: PositionData, frame: Optional[int] = None):
+        self.obj.set_location(position.location, frame=frame)
+        self.obj.set_rotation_euler(position.orientation, frame=frame)
         
\ No newline at end of file
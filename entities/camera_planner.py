@@ -0,0 +1,195 @@
+from typing import List, Tuple
+import numpy as np
+from file_schema.config import Positioning
+
+# Blender cameras look along -Z with Y up, OpenCV cameras along +Z with Y down
+GL_TO_CV = np.diag([1.0, -1.0, -1.0])
+
+
+def euler_to_matrix(euler: List[float]) -> np.ndarray:
+    # Blender XYZ euler angles, applied in the order X, Y, Z
+    cx, cy, cz = np.cos(euler)
+    sx, sy, sz = np.sin(euler)
+    rx = np.array([[1, 0, 0], [0, cx, -sx], [0, sx, cx]])
+    ry = np.array([[cy, 0, sy], [0, 1, 0], [-sy, 0, cy]])
+    rz = np.array([[cz, -sz, 0], [sz, cz, 0], [0, 0, 1]])
+    return rz @ ry @ rx
+
+
+def look_at(locations: np.ndarray, targets: np.ndarray, inplane_rot: np.ndarray) -> np.ndarray:
+    """ Build camera poses looking from the locations at the targets, like `bproc.camera.rotation_from_forward_vec` for many poses at once.
+
+        Returns:
+            np.ndarray: Camera poses in the Blender convention, shape (P, 4, 4).
+    """
+    back = locations - targets
+    back /= np.linalg.norm(back, axis=1, keepdims=True)
+
+    # Keep the image up axis towards world Z, or world Y when looking straight down
+    up = np.tile([0.0, 0.0, 1.0], (len(back), 1))
+    up[np.abs(back[:, 2]) > 0.999] = [0.0, 1.0, 0.0]
+    y = up - np.sum(up * back, axis=1, keepdims=True) * back
+    y /= np.linalg.norm(y, axis=1, keepdims=True)
+    x = np.cross(y, back)
+
+    # Rotate around the viewing axis
+    cos, sin = np.cos(inplane_rot)[:, None], np.sin(inplane_rot)[:, None]
+    x, y = cos * x + sin * y, cos * y - sin * x
+
+    cam2worlds = np.tile(np.eye(4), (len(back), 1, 1))
+    cam2worlds[:, :3, 0] = x
+    cam2worlds[:, :3, 1] = y
+    cam2worlds[:, :3, 2] = back
+    cam2worlds[:, :3, 3] = locations
+    return cam2worlds
+
+
+class CameraPlanner:
+    """ Chooses the camera poses of a scene from an oversampled batch of candidates.
+
+        Every candidate is scored from the part poses alone: parts are approximated by spheres, projected
+        into all candidates at once, checked for a line of sight through the bin opening, and drawn into a
+        coarse depth grid per candidate to estimate how much of each part is hidden by the parts in front of it.
+        Candidates that see fewer than `min_visible_parts` parts are discarded, and the remaining ones are picked
+        greedily by their visible parts, counting parts no picked view sees yet twice, while keeping the views at
+        least `min_view_angle` degrees apart.
+    """
+
+    def __init__(self, candidates_per_image: int = 8, min_visible_parts: int = 1, min_visible_fraction: float = 0.25,
+                 min_view_angle: float = 10.0, grid_size: Tuple[int, int] = (32, 24)):
+        self.candidates_per_image = candidates_per_image
+        self.min_visible_parts = min_visible_parts
+        self.min_visible_fraction = min_visible_fraction
+        self.min_view_angle = min_view_angle
+        self.grid_size = grid_size
+
+        # Totals over all planned scenes
+        self.candidates = 0
+        self.accepted = 0
+        self.selected = 0
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.accepted / self.candidates if self.candidates else 0.0
+
+    def sample_candidates(self, positioning: Positioning, bin_dimensions: List[float], amount: int) -> np.ndarray:
+        # The same distributions as Render.calculate_camera_pose, sampled in one go
+        x, y, z = bin_dimensions
+        pois = np.random.uniform([-0.3 * x, -0.3 * y, -0.1 * z], [0.3 * x, 0.3 * y, 0.3 * z], (amount, 3))
+
+        # Uniform in the volume of the shell between the elevation angles
+        radius = np.cbrt(np.random.uniform(positioning.radius_min ** 3, positioning.radius_max ** 3, amount))
+        sin_elevation = np.random.uniform(np.sin(np.deg2rad(positioning.angle_min)), np.sin(np.deg2rad(positioning.angle_max)), amount)
+        azimuth = np.random.uniform(-np.pi, np.pi, amount)
+        cos_elevation = np.sqrt(1 - sin_elevation ** 2)
+        directions = np.stack([cos_elevation * np.cos(azimuth), cos_elevation * np.sin(azimuth), sin_elevation], axis=1)
+        locations = np.array([0, 0, positioning.height]) + radius[:, None] * directions
+
+        return look_at(locations, pois, np.random.uniform(-0.7854, 0.7854, amount))
+
+    def score(self, cam2worlds: np.ndarray, centers: np.ndarray, radii: np.ndarray, bin2world: np.ndarray, bin_dimensions: List[float],
+              K: List[List[float]], width: int, height: int) -> np.ndarray:
+        """ Estimate which parts are visible from which candidate poses.
+
+            Args:
+                cam2worlds (np.ndarray): Candidate camera poses, shape (P, 4, 4).
+                centers (np.ndarray): World space part origins, shape (N, 3).
+                radii (np.ndarray): Radius of every part around its origin, shape (N,).
+                bin2world (np.ndarray): Pose of the bin, shape (4, 4).
+                bin_dimensions (List[float]): Size of the bin, with its floor at the origin of the bin.
+                K (List[List[float]]): Camera intrinsics.
+                width (int): Image width in pixels.
+                height (int): Image height in pixels.
+
+            Returns:
+                np.ndarray: Boolean array (P, N) of the visible parts of every candidate.
+        """
+        K = np.asarray(K, dtype=float)
+        rotations = cam2worlds[:, :3, :3]
+        origins = cam2worlds[:, :3, 3]
+
+        # Part centers in OpenCV camera coordinates, shape (P, N, 3)
+        points = np.einsum('pji,pnj->pni', rotations, centers[None, :, :] - origins[:, None, :]) @ GL_TO_CV
+        depth = points[..., 2]
+        in_front = depth > radii[None, :]
+        safe_depth = np.where(in_front, depth, 1.0)
+        u = K[0, 0] * points[..., 0] / safe_depth + K[0, 2]
+        v = K[1, 1] * points[..., 1] / safe_depth + K[1, 2]
+        pixel_radii = K[0, 0] * radii[None, :] / safe_depth
+        in_view = in_front & (u >= 0) & (u <= width) & (v >= 0) & (v <= height)
+
+        # Parts inside the bin are only seen through its opening, find where the line of sight crosses the rim
+        world2bin = np.linalg.inv(bin2world)
+        bin_centers = centers @ world2bin[:3, :3].T + world2bin[:3, 3]
+        bin_origins = origins @ world2bin[:3, :3].T + world2bin[:3, 3]
+        half_x, half_y, rim = bin_dimensions[0] / 2, bin_dimensions[1] / 2, bin_dimensions[2]
+        inside_bin = (np.abs(bin_centers[:, 0]) < half_x) & (np.abs(bin_centers[:, 1]) < half_y) & (bin_centers[:, 2] < rim)
+        rise = bin_origins[:, None, 2] - bin_centers[None, :, 2]
+        t = (rim - bin_centers[None, :, 2]) / np.where(rise > 0, rise, 1.0)
+        crossing = bin_centers[None, :, :2] + t[..., None] * (bin_origins[:, None, :2] - bin_centers[None, :, :2])
+        through_opening = (rise > 0) & (np.abs(crossing[..., 0]) <= half_x) & (np.abs(crossing[..., 1]) <= half_y)
+        candidates = in_view & (~inside_bin[None, :] | through_opening)
+
+        # Coarse depth grid per pose, every part covers the cells within its projected radius and at least the closest cell
+        grid_width, grid_height = self.grid_size
+        us = (np.arange(grid_width) + 0.5) * width / grid_width
+        vs = (np.arange(grid_height) + 0.5) * height / grid_height
+        cells = np.stack(np.meshgrid(us, vs), axis=-1).reshape(-1, 2)
+        cell_radius = np.hypot(width / grid_width, height / grid_height) / 2
+
+        visible = np.zeros_like(candidates)
+        for pose in range(len(cam2worlds)):
+            indices = np.flatnonzero(candidates[pose])
+            if len(indices) == 0:
+                continue
+            distances = np.hypot(cells[None, :, 0] - u[pose, indices, None], cells[None, :, 1] - v[pose, indices, None])
+            covered = distances <= np.maximum(pixel_radii[pose, indices], cell_radius)[:, None]
+            cell_depth = np.where(covered, depth[pose, indices, None], np.inf)
+            front = np.argmin(cell_depth, axis=0)
+            front_cells = np.bincount(front[covered.any(axis=0)], minlength=len(indices))
+            fractions = front_cells / np.maximum(covered.sum(axis=1), 1)
+            visible[pose, indices] = fractions >= self.min_visible_fraction
+
+        return visible
+
+    def select(self, cam2worlds: np.ndarray, visible: np.ndarray, amount: int) -> List[int]:
+        counts = visible.sum(axis=1)
+        accepted = counts >= self.min_visible_parts
+        forward = -cam2worlds[:, :3, 2]
+        min_cos = np.cos(np.deg2rad(self.min_view_angle))
+
+        selected: List[int] = []
+        seen = np.zeros(visible.shape[1], dtype=bool)
+        available = accepted.copy()
+        while len(selected) < amount and available.any():
+            gain = np.where(available, counts + (visible & ~seen).sum(axis=1), -1)
+            best = int(np.argmax(gain))
+            selected.append(best)
+            seen |= visible[best]
+            # Skip the candidates looking in almost the same direction
+            available &= forward @ forward[best] < min_cos
+            available[best] = False
+
+        self.candidates += len(cam2worlds)
+        self.accepted += int(accepted.sum())
+        self.selected += len(selected)
+        return selected
+
+    def plan(self, positioning: Positioning, bin2world: np.ndarray, bin_dimensions: List[float], centers: np.ndarray, radii: np.ndarray,
+             K: List[List[float]], width: int, height: int, amount: int) -> List[np.ndarray]:
+        """ Pick up to `amount` camera poses for a scene.
+
+            Fewer poses are returned when not enough candidates see `min_visible_parts` parts. If none does,
+            the candidate seeing the most parts is returned, so every scene still gets an image.
+
+            Returns:
+                List[np.ndarray]: The chosen camera poses in the Blender convention.
+        """
+        cam2worlds = self.sample_candidates(positioning, bin_dimensions, amount * self.candidates_per_image)
+        visible = self.score(cam2worlds, centers, radii, bin2world, bin_dimensions, K, width, height)
+        selected = self.select(cam2worlds, visible, amount)
+        if not selected:
+            selected = [int(np.argmax(visible.sum(axis=1)))]
+
+        print(f"Picked {len(selected)} of {len(cam2worlds)} camera candidates, {self.acceptance_rate:.0%} of all candidates accepted so far")
+        return [cam2worlds[index] for index in selected]
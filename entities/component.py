@@ -1,37 +1,30 @@
-from typing import List
-import blenderproc.api.loader as loader
+import copy
+from typing import List, Optional
 from blenderproc.python.types.MeshObjectUtility import MeshObject
 import numpy as np
 from file_schema.config import ComponentData
 from file_schema.scene import ElementData, PositionData
 from entities.entities_logic import get_downsampled_mesh
+from entities.asset_library import load_prepared_mesh
 
 class Component():
-    def __init__(self, data: ComponentData):
+    def __init__(self, data: ComponentData, max_instances: Optional[int] = None):
         self.name = data.name
+        self.max_instances = max_instances
         self.obj_id = data.obj_id
         self.path = data.path
         self.random_color = data.random_color
         self.random_texture = data.random_texture
         self.mm_2_m = data.mm_2_m
       
-    def load(self, build_convex: bool, downsample_mesh = False): 
+    def load(self, build_convex: bool, downsample_mesh = False, use_library = True): 
         
         # Downsample mesh if necesarry
         if downsample_mesh:
             self.path = get_downsampled_mesh(self.path)
         
-        # Load mesh
-        self.obj = loader.load_obj(self.path)[0]
-
-        # Check if mesh has a valid UV-mapping
-        if not self.obj.has_uv_mapping:
-            # Add UV-mapping
-            self.obj.add_uv_mapping("smart")
-
-        # Use vertex color for texturing
-        for mat in self.obj.get_materials():
-            mat.map_vertex_color()
+        # Load mesh with UV-mapping and vertex color materials, from the asset library when possible
+        self.obj = load_prepared_mesh(self.path, use_library=use_library)
 
         # Enable convex decomposition
         if build_convex:
@@ -44,20 +37,67 @@ class Component():
         
         # Get component name and save output path.
         self.volume = self.obj.get_bound_box_volume()
+        # Distance from the origin to the farthest bounding box corner, for cheap visibility estimates
+        self.radius = float(np.max(np.linalg.norm(self.obj.get_bound_box(local_coords=True) * self.obj.get_scale(), axis=1)))
         self.material = self.obj.get_materials()
         self.obj.set_shading_mode('auto')
         self.obj.set_cp("category_id", self.obj_id)
         
-        # Create new list of duplicate objects
+        # Create new list of duplicate objects, unused duplicates are kept in a pool
         self.obj_list: list[MeshObject] = [self.obj]
+        self.inactive_list: list[MeshObject] = []
 
-    # Dublicate obj until max is reached
+    # Activate pooled instances or create linked duplicates until max is reached
     def add_to_obj_list(self, max: int):
         
-        difference = max - len(self.obj_list)
-        if difference > 0:
-            for i in range(difference):
-                self.obj_list.append(self.obj.duplicate())
+        if self.max_instances is not None and max > self.max_instances:
+            print(f"Limiting {self.name} to {self.max_instances} instances instead of {max}")
+            max = self.max_instances
+        
+        while len(self.obj_list) < max:
+            if self.inactive_list:
+                obj = self.inactive_list.pop()
+            else:
+                # Linked duplicates share the mesh data of the original
+                obj = self.obj.duplicate(linked=True)
+            self.set_instance_active(obj, True)
+            self.obj_list.append(obj)
+            
+    # Keep exactly amount instances active, and move the rest into the pool
+    def set_amount(self, amount: int):
+        self.add_to_obj_list(max= amount)
+        
+        while len(self.obj_list) > amount:
+            obj = self.obj_list.pop()
+            self.set_instance_active(obj, False)
+            self.inactive_list.append(obj)
+            
+    def duplicate(self) -> "Component":
+        # Another set of instances of the loaded mesh, to fill a second bin in the same physics world
+        component = copy.copy(self)
+        component.obj = self.obj.duplicate(linked=True)
+        component.obj_list = [component.obj]
+        component.inactive_list = []
+        return component
+            
+    def get_instances(self) -> List[MeshObject]:
+        return self.obj_list + self.inactive_list
+            
+    @staticmethod
+    def set_instance_active(obj: MeshObject, active: bool):
+        # Inactive instances are hidden from rendering and raycasts, and only collide within their own collision collection
+        obj.hide(not active)
+        for blender_obj in [obj.blender_obj] + list(obj.blender_obj.children):
+            if blender_obj.rigid_body:
+                blender_obj.rigid_body.kinematic = not active
+                blender_obj.rigid_body.collision_collections = [i == (0 if active else 19) for i in range(20)]
+    
+    @staticmethod
+    def keyframe_hidden(obj: MeshObject, hidden: bool, frame: int):
+        obj.blender_obj.hide_render = hidden
+        obj.blender_obj.hide_viewport = hidden
+        obj.blender_obj.keyframe_insert(data_path="hide_render", frame=frame)
+        obj.blender_obj.keyframe_insert(data_path="hide_viewport", frame=frame)
             
                         
     def to_element(self):
@@ -67,17 +107,26 @@ class Component():
         return ElementData(name=name, pos=pos)
     
     # Set positions for objects, use the available ones if they exist, otherwise create a new ones. 
-    def from_element(self, positions: List[PositionData], include_fallen = True):
+    # With a frame the positions and visibility are keyframed, so several scenes can be set in one animation.
+    def from_element(self, positions: List[PositionData], include_fallen = True, frame: Optional[int] = None):
         
         # Option to not include fallen objects
         if not include_fallen:
             positions = list(filter(lambda p: p.location[2] > 0, positions))
         
-        # Add objects to obj list to match the amount of positions. 
-        self.add_to_obj_list(max= len(positions))
+        # Match the amount of active objects to the amount of positions. 
+        if frame is None:
+            self.set_amount(len(positions))
+        else:
+            self.add_to_obj_list(max= len(positions))
         
         # Set position of all new objects. 
         for (position, obj) in zip(positions, self.obj_list):
-            obj.set_location(position.location)
-            obj.set_rotation_euler(position.orientation)
+            obj.set_location(position.location, frame=frame)
+            obj.set_rotation_euler(position.orientation, frame=frame)
+        
+        # Hide the objects not used in this frame
+        if frame is not None:
+            for i, obj in enumerate(self.obj_list):
+                self.keyframe_hidden(obj, i >= len(positions), frame)
             
\ No newline at end of file
@@ -1,38 +1,118 @@
 import os
+import json
+import fcntl
 import hashlib
 import open3d as o3d
-import numpy as np
+
+MANIFEST_NAME = "manifest.json"
+
+
+# Hash the raw file, so vertex positions and every other detail of the mesh are part of the key
+def hash_file(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def load_manifest(cache_folder: str) -> dict:
+    manifest_path = os.path.join(cache_folder, MANIFEST_NAME)
+    if not os.path.isfile(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        # A broken manifest only costs a cold start
+        return {}
+
+
+def save_manifest(cache_folder: str, entry_key: str, entry: dict):
+    # Merge with entries other processes wrote in the meantime, and replace the file atomically
+    os.makedirs(cache_folder, exist_ok=True)
+    manifest_path = os.path.join(cache_folder, MANIFEST_NAME)
+
+    # Parallel workers would otherwise drop each other's entries between the read and the replace
+    with open(f"{manifest_path}.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        manifest = load_manifest(cache_folder)
+        manifest[entry_key] = entry
+
+        part_path = f"{manifest_path}.{os.getpid()}.part"
+        with open(part_path, 'w') as f:
+            json.dump(manifest, f, indent=4, sort_keys=True)
+        os.replace(part_path, manifest_path)
+
+
+def get_manifest_entry(input_file: str, cache_folder: str = "./resources/obj_cache/"):
+    # The manifest maps a file, identified by its size and modification time, to its content hash,
+    # its triangle count and the downsampled files per triangle budget
+    entry_key = os.path.abspath(input_file)
+    stat = os.stat(input_file)
+    entry = load_manifest(cache_folder).get(entry_key)
+    changed = False
+
+    if entry is None or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+        # Unknown or touched file, the content may still be unchanged
+        print("Hashing mesh of " + input_file)
+        content_hash = hash_file(input_file)
+        if entry is None or entry["hash"] != content_hash:
+            entry = {"hash": content_hash, "triangles": None, "artifacts": {}}
+        entry["size"] = stat.st_size
+        entry["mtime_ns"] = stat.st_mtime_ns
+        changed = True
+
+    return entry_key, entry, changed
+
+
+# Content hash of a mesh file, only read from disk when the file changed since it was last hashed
+def get_content_hash(input_file: str, cache_folder: str = "./resources/obj_cache/") -> str:
+    entry_key, entry, changed = get_manifest_entry(input_file, cache_folder)
+    if changed:
+        save_manifest(cache_folder, entry_key, entry)
+    return entry["hash"]
+
 
 # Reduce vertecies in mesh for simulation
 def get_downsampled_mesh( input_file: str, num_of_triangles: int = 8196, cache_folder: str = "./resources/obj_cache/", ):
 
+    entry_key, entry, changed = get_manifest_entry(input_file, cache_folder)
+
+    budget = str(num_of_triangles)
+    cached_file = entry["artifacts"].get(budget)
+
+    # Warm start, nothing but the manifest and the small cached file are touched
+    if entry["triangles"] is not None and entry["triangles"] < num_of_triangles:
+        if changed:
+            save_manifest(cache_folder, entry_key, entry)
+        return input_file
+    if cached_file is not None and os.path.isfile(cached_file):
+        if changed:
+            save_manifest(cache_folder, entry_key, entry)
+        return cached_file
+
     # Load in mesh
     mesh_in = o3d.io.read_triangle_mesh(input_file)
-    
+    entry["triangles"] = len(mesh_in.triangles)
+
     # Check if optimization is needed
-    if len(mesh_in.triangles) < num_of_triangles:
+    if entry["triangles"] < num_of_triangles:
+        save_manifest(cache_folder, entry_key, entry)
         return input_file
-    
-    # Get unique name of mesh, based on triangles
-    print("Hashing mesh of " + input_file)
-    mesh_data = np.asarray(mesh_in.triangles)
-    mesh_data = mesh_data * num_of_triangles
-    hash_digits = hashlib.sha1(mesh_data.tobytes()).hexdigest()
-    hash_digits = hash_digits[:6]
-    
-    # Check if optimized obj already exist
-    cached_file = cache_folder + hash_digits + ".ply"
-    if os.path.isfile(cached_file):
-        return cached_file
-    
-    # Create the folder if it does not exist
-    if not os.path.exists(cache_folder):
-        os.makedirs(cache_folder)
-    
-    print("Downsampling mesh of " + input_file)
-    # Generate simpler mesh and save file
-    mesh_out = mesh_in.simplify_quadric_decimation(target_number_of_triangles= num_of_triangles)
-    o3d.io.write_triangle_mesh(cached_file, mesh_out)
-    return cached_file
 
+    # Same content at another path shares the downsampled file
+    cached_file = os.path.join(cache_folder, f"{entry['hash']}_{budget}.ply")
+    if not os.path.isfile(cached_file):
+        os.makedirs(cache_folder, exist_ok=True)
+
+        print("Downsampling mesh of " + input_file)
+        # Generate simpler mesh and save file
+        mesh_out = mesh_in.simplify_quadric_decimation(target_number_of_triangles= num_of_triangles)
+        part_file = f"{cached_file}.{os.getpid()}.part.ply"
+        o3d.io.write_triangle_mesh(part_file, mesh_out)
+        os.replace(part_file, cached_file)
 
+    entry["artifacts"][budget] = cached_file
+    save_manifest(cache_folder, entry_key, entry)
+    return cached_file
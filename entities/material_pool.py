@@ -0,0 +1,112 @@
+from collections import OrderedDict
+from typing import List
+import bpy
+import blenderproc as bproc
+from blenderproc.python.types.MaterialUtility import Material
+import numpy as np
+
+
+class TexturePool:
+    """ Size bounded LRU pool of downscaled texture images.
+
+        A new texture is read from disk with probability `reload_probability` once the pool is full,
+        otherwise a random pooled texture is reused.
+    """
+
+    def __init__(self, texture_paths: List[str], max_textures: int = 16, max_resolution: int = 1024, reload_probability: float = 0.1, preload: bool = True):
+        self.texture_paths = texture_paths
+        self.max_textures = max_textures
+        self.max_resolution = max_resolution
+        self.reload_probability = reload_probability
+        self.images: OrderedDict[str, bpy.types.Image] = OrderedDict()
+
+        if preload and texture_paths:
+            amount = min(max_textures, len(texture_paths))
+            for path in np.random.choice(texture_paths, amount, replace=False):
+                self.get(str(path))
+
+    def load(self, path: str) -> bpy.types.Image:
+        image = bpy.data.images.load(filepath=path)
+
+        # Downscale large textures, the image is kept in memory for as long as it is pooled
+        width, height = image.size
+        if max(width, height) > self.max_resolution:
+            scale = self.max_resolution / max(width, height)
+            image.scale(max(1, int(width * scale)), max(1, int(height * scale)))
+
+        # Pooled images must survive purging orphans while no material uses them
+        image.use_fake_user = True
+        return image
+
+    def get(self, path: str) -> bpy.types.Image:
+        if path in self.images:
+            self.images.move_to_end(path)
+            return self.images[path]
+
+        self.images[path] = self.load(path)
+        self.evict()
+        return self.images[path]
+
+    def clear(self):
+        for image in self.images.values():
+            bpy.data.images.remove(image)
+        self.images.clear()
+
+    def random_image(self) -> bpy.types.Image:
+        if len(self.images) >= self.max_textures and np.random.uniform() > self.reload_probability:
+            path = np.random.choice(list(self.images))
+        else:
+            path = np.random.choice(self.texture_paths)
+        return self.get(str(path))
+
+    def evict(self):
+        # Remove the least recently used images, but never the newest one or images still used by a material.
+        # The fake user of a pooled image is counted as a user
+        for path in list(self.images)[:-1]:
+            if len(self.images) <= self.max_textures:
+                break
+
+            image = self.images[path]
+            if image.users <= 1:
+                del self.images[path]
+                bpy.data.images.remove(image)
+
+
+class MaterialPool:
+    """ One reusable random material per entity, only its image and parameters change between scenes. """
+
+    def __init__(self, texture_pool: TexturePool):
+        self.texture_pool = texture_pool
+        self.materials: dict[str, Material] = {}
+
+    def get(self, name: str, random_texture: bool) -> Material:
+        material = self.materials.get(name)
+        if material is None:
+            material = bproc.material.create(f'RandomMat_{name}')
+            material.blender_obj.use_fake_user = True
+            self.materials[name] = material
+
+        if random_texture:
+            # Swap the image of the existing texture node instead of adding a new node
+            image = self.texture_pool.random_image()
+            texture_nodes = material.get_nodes_with_type("TexImage")
+            if texture_nodes:
+                texture_nodes[0].image = image
+            else:
+                material.set_principled_shader_value("Base Color", image)
+
+        return material
+
+    def clear(self):
+        for material in self.materials.values():
+            bpy.data.materials.remove(material.blender_obj)
+        self.materials.clear()
+        self.texture_pool.clear()
+
+    @staticmethod
+    def assign(obj, material: Material):
+        # Replace materials and unwrap UVs only the first time an object gets the pooled material
+        if material.blender_obj in obj.blender_obj.data.materials[:]:
+            return
+        obj.replace_materials(material)
+        obj.add_uv_mapping("smart")
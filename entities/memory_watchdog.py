@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import time
+import resource
+from typing import Dict, Optional
+import bpy
+
+# Datablock types that grow with the amount of rendered scenes when something leaks
+DATABLOCK_TYPES = ["objects", "meshes", "materials", "node_groups", "images", "textures", "worlds", "lights", "actions"]
+
+# Counts the re-executions of a worker, so the log shows which process generation wrote a record
+GENERATION_ENV = "BLENDERBIN_GENERATION"
+
+
+def get_rss_mb() -> float:
+    # The current resident memory, ru_maxrss only knows the peak
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def get_datablock_counts() -> Dict[str, int]:
+    return {name: len(getattr(bpy.data, name)) for name in DATABLOCK_TYPES}
+
+
+class MemoryWatchdog:
+    """ Watches the memory of a long running render and decides when the process should start over.
+
+        After every render call the orphaned datablocks, like replaced background images and emptied actions,
+        are purged and the resident memory and datablock counts are recorded. Once `max_scenes` scenes were
+        rendered or the memory exceeds `max_rss_mb`, `should_recycle` turns true and the render loop can hand
+        back its scenes and call `recycle`, which replaces the process with a fresh Blender running the same command.
+    """
+
+    def __init__(self, max_scenes: int = 0, max_rss_mb: float = 0.0, purge_orphans: bool = True, log_path: Optional[str] = None):
+        self.max_scenes = max_scenes
+        self.max_rss_mb = max_rss_mb
+        self.purge_orphans = purge_orphans
+        self.log_path = log_path
+        self.generation = int(os.environ.get(GENERATION_ENV, 0))
+        self.scenes = 0
+        self.rss_mb = get_rss_mb()
+        self.should_recycle = False
+
+    def after_render(self, scenes: int = 1) -> bool:
+        """ Purge orphans and check the limits after a render call of `scenes` scenes.
+
+            Returns:
+                bool: True when the process should be recycled.
+        """
+        self.scenes += scenes
+
+        purged = 0
+        if self.purge_orphans:
+            # Purging is recursive, so data only used by other orphans goes as well
+            purged = bpy.data.orphans_purge(do_local_ids=True, do_linked_ids=True, do_recursive=True) or 0
+
+        self.rss_mb = get_rss_mb()
+        if self.log_path:
+            record = {
+                "pid": os.getpid(),
+                "generation": self.generation,
+                "scenes": self.scenes,
+                "time": time.time(),
+                "rss_mb": self.rss_mb,
+                "purged": purged,
+                "datablocks": get_datablock_counts(),
+            }
+            with open(self.log_path, 'a') as f:
+                f.write(json.dumps(record) + "\n")
+
+        self.should_recycle = (self.max_scenes > 0 and self.scenes >= self.max_scenes) or (self.max_rss_mb > 0 and self.rss_mb >= self.max_rss_mb)
+        return self.should_recycle
+
+    def recycle(self):
+        """ Replace this process with a new Blender running the same command line, keeping the process id. """
+        print(f"Recycling the render after {self.scenes} scenes at {self.rss_mb:.0f} MB (generation {self.generation})")
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        # The command line Blender was started with, blenderproc rewrites sys.argv for the script
+        with open("/proc/self/cmdline", 'rb') as f:
+            argv = [arg.decode() for arg in f.read().split(b"\0") if arg]
+        os.environ[GENERATION_ENV] = str(self.generation + 1)
+        os.execv(bpy.app.binary_path, argv)
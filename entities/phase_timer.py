@@ -0,0 +1,78 @@
+import os
+import json
+import time
+import cProfile
+import resource
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class PhaseTimer:
+    """ Measures the duration of the phases of a scene and writes one JSONL record per scene.
+
+        With `profile_every` set, the scenes also run under cProfile and the statistics are dumped
+        to `profile_dir` every `profile_every` scenes, to be read with pstats or snakeviz.
+    """
+
+    def __init__(self, name: str, log_path: Optional[str] = None, profile_every: int = 0, profile_dir: str = "profiles"):
+        self.name = name
+        self.log_path = log_path
+        self.profile_every = profile_every
+        self.profile_dir = profile_dir
+        self.profiler: Optional[cProfile.Profile] = None
+        self.phases: Dict[str, float] = {}
+        self.scenes = 0
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            # Phases entered several times per scene add up
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def start_scene(self):
+        self.phases = {}
+        self.start = time.perf_counter()
+        if self.profile_every > 0 and self.profiler is None:
+            self.profiler = cProfile.Profile()
+        if self.profiler:
+            self.profiler.enable()
+
+    def end_scene(self, **fields) -> dict:
+        """ Finish the scene, and write its record with the given fields added. """
+        if self.profiler:
+            self.profiler.disable()
+
+        self.scenes += 1
+        record = {
+            "process": self.name,
+            "pid": os.getpid(),
+            "scene": self.scenes,
+            "time": time.time(),
+            "total": time.perf_counter() - self.start,
+            "phases": self.phases,
+            # ru_maxrss is in kilobytes on Linux
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            **fields,
+        }
+
+        if self.log_path:
+            with open(self.log_path, 'a') as f:
+                f.write(json.dumps(record) + "\n")
+
+        if self.profiler and self.scenes % self.profile_every == 0:
+            self.dump_profile()
+
+        return record
+
+    def dump_profile(self):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        profile_path = os.path.join(self.profile_dir, f"{self.name}_{os.getpid()}_{self.scenes:06d}.prof")
+        self.profiler.dump_stats(profile_path)
+        print(f"Saved profile of the last {self.profile_every} scenes to {profile_path}")
+
+        # Every dump covers only the scenes since the previous one
+        self.profiler = cProfile.Profile()
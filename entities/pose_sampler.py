@@ -0,0 +1,188 @@
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+import bpy
+import numpy as np
+from blenderproc.python.types.MeshObjectUtility import MeshObject
+from blenderproc.python.utility.CollisionUtility import CollisionUtility
+
+
+def random_euler_rotations(amount: int) -> np.ndarray:
+    """ Sample uniformly distributed rotations as XYZ euler angles.
+
+        Args:
+            amount (int): The amount of rotations.
+
+        Returns:
+            np.ndarray: Euler angles of shape (amount, 3).
+    """
+    # Normalized gaussian quaternions are uniform over SO3
+    q = np.random.normal(size=(amount, 4))
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    w, x, y, z = q.T
+
+    # Rotation matrix entries needed for the XYZ euler decomposition (R = Rz @ Ry @ Rx)
+    r00 = 1 - 2 * (y * y + z * z)
+    r10 = 2 * (x * y + w * z)
+    r20 = 2 * (x * z - w * y)
+    r21 = 2 * (y * z + w * x)
+    r22 = 1 - 2 * (x * x + y * y)
+
+    return np.stack([
+        np.arctan2(r21, r22),
+        np.arcsin(np.clip(-r20, -1, 1)),
+        np.arctan2(r10, r00),
+    ], axis=1)
+
+
+def get_bounding_radius(obj: MeshObject) -> float:
+    # Radius of the sphere around the object origin that contains the object for any rotation
+    corners = np.asarray(obj.get_bound_box(local_coords=True)) * np.asarray(obj.get_scale())
+    return float(np.linalg.norm(corners, axis=1).max())
+
+
+class SpatialHash:
+    """ Uniform grid of bounding spheres for finding the placed objects near a candidate position.
+
+        The centers and radii are kept in arrays that grow by doubling, so they can be indexed with the
+        neighbor indices directly. Only the first `count` rows are in use.
+    """
+
+    def __init__(self, cell_size: float, capacity: int = 64):
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int, int], List[int]] = defaultdict(list)
+        self.centers = np.empty((capacity, 3))
+        self.radii = np.empty(capacity)
+        self.count = 0
+
+    def cell(self, position: np.ndarray) -> Tuple[int, int, int]:
+        return tuple(np.floor(position / self.cell_size).astype(int))
+
+    def add(self, center: np.ndarray, radius: float) -> int:
+        if self.count == len(self.radii):
+            self.centers = np.concatenate([self.centers, np.empty_like(self.centers)])
+            self.radii = np.concatenate([self.radii, np.empty_like(self.radii)])
+
+        index = self.count
+        self.centers[index] = center
+        self.radii[index] = radius
+        self.count += 1
+        self.cells[self.cell(center)].append(index)
+        return index
+
+    def neighbors(self, positions: np.ndarray) -> np.ndarray:
+        """ Indices of the spheres in the cells around any of the positions. """
+        cells = {self.cell(position) for position in positions}
+        indices = set()
+        for i, j, k in cells:
+            for di in (-1, 0, 1):
+                for dj in (-1, 0, 1):
+                    for dk in (-1, 0, 1):
+                        indices.update(self.cells.get((i + di, j + dj, k + dk), []))
+        return np.fromiter(indices, dtype=int, count=len(indices))
+
+
+class BatchPoseSampler:
+    """ Places objects without collisions by drawing candidate poses in batches.
+
+        Candidates are first tested against the bounding spheres of the already placed objects, found through
+        a spatial hash, and against the bin and walls analytically. A candidate that passes these tests is placed
+        without further checks, otherwise only the candidates closest to being free get the exact BVH check
+        against the objects they may touch.
+    """
+
+    def __init__(self, batch_size: int = 64, max_tries: int = 1000, exact_checks_per_batch: int = 4):
+        self.batch_size = batch_size
+        self.max_tries = max_tries
+        self.exact_checks_per_batch = exact_checks_per_batch
+
+    def sample(self, objs: List[MeshObject], low: np.ndarray, high: np.ndarray, fixed_objs: List[MeshObject], bin_obj: MeshObject,
+               walls: List[MeshObject], wall_extent: Optional[Tuple[float, float]] = None, wall_center: Tuple[float, float] = (0.0, 0.0)) -> int:
+        """ Sample collision free poses for the objects.
+
+            Args:
+                objs (List[MeshObject]): Objects to place.
+                low (np.ndarray): Lower corner of the region for the object origins.
+                high (np.ndarray): Upper corner of the region for the object origins.
+                fixed_objs (List[MeshObject]): Already placed objects that must not be hit.
+                bin_obj (MeshObject): The bin.
+                walls (List[MeshObject]): Wall planes around the bin.
+                wall_extent (Tuple[float, float] | None): Half the distance between opposite walls in x and y.
+                wall_center (Tuple[float, float]): The point in x and y halfway between the walls.
+
+            Returns:
+                int: The amount of objects placed without collisions, the others keep their last tried pose.
+        """
+        radii = {obj: get_bounding_radius(obj) for obj in objs + fixed_objs}
+        max_radius = max(radii.values(), default=0.01)
+        grid = SpatialHash(cell_size=2 * max_radius, capacity=max(len(objs) + len(fixed_objs), 1))
+        placed: List[MeshObject] = []
+
+        for obj in fixed_objs:
+            grid.add(obj.get_location(), radii[obj])
+            placed.append(obj)
+
+        bin_top = np.asarray(bin_obj.get_bound_box())[:, 2].max()
+        bvh_cache = {}
+        placed_free = 0
+
+        for obj in objs:
+            radius = radii[obj]
+            success = False
+            tries = 0
+
+            while tries < self.max_tries and not success:
+                amount = min(self.batch_size, self.max_tries - tries)
+                tries += amount
+                locations = np.random.uniform(low, high, size=(amount, 3))
+                rotations = random_euler_rotations(amount)
+
+                # Overlap with placed parts, measured as the largest sphere penetration per candidate
+                neighbors = grid.neighbors(locations)
+                if len(neighbors):
+                    centers = grid.centers[neighbors]
+                    distances = np.linalg.norm(locations[:, None, :] - centers[None, :, :], axis=2)
+                    overlaps = grid.radii[neighbors][None, :] + radius - distances
+                    penetration = np.maximum(overlaps.max(axis=1), 0)
+                else:
+                    overlaps = np.zeros((amount, 0))
+                    penetration = np.zeros(amount)
+
+                # Candidates whose sphere stays above the bin and between the walls need no exact check against them
+                clear_of_bin = locations[:, 2] - radius > bin_top
+                clear_of_walls = np.ones(amount, dtype=bool)
+                if wall_extent is not None:
+                    clear_of_walls = ((np.abs(locations[:, 0] - wall_center[0]) + radius < wall_extent[0]) & 
+                                      (np.abs(locations[:, 1] - wall_center[1]) + radius < wall_extent[1]))
+
+                free = (penetration == 0) & clear_of_bin & clear_of_walls
+                if free.any():
+                    index = int(np.flatnonzero(free)[0])
+                    self.set_pose(obj, locations[index], rotations[index])
+                    success = True
+                    break
+
+                # Exact check for the least overlapping candidates, only against the objects they may touch
+                for index in np.argsort(penetration)[:self.exact_checks_per_batch]:
+                    self.set_pose(obj, locations[index], rotations[index])
+                    candidates = [placed[i] for i in neighbors[overlaps[index] > 0]] if len(neighbors) else []
+                    if not clear_of_bin[index]:
+                        candidates.append(bin_obj)
+                    if not clear_of_walls[index]:
+                        candidates += walls
+
+                    bvh_cache.pop(obj.get_name(), None)
+                    if CollisionUtility.check_intersections(obj, bvh_cache, candidates, []):
+                        success = True
+                        break
+
+            grid.add(obj.get_location(), radius)
+            placed.append(obj)
+            placed_free += int(success)
+
+        return placed_free
+
+    @staticmethod
+    def set_pose(obj: MeshObject, location: np.ndarray, rotation: np.ndarray):
+        obj.set_location(location)
+        obj.set_rotation_euler(rotation)
+        bpy.context.view_layer.update()
@@ -0,0 +1,67 @@
+import blenderproc as bproc
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from file_schema.config import CameraData
+
+
+@dataclass(frozen=True)
+class RenderProfile():
+    name: str
+    max_samples: int
+    # Adaptive sampling stops a pixel below this noise level, 0 renders all samples
+    noise_threshold: float
+    denoiser: Optional[str]
+    diffuse_bounces: int
+    glossy_bounces: int
+    transmission_bounces: int
+    transparent_bounces: int
+    max_bounces: int
+    # Scales the image size and the camera intrinsics, the field of view stays the same
+    resolution_scale: float
+
+
+RENDER_PROFILES = {
+    # Fast previews of a config
+    "draft": RenderProfile("draft", max_samples=16, noise_threshold=0.05, denoiser="INTEL", diffuse_bounces=1, glossy_bounces=0,
+                           transmission_bounces=0, transparent_bounces=4, max_bounces=2, resolution_scale=0.5),
+    # The settings the render always used, samples capped at 50 on top of the blenderproc defaults
+    "train": RenderProfile("train", max_samples=50, noise_threshold=0.01, denoiser="INTEL", diffuse_bounces=3, glossy_bounces=0,
+                           transmission_bounces=0, transparent_bounces=8, max_bounces=3, resolution_scale=1.0),
+    # Validation and test sets
+    "eval": RenderProfile("eval", max_samples=256, noise_threshold=0.005, denoiser="INTEL", diffuse_bounces=4, glossy_bounces=4,
+                          transmission_bounces=4, transparent_bounces=8, max_bounces=8, resolution_scale=1.0),
+    # Ground truth of scripts/benchmark_render.py, every sample and no denoiser
+    "reference": RenderProfile("reference", max_samples=1024, noise_threshold=0.0, denoiser=None, diffuse_bounces=8, glossy_bounces=8,
+                               transmission_bounces=8, transparent_bounces=16, max_bounces=16, resolution_scale=1.0),
+}
+
+DEFAULT_PROFILE = "train"
+
+
+def get_render_profile(name: Optional[str]) -> RenderProfile:
+    """ Look up a render profile by name, the train profile if no name is given. """
+    name = name or DEFAULT_PROFILE
+    if name not in RENDER_PROFILES:
+        raise ValueError(f"Unknown render profile {name}, choose one of {', '.join(RENDER_PROFILES)}")
+    return RENDER_PROFILES[name]
+
+
+def get_scaled_intrinsics(camera: CameraData, resolution_scale: float) -> Tuple[List[List[float]], int, int]:
+    # Scale the focal lengths and the principal point with the image
+    K = [
+        [camera.fx * resolution_scale, 0, camera.cx * resolution_scale],
+        [0, camera.fy * resolution_scale, camera.cy * resolution_scale],
+        [0, 0, 1]
+    ]
+    return K, round(camera.width * resolution_scale), round(camera.height * resolution_scale)
+
+
+def apply_render_profile(profile: RenderProfile):
+    # The renderer settings are global to the Blender scene, apply them again whenever another profile was used
+    bproc.renderer.set_max_amount_of_samples(profile.max_samples)
+    bproc.renderer.set_noise_threshold(profile.noise_threshold)
+    bproc.renderer.set_denoiser(profile.denoiser)
+    bproc.renderer.set_light_bounces(diffuse_bounces=profile.diffuse_bounces, glossy_bounces=profile.glossy_bounces,
+                                     max_bounces=profile.max_bounces, transmission_bounces=profile.transmission_bounces,
+                                     transparent_max_bounces=profile.transparent_bounces)
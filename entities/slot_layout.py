@@ -0,0 +1,45 @@
+from typing import List
+import numpy as np
+
+# The wall planes are 40 meters wide, bins further apart never touch the walls of another bin
+SLOT_SPACING = 50.0
+WALL_SIZE = 40.0
+
+# Half extents of the four upright wall planes, the first two face along y and the others along x
+WALL_HALF_EXTENTS = np.array([
+    [WALL_SIZE / 2, 0.0, WALL_SIZE / 2],
+    [WALL_SIZE / 2, 0.0, WALL_SIZE / 2],
+    [0.0, WALL_SIZE / 2, WALL_SIZE / 2],
+    [0.0, WALL_SIZE / 2, WALL_SIZE / 2],
+])
+
+
+def get_slot_offset(index: int) -> np.ndarray:
+    # The bins of a run are placed in a row along x
+    return np.array([index * SLOT_SPACING, 0.0, 0.0])
+
+
+def get_parked_wall_offset(bins_per_run: int) -> np.ndarray:
+    # Unused walls wait beside the row of bins, further along -y than the row is long
+    return np.array([0.0, -SLOT_SPACING * (bins_per_run + 1), 0.0])
+
+
+def get_parked_component_location(bins_per_run: int) -> np.ndarray:
+    # Components of later waves wait on the other side of the row, high above the ground
+    return np.array([0.0, SLOT_SPACING * (bins_per_run + 1), 100.0])
+
+
+def get_wall_locations(bin_shape: List[float], offset=(0, 0, 0)) -> np.ndarray:
+    """ Locations of the four wall planes around a bin at the offset, in the order of WALL_HALF_EXTENTS. """
+    return np.array([
+        np.add([0, bin_shape[1] / 2, 0], offset),
+        np.add([0, -bin_shape[1] / 2, 0], offset),
+        np.add([bin_shape[0] / 2, 0, 0], offset),
+        np.add([-bin_shape[0] / 2, 0, 0], offset),
+    ])
+
+
+def get_wall_bounds(bin_shape: List[float], offset=(0, 0, 0)) -> np.ndarray:
+    """ Axis aligned bounds of the four wall planes, shape (4, 2, 3) with the low and high corner of every plane. """
+    locations = get_wall_locations(bin_shape, offset)
+    return np.stack([locations - WALL_HALF_EXTENTS, locations + WALL_HALF_EXTENTS], axis=1)
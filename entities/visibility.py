@@ -0,0 +1,150 @@
+from typing import Dict, List, Set, Tuple
+import bpy
+import numpy as np
+from blenderproc.python.types.MeshObjectUtility import MeshObject
+
+# Blender cameras look along -Z with Y up, OpenCV cameras along +Z with Y down
+GL_TO_CV = np.diag([1.0, -1.0, -1.0])
+
+
+def get_bound_boxes(objs: List[MeshObject]) -> np.ndarray:
+    """ Stack the world space bounding box corners of the objects.
+
+        Returns:
+            np.ndarray: Array of shape (N, 8, 3).
+    """
+    if not objs:
+        return np.zeros((0, 8, 3))
+    return np.stack([obj.get_bound_box() for obj in objs])
+
+
+def project_bound_boxes(corners: np.ndarray, cam2worlds: np.ndarray, K: np.ndarray, width: int, height: int, near: float = 0.01) -> Tuple[np.ndarray, np.ndarray]:
+    """ Project the bounding boxes of all objects into all camera poses at once and cull them against the view frustum.
+
+        Args:
+            corners (np.ndarray): World space bounding box corners, shape (N, 8, 3).
+            cam2worlds (np.ndarray): Camera poses in the Blender convention, shape (P, 4, 4).
+            K (np.ndarray): Camera intrinsics, shape (3, 3).
+            width (int): Image width in pixels.
+            height (int): Image height in pixels.
+            near (float): Corners closer to the camera than this are treated as behind it.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Boolean array (P, N) of objects that may be visible,
+                and their clipped pixel bounding boxes (P, N, 4) as [u_min, v_min, u_max, v_max].
+    """
+    rotations = cam2worlds[:, :3, :3]
+    translations = cam2worlds[:, :3, 3]
+
+    # World to OpenCV camera coordinates, shape (P, N, 8, 3)
+    relative = corners[None, :, :, :] - translations[:, None, None, :]
+    points = np.einsum('pji,pnkj->pnki', rotations, relative) @ GL_TO_CV
+
+    depth = points[..., 2]
+    in_front = depth > near
+    safe_depth = np.where(in_front, depth, 1.0)
+    u = K[0, 0] * points[..., 0] / safe_depth + K[0, 2]
+    v = K[1, 1] * points[..., 1] / safe_depth + K[1, 2]
+
+    all_in_front = in_front.all(axis=2)
+    any_in_front = in_front.any(axis=2)
+
+    # An object fully in front of the camera is culled if all corners are beyond one image border
+    outside = (u.max(axis=2) < 0) | (u.min(axis=2) > width) | (v.max(axis=2) < 0) | (v.min(axis=2) > height)
+    candidates = any_in_front & ~(all_in_front & outside)
+
+    # Objects crossing the camera plane can not be projected, so they keep the whole image
+    boxes = np.stack([
+        np.where(all_in_front, np.clip(u.min(axis=2), 0, width), 0),
+        np.where(all_in_front, np.clip(v.min(axis=2), 0, height), 0),
+        np.where(all_in_front, np.clip(u.max(axis=2), 0, width), width),
+        np.where(all_in_front, np.clip(v.max(axis=2), 0, height), height),
+    ], axis=-1)
+
+    return candidates, boxes
+
+
+def get_ray_pixels(boxes: np.ndarray, width: int, height: int, sqrt_rays: int) -> Tuple[np.ndarray, np.ndarray]:
+    """ Select the pixels of a regular ray grid that fall inside any of the boxes, plus the center of every box.
+
+        Args:
+            boxes (np.ndarray): Pixel boxes of the candidate objects, shape (M, 4).
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Pixels (R, 2) and a boolean array (R, M) of which box each pixel is in.
+    """
+    us = (np.arange(sqrt_rays) + 0.5) * width / sqrt_rays
+    vs = (np.arange(sqrt_rays) + 0.5) * height / sqrt_rays
+    grid = np.stack(np.meshgrid(us, vs), axis=-1).reshape(-1, 2)
+
+    # Small objects can fall between grid rays, so always cast one ray through their center
+    centers = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], axis=-1)
+    pixels = np.concatenate([grid, centers])
+
+    inside = (
+        (pixels[:, None, 0] >= boxes[None, :, 0]) & (pixels[:, None, 0] <= boxes[None, :, 2]) &
+        (pixels[:, None, 1] >= boxes[None, :, 1]) & (pixels[:, None, 1] <= boxes[None, :, 3])
+    )
+    keep = inside.any(axis=1)
+
+    return pixels[keep], inside[keep]
+
+
+def get_visible_objects(objs: List[MeshObject], cam2worlds: List[np.ndarray], K: List[List[float]], width: int, height: int, sqrt_rays: int) -> Tuple[Set[MeshObject], Dict[MeshObject, float]]:
+    """ Find which of the objects are visible from any of the camera poses.
+
+        Objects are first culled against the view frustum for all poses at once. Rays are then only cast
+        through the pixels covered by the projected bounding boxes of the remaining objects.
+
+        Args:
+            objs (List[MeshObject]): Objects to check.
+            cam2worlds (List[np.ndarray]): Camera poses in the Blender convention.
+            K (List[List[float]]): Camera intrinsics.
+            width (int): Image width in pixels.
+            height (int): Image height in pixels.
+            sqrt_rays (int): Rays per image side for a full image.
+
+        Returns:
+            Tuple[Set[MeshObject], Dict[MeshObject, float]]: The visible objects, and for every object the largest
+                fraction of rays inside its projected bounding box that hit it.
+    """
+    fractions = {obj: 0.0 for obj in objs}
+    if not objs or not cam2worlds:
+        return set(), fractions
+
+    K = np.asarray(K, dtype=float)
+    K_inv = np.linalg.inv(K)
+    cam2worlds = np.asarray(cam2worlds, dtype=float)
+    candidates, boxes = project_bound_boxes(get_bound_boxes(objs), cam2worlds, K, width, height)
+
+    by_name = {obj.blender_obj.name: index for index, obj in enumerate(objs)}
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    scene = bpy.context.scene
+
+    for pose, cam2world in enumerate(cam2worlds):
+        indices = np.flatnonzero(candidates[pose])
+        if len(indices) == 0:
+            continue
+
+        pixels, inside = get_ray_pixels(boxes[pose, indices], width, height, sqrt_rays)
+
+        # Pixel rays in world space
+        directions = np.concatenate([pixels, np.ones((len(pixels), 1))], axis=1) @ K_inv.T
+        directions = directions @ GL_TO_CV @ cam2world[:3, :3].T
+        directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+        origin = cam2world[:3, 3]
+
+        hits = np.zeros(len(indices))
+        column = {index: column for column, index in enumerate(indices)}
+        for direction in directions:
+            hit, _, _, _, hit_object, _ = scene.ray_cast(depsgraph, origin, direction)
+            if hit and hit_object.name in by_name and by_name[hit_object.name] in column:
+                hits[column[by_name[hit_object.name]]] += 1
+
+        ray_counts = np.maximum(inside.sum(axis=0), 1)
+        for index, fraction in zip(indices, np.minimum(hits / ray_counts, 1.0)):
+            obj = objs[index]
+            fractions[obj] = max(fractions[obj], float(fraction))
+
+    visible = {obj for obj, fraction in fractions.items() if fraction > 0}
+    return visible, fractions
@@ -0,0 +1,259 @@
+import fcntl
+import itertools
+import json
+import os
+import shutil
+import socket
+import time
+from typing import Dict, List, Optional, Tuple
+
+SHARDS_DIR = "shards"
+PART_SUFFIX = ".part"
+
+# BOP files of a chunk that map image ids to their annotations
+CHUNK_FILES = ["scene_gt.json", "scene_gt_info.json", "scene_camera.json"]
+COCO_FILE = "scene_gt_coco.json"
+# Records the images and shards a chunk held when its files were last written completely
+JOURNAL_FILE = ".finalize.json"
+
+_shard_counter = itertools.count()
+
+
+def new_shard_path(output_dir: str) -> str:
+    """ Reserve a fresh shard folder for the BOP output of one scene.
+
+        The folder name is unique across hosts and processes. Write into the returned `.part` folder and
+        call `commit_shard` once it is complete, `finalize_shards` ignores shards that are not committed.
+
+        Args:
+            output_dir (str): The BOP output folder, shards are kept in its `shards` folder.
+
+        Returns:
+            str: The path of the shard folder to write to.
+    """
+    worker_id = f"{socket.gethostname()}-{os.getpid()}".replace(".", "_")
+    name = f"{time.time_ns():020d}-{worker_id}-{next(_shard_counter):06d}"
+    return os.path.join(output_dir, SHARDS_DIR, name + PART_SUFFIX)
+
+
+def commit_shard(shard_path: str) -> str:
+    """ Mark a shard as complete by removing the `.part` suffix of its folder. """
+    committed_path = shard_path[:-len(PART_SUFFIX)]
+    os.rename(shard_path, committed_path)
+    return committed_path
+
+
+def get_committed_shards(output_dir: str) -> List[str]:
+    shards_dir = os.path.join(output_dir, SHARDS_DIR)
+    if not os.path.isdir(shards_dir):
+        return []
+    # Shard names start with their creation time, so sorting keeps the render order
+    names = sorted(name for name in os.listdir(shards_dir) if not name.endswith(PART_SUFFIX) and not name.startswith("."))
+    return [os.path.join(shards_dir, name) for name in names]
+
+
+def load_json(file_path: str, default):
+    if not os.path.isfile(file_path):
+        return default
+    with open(file_path, 'r') as f:
+        return json.load(f)
+
+
+def save_json(data, file_path: str):
+    part_path = f"{file_path}.{os.getpid()}{PART_SUFFIX}"
+    with open(part_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(part_path, file_path)
+
+
+def link_file(source: str, destination: str):
+    # Hard link so the shard stays intact until the chunk files are written, copy across file systems
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    tmp_path = f"{destination}.{os.getpid()}{PART_SUFFIX}"
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+
+def get_image_files(chunk_dir: str) -> Dict[int, List[Tuple[str, str]]]:
+    """ Map every image id of a chunk to its files, as (sub folder, file name without the image id). """
+    files: Dict[int, List[Tuple[str, str]]] = {}
+    for folder in sorted(os.listdir(chunk_dir)):
+        folder_path = os.path.join(chunk_dir, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        # Images are named after their id, masks after their image and ground truth id
+        for file_name in os.listdir(folder_path):
+            files.setdefault(int(file_name[:6]), []).append((folder, file_name[6:]))
+    return files
+
+
+class Chunk:
+    """ One BOP chunk of the finalized output, loaded once and written back when it is full or finalizing ends.
+
+        The journal of the chunk is written after its other files, and lists the shards merged into it together with
+        its amount of images at that point. Images beyond that amount are left over from an interrupted save, they
+        are dropped when the chunk is loaded, and their shards are merged again.
+    """
+
+    def __init__(self, chunk_dir: str):
+        self.chunk_dir = chunk_dir
+        self.data = {name: load_json(os.path.join(chunk_dir, name), {}) for name in CHUNK_FILES}
+        self.coco = load_json(os.path.join(chunk_dir, COCO_FILE), None)
+        self.image_amount = len(self.data["scene_camera.json"])
+
+        # Chunks written before the journal existed are complete as they are
+        self.journal = load_json(os.path.join(chunk_dir, JOURNAL_FILE), {"image_amount": self.image_amount, "shards": []})
+        if self.image_amount > self.journal["image_amount"]:
+            self.roll_back(self.journal["image_amount"])
+        self.shards: List[str] = list(self.journal["shards"])
+        self.next_annotation_id = max((ann["id"] for ann in self.coco["annotations"]), default=-1) + 1 if self.coco else 0
+
+    def roll_back(self, image_amount: int):
+        print(f"Dropping {self.image_amount - image_amount} images of an interrupted finalize from {self.chunk_dir}")
+        for name in CHUNK_FILES:
+            self.data[name] = {key: value for key, value in self.data[name].items() if int(key) < image_amount}
+        if self.coco is not None:
+            self.coco["images"] = [image for image in self.coco["images"] if image["id"] < image_amount]
+            self.coco["annotations"] = [ann for ann in self.coco["annotations"] if ann["image_id"] < image_amount]
+        self.image_amount = image_amount
+
+    def add_image(self, shard_chunk_dir: str, shard_data: Dict[str, dict], shard_coco: Optional[dict], image_id: int, files: List[Tuple[str, str]]):
+        new_id = self.image_amount
+        self.image_amount += 1
+
+        for folder, suffix in files:
+            link_file(os.path.join(shard_chunk_dir, folder, f"{image_id:06d}{suffix}"), os.path.join(self.chunk_dir, folder, f"{new_id:06d}{suffix}"))
+
+        for name in CHUNK_FILES:
+            if str(image_id) in shard_data[name]:
+                self.data[name][str(new_id)] = shard_data[name][str(image_id)]
+
+        if shard_coco is not None:
+            if self.coco is None:
+                self.coco = {key: value for key, value in shard_coco.items() if key not in ("images", "annotations")}
+                self.coco.update(images=[], annotations=[])
+            for image in shard_coco["images"]:
+                if image["id"] == image_id:
+                    self.coco["images"].append({**image, "id": new_id, "file_name": image["file_name"].replace(f"{image_id:06d}", f"{new_id:06d}")})
+            for ann in shard_coco["annotations"]:
+                if ann["image_id"] == image_id:
+                    self.coco["annotations"].append({**ann, "id": self.next_annotation_id, "image_id": new_id})
+                    self.next_annotation_id += 1
+
+    def save(self):
+        os.makedirs(self.chunk_dir, exist_ok=True)
+        journal_path = os.path.join(self.chunk_dir, JOURNAL_FILE)
+        # A new chunk first commits to being empty, so a partial first save is rolled back as well
+        if not os.path.exists(journal_path):
+            save_json(self.journal, journal_path)
+
+        for name in CHUNK_FILES:
+            if self.data[name]:
+                save_json(self.data[name], os.path.join(self.chunk_dir, name))
+        if self.coco is not None:
+            save_json(self.coco, os.path.join(self.chunk_dir, COCO_FILE))
+
+        self.journal = {"image_amount": self.image_amount, "shards": self.shards}
+        save_json(self.journal, journal_path)
+
+
+def finalize_shards(output_dir: str, frames_per_chunk: int = 1000) -> int:
+    """ Move the images of all committed shards into standard BOP chunks, with merged BOP and COCO files per chunk.
+
+        The last chunk of a dataset is filled up with whole shards before a new one is started. The JSON files
+        of a chunk are loaded and written once per call, instead of once per scene. A shard is only removed after
+        the journals of all chunks with its images are written. Shards found in the journal of the last chunk
+        were merged by an interrupted finalize and are only removed, so a finalize can be repeated at any point.
+
+        Args:
+            output_dir (str): The BOP output folder with the `shards` folder.
+            frames_per_chunk (int): The maximum amount of images per chunk.
+
+        Returns:
+            int: The amount of finalized images.
+    """
+    shards_dir = os.path.join(output_dir, SHARDS_DIR)
+    os.makedirs(shards_dir, exist_ok=True)
+    finalized = 0
+
+    # Only one finalize at a time, render workers keep adding shards meanwhile
+    with open(os.path.join(shards_dir, ".finalize.lock"), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        chunks: Dict[str, Chunk] = {}
+        merged_shards: Dict[str, set] = {}
+        done_shards: Dict[str, List[str]] = {}
+        unsaved_keys: Dict[str, set] = {}
+
+        def remove_shard(shard: str):
+            if os.path.isdir(shard):
+                shutil.rmtree(shard)
+
+        def save_chunk(key: str):
+            chunks[key].save()
+            for shard in done_shards.pop(key, []):
+                unsaved_keys[shard].discard(key)
+                if not unsaved_keys[shard]:
+                    remove_shard(shard)
+
+        shards = get_committed_shards(output_dir)
+        for shard in shards:
+            shard_name = os.path.basename(shard)
+            unsaved_keys[shard] = set()
+            for dataset in sorted(os.listdir(shard)):
+                dataset_dir = os.path.join(output_dir, dataset)
+                shard_dataset_dir = os.path.join(shard, dataset)
+                if not os.path.isdir(shard_dataset_dir):
+                    continue
+
+                # The dataset wide camera file is the same for all shards
+                if not os.path.exists(os.path.join(dataset_dir, "camera.json")) and os.path.exists(os.path.join(shard_dataset_dir, "camera.json")):
+                    link_file(os.path.join(shard_dataset_dir, "camera.json"), os.path.join(dataset_dir, "camera.json"))
+
+                for split in sorted(os.listdir(shard_dataset_dir)):
+                    split_dir = os.path.join(shard_dataset_dir, split)
+                    if not os.path.isdir(split_dir):
+                        continue
+                    key = os.path.join(dataset, split)
+
+                    if key not in chunks:
+                        existing = sorted(os.listdir(os.path.join(output_dir, key))) if os.path.isdir(os.path.join(output_dir, key)) else []
+                        chunks[key] = Chunk(os.path.join(output_dir, key, existing[-1] if existing else f"{0:06d}"))
+                        # Shards are removed right after their chunk is saved, so leftovers are in the last chunk
+                        merged_shards[key] = set(chunks[key].shards)
+                    if shard_name in merged_shards[key]:
+                        continue
+
+                    for shard_chunk in sorted(os.listdir(split_dir)):
+                        shard_chunk_dir = os.path.join(split_dir, shard_chunk)
+                        shard_data = {name: load_json(os.path.join(shard_chunk_dir, name), {}) for name in CHUNK_FILES}
+                        shard_coco = load_json(os.path.join(shard_chunk_dir, COCO_FILE), None)
+
+                        images = sorted(get_image_files(shard_chunk_dir).items())
+
+                        # The images of a shard never span two chunks, so every chunk save covers whole shards
+                        if chunks[key].image_amount and chunks[key].image_amount + len(images) > frames_per_chunk:
+                            save_chunk(key)
+                            next_chunk = int(os.path.basename(chunks[key].chunk_dir)) + 1
+                            chunks[key] = Chunk(os.path.join(output_dir, key, f"{next_chunk:06d}"))
+
+                        for image_id, files in images:
+                            chunks[key].add_image(shard_chunk_dir, shard_data, shard_coco, image_id, files)
+                            finalized += 1
+                        if shard_name not in chunks[key].shards:
+                            chunks[key].shards.append(shard_name)
+
+                    done_shards.setdefault(key, []).append(shard)
+                    unsaved_keys[shard].add(key)
+
+        for key in list(chunks):
+            save_chunk(key)
+        # Shards without images, or merged before
+        for shard in shards:
+            if not unsaved_keys[shard]:
+                remove_shard(shard)
+
+    return finalized
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import List
+from typing import List, Optional
 
 
 @dataclass
@@ -47,3 +47,5 @@ class ConfigData():
     components: List[ComponentData]
     bins: List[BinData]
     camera: CameraData
+    # Name of the render profile, see entities/render_profile.py
+    render_profile: Optional[str] = None
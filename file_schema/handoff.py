@@ -0,0 +1,51 @@
+import os
+import queue
+from multiprocessing.managers import BaseManager
+from typing import Optional
+
+# The socket address is passed on the command line, the key through the environment so it does not show up in ps
+AUTHKEY_ENV = "BLENDERBIN_HANDOFF_KEY"
+
+_queue: Optional[queue.Queue] = None
+
+
+def _init_queue(maxsize: int):
+    global _queue
+    _queue = queue.Queue(maxsize=maxsize)
+
+
+def _get_queue() -> queue.Queue:
+    return _queue
+
+
+class HandoffManager(BaseManager):
+    """ Serves one bounded queue of scenes from the simulator to the render over a local socket. """
+
+
+HandoffManager.register("get_queue", callable=_get_queue)
+
+
+def serve_queue(address: str, maxsize: int) -> HandoffManager:
+    """ Start the queue server in a process of its own.
+
+        A full queue blocks `put` in the simulator, so it never runs more than `maxsize` scenes ahead of the render.
+
+        Args:
+            address (str): Path of the unix socket to listen on.
+            maxsize (int): The maximum amount of scenes waiting for the render.
+
+        Returns:
+            HandoffManager: The started manager, shut it down once both sides are done.
+    """
+    authkey = os.urandom(16)
+    os.environ[AUTHKEY_ENV] = authkey.hex()
+    manager = HandoffManager(address=address, authkey=authkey)
+    manager.start(initializer=_init_queue, initargs=(maxsize,))
+    return manager
+
+
+def connect_queue(address: str) -> queue.Queue:
+    """ Connect to the queue served by `serve_queue`, with the key from the environment. """
+    manager = HandoffManager(address=address, authkey=bytes.fromhex(os.environ[AUTHKEY_ENV]))
+    manager.connect()
+    return manager.get_queue()
@@ -0,0 +1,392 @@
+import ctypes
+import ctypes.util
+import heapq
+import os
+import queue
+import select
+import socket
+import struct
+import threading
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+# inotify flags, see <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+LEASE_SUFFIX = ".lease"
+
+
+class DirectoryWatcher:
+    """ Wakes up when a file is written or moved into a directory.
+
+        Uses inotify through libc when it is available, otherwise `wait` falls back to sleeping for the poll interval.
+    """
+
+    def __init__(self, folder_path: str, poll_interval: float = 1.0):
+        self.folder_path = folder_path
+        self.poll_interval = poll_interval
+        self.fd = None
+
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                return
+            wd = libc.inotify_add_watch(fd, os.fsencode(folder_path), IN_CLOSE_WRITE | IN_MOVED_TO)
+            if wd < 0:
+                os.close(fd)
+                return
+            self.fd = fd
+        except (OSError, AttributeError, TypeError):
+            # No libc or no inotify on this platform
+            self.fd = None
+
+    @property
+    def uses_inotify(self) -> bool:
+        return self.fd is not None
+
+    def wait(self, timeout: float) -> Optional[List[str]]:
+        """ Block until new files arrive or the timeout expires.
+
+            Args:
+                timeout (float): Maximum time to wait in seconds.
+
+            Returns:
+                List[str] | None: Names of the new files, or None if they are unknown and the folder must be rescanned,
+                    as without inotify or after the kernel dropped events of a full event queue.
+        """
+        if self.fd is None:
+            time.sleep(min(timeout, self.poll_interval))
+            return None
+
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        names = []
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        overflow = False
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buffer):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(buffer, offset)
+            offset += _EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+            elif name:
+                names.append(os.fsdecode(name))
+
+        return None if overflow else names
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class SceneQueue:
+    """ Lease based work queue on top of the `queue`, `tmp` and `complete` layout of a simulation folder.
+
+        A scene is claimed by atomically renaming it from `queue/` into `tmp/` under a worker specific lease name.
+        A background thread keeps the lease alive by touching the file, and leases that have not been touched
+        for `lease_timeout` seconds are moved back into `queue/` by any worker, so a crashed worker never strands
+        its scene. Queued names are kept in an in-memory index that is filled once and then updated from
+        inotify events, so claiming does not rescan the queue folder. The index is rebuilt when inotify reports
+        lost events, and every `rescan_interval` seconds in case events went missing otherwise.
+    """
+
+    def __init__(self, folder_path: str, lease_timeout: float = 120.0, heartbeat_interval: float = 10.0, poll_interval: float = 1.0,
+                 rescan_interval: float = 300.0):
+        self.queue_dir = os.path.join(folder_path, "queue")
+        self.tmp_dir = os.path.join(folder_path, "tmp")
+        self.complete_dir = os.path.join(folder_path, "complete")
+        self.failed_dir = os.path.join(folder_path, "failed")
+
+        for dir in [self.queue_dir, self.tmp_dir, self.complete_dir]:
+            if not os.path.exists(dir):
+                os.makedirs(dir)
+
+        self.lease_timeout = lease_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.rescan_interval = rescan_interval
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}".replace(".", "_")
+
+        self._index: List[str] = []
+        self._indexed = set()
+        self._leases = set()
+        self._lock = threading.Lock()
+        self._last_stale_check = 0.0
+        self._last_rescan = 0.0
+
+        self.watcher = DirectoryWatcher(self.queue_dir, poll_interval=poll_interval)
+        self.requeue_stale_leases()
+        self.rescan()
+
+        self._stop = threading.Event()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        self._heartbeat.start()
+
+    def rescan(self):
+        """ Rebuild the queue index from a single listing of the queue folder. """
+        with os.scandir(self.queue_dir) as entries:
+            names = [entry.name for entry in entries if entry.name.endswith(".json")]
+        self._index = []
+        self._indexed = set()
+        self._add_to_index(names)
+        self._last_rescan = time.monotonic()
+
+    def _add_to_index(self, names: List[str]):
+        for name in names:
+            if name.endswith(".json") and name not in self._indexed:
+                heapq.heappush(self._index, name)
+                self._indexed.add(name)
+
+    def _lease_path(self, name: str) -> str:
+        return os.path.join(self.tmp_dir, f"{name}.{self.worker_id}{LEASE_SUFFIX}")
+
+    def try_claim(self) -> Optional[str]:
+        """ Claim the first scene in the index without waiting.
+
+            Returns:
+                str | None: Path of the leased scene file, or None if the index is empty.
+        """
+        while self._index:
+            name = heapq.heappop(self._index)
+            self._indexed.discard(name)
+            lease_path = self._lease_path(name)
+            try:
+                os.rename(os.path.join(self.queue_dir, name), lease_path)
+            except FileNotFoundError:
+                # Another worker claimed it first
+                continue
+
+            # Rename keeps the old mtime, so refresh it before another worker sees the lease as stale
+            os.utime(lease_path)
+            with self._lock:
+                self._leases.add(lease_path)
+            return lease_path
+
+        return None
+
+    def claim(self, timeout: Optional[float] = None) -> Optional[str]:
+        """ Claim the next scene, waiting for new scenes if the queue is empty.
+
+            Args:
+                timeout (float | None): Seconds to wait for a scene, or None to wait forever.
+
+            Returns:
+                str | None: Path of the leased scene file, or None if the timeout expired.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            if time.monotonic() - self._last_stale_check > self.lease_timeout / 2:
+                if self.requeue_stale_leases():
+                    self.rescan()
+
+            # Fallback for scenes whose events were lost, the index is only rebuilt now and then
+            if time.monotonic() - self._last_rescan > self.rescan_interval:
+                self.rescan()
+
+            lease_path = self.try_claim()
+            if lease_path:
+                return lease_path
+
+            remaining = self.lease_timeout / 2
+            if deadline is not None:
+                remaining = max(0, min(remaining, deadline - time.monotonic()))
+
+            names = self.watcher.wait(remaining)
+            if names is None:
+                self.rescan()
+            else:
+                self._add_to_index(names)
+
+            # Give the scenes that arrived while waiting one last chance before timing out
+            if deadline is not None and time.monotonic() >= deadline:
+                return self.try_claim()
+
+    def complete(self, lease_path: str):
+        """ Drop a finished lease. """
+        with self._lock:
+            self._leases.discard(lease_path)
+        try:
+            os.remove(lease_path)
+        except FileNotFoundError:
+            print(f"Lease {lease_path} expired before the scene was completed")
+
+    def release(self, lease_path: str):
+        """ Hand a leased scene back to the queue. """
+        with self._lock:
+            self._leases.discard(lease_path)
+        name = self._scene_name(os.path.basename(lease_path))
+        try:
+            os.rename(lease_path, os.path.join(self.queue_dir, name))
+        except FileNotFoundError:
+            pass
+
+    def fail(self, lease_path: str, error: Exception):
+        """ Move a leased scene that can not be loaded into `failed/`, so no worker claims it again. """
+        with self._lock:
+            self._leases.discard(lease_path)
+        name = self._scene_name(os.path.basename(lease_path))
+        os.makedirs(self.failed_dir, exist_ok=True)
+        try:
+            os.rename(lease_path, os.path.join(self.failed_dir, name))
+            print(f"Moved {name} to {self.failed_dir}: {error}")
+        except FileNotFoundError:
+            pass
+
+    def release_all(self):
+        with self._lock:
+            leases = list(self._leases)
+        for lease_path in leases:
+            self.release(lease_path)
+
+    @staticmethod
+    def _scene_name(lease_name: str) -> str:
+        # Leases are named <scene>.json.<worker><LEASE_SUFFIX>, plain files in tmp come from the old render loop
+        if lease_name.endswith(LEASE_SUFFIX):
+            return lease_name[:lease_name.index(".json") + len(".json")]
+        return lease_name
+
+    def requeue_stale_leases(self) -> int:
+        """ Move leases that have not been refreshed within the lease timeout back into the queue.
+
+            Returns:
+                int: The number of requeued scenes.
+        """
+        self._last_stale_check = time.monotonic()
+        now = time.time()
+        requeued = 0
+
+        with os.scandir(self.tmp_dir) as entries:
+            for entry in entries:
+                if not (entry.name.endswith(LEASE_SUFFIX) or entry.name.endswith(".json")):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if now - max(stat.st_mtime, stat.st_ctime) < self.lease_timeout:
+                    continue
+                try:
+                    os.rename(entry.path, os.path.join(self.queue_dir, self._scene_name(entry.name)))
+                    requeued += 1
+                except FileNotFoundError:
+                    # Requeued or completed by someone else
+                    continue
+
+        if requeued:
+            print(f"Requeued {requeued} stale scene(s)")
+        return requeued
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            with self._lock:
+                leases = list(self._leases)
+            for lease_path in leases:
+                try:
+                    os.utime(lease_path)
+                except FileNotFoundError:
+                    with self._lock:
+                        self._leases.discard(lease_path)
+
+    def close(self):
+        self._stop.set()
+        self._heartbeat.join()
+        self.watcher.close()
+
+
+class ScenePrefetcher:
+    """ Claims and loads the next batches of scenes in a background thread, while the current batch renders.
+
+        At most `depth` loaded batches wait in memory. `get` returns the next batch as its lease paths and loaded
+        scenes, or None once no scene was queued for `idle_timeout` seconds.
+    """
+
+    def __init__(self, scene_queue: SceneQueue, load: Callable[[str], Any], batch_size: int = 1, idle_timeout: Optional[float] = None, depth: int = 1):
+        self.scene_queue = scene_queue
+        self.load = load
+        self.batch_size = batch_size
+        self.idle_timeout = idle_timeout
+        self._batches: queue.Queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._prefetch_loop, daemon=True)
+        self._thread.start()
+
+    def _claim(self) -> Optional[str]:
+        # Claim in short steps, so closing does not wait for the idle timeout
+        deadline = None if self.idle_timeout is None else time.monotonic() + self.idle_timeout
+        while not self._stop.is_set():
+            step = 1.0 if deadline is None else max(0.0, min(1.0, deadline - time.monotonic()))
+            lease_path = self.scene_queue.claim(timeout=step)
+            if lease_path or (deadline is not None and time.monotonic() >= deadline):
+                return lease_path
+        return None
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._batches.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _prefetch_loop(self):
+        while not self._stop.is_set():
+            lease_path = self._claim()
+            if not lease_path:
+                self._put(None)
+                return
+
+            # Add already queued scenes to the claimed one, without waiting for new ones
+            lease_paths = [lease_path]
+            while len(lease_paths) < self.batch_size:
+                lease_path = self.scene_queue.try_claim()
+                if not lease_path:
+                    break
+                lease_paths.append(lease_path)
+
+            # A scene that fails to load is set aside, the rest of the batch is still rendered
+            loaded_paths, scenes = [], []
+            for lease_path in lease_paths:
+                try:
+                    scenes.append(self.load(lease_path))
+                    loaded_paths.append(lease_path)
+                except Exception as e:
+                    self.scene_queue.fail(lease_path, e)
+            if not loaded_paths:
+                continue
+
+            if not self._put((loaded_paths, scenes)):
+                for lease_path in loaded_paths:
+                    self.scene_queue.release(lease_path)
+
+    def get(self) -> Optional[Tuple[List[str], List[Any]]]:
+        return self._batches.get()
+
+    def close(self):
+        """ Stop prefetching, and hand the batches that were claimed but not taken back to the queue. """
+        self._stop.set()
+        self._thread.join()
+        while True:
+            try:
+                item = self._batches.get_nowait()
+            except queue.Empty:
+                break
+            if item:
+                for lease_path in item[0]:
+                    self.scene_queue.release(lease_path)
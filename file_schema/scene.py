@@ -3,20 +3,34 @@ from typing import  List, Optional
 
 import numpy as np
 
-@dataclass
+@dataclass(slots=True)
 class PositionData():
     location: List[float]
     orientation: List[float]
     
-@dataclass
+@dataclass(slots=True)
 class ElementData(): 
     name: str
     pos: List[PositionData]
     
-@dataclass
+@dataclass(slots=True)
 class SceneData():
     config_path: str
     comps: List[ElementData]
     bin: ElementData
     cameras: Optional[List[List[List[float]]]]
-    
\ No newline at end of file
+    
+# Array backed variants of the scene, with the poses of an element as (N, 3) arrays
+@dataclass(slots=True)
+class ElementArrays():
+    name: str
+    locations: np.ndarray
+    orientations: np.ndarray
+    
+@dataclass(slots=True)
+class SceneArrays():
+    config_path: str
+    comps: List[ElementArrays]
+    bin: ElementArrays
+    cameras: Optional[np.ndarray]
+    
@@ -0,0 +1,224 @@
+import fcntl
+import json
+import os
+import struct
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from file_schema.scene import ElementData, PositionData, SceneData
+from file_schema.schema_logic import get_json_files_from_folder, load_scene_from_file, save_scene_to_folder, serialize_scene
+
+MAGIC = b"BBSC"
+_RECORD_HEADER = struct.Struct("<4sIII")
+
+
+def encode_scene(scene: SceneData, hash: str) -> bytes:
+    """ Encode a scene as a binary record with float32 pose and camera arrays.
+
+        Args:
+            scene (SceneData): The scene to encode.
+            hash (str): The key the scene is stored under.
+
+        Returns:
+            bytes: The record.
+    """
+    elements = [scene.bin] + scene.comps
+    meta = {
+        "hash": hash,
+        "config_path": scene.config_path,
+        "elements": [[element.name, len(element.pos)] for element in elements],
+        "has_cameras": scene.cameras is not None,
+    }
+    meta_bytes = json.dumps(meta).encode('utf-8')
+
+    poses = np.array([pos.location + pos.orientation for element in elements for pos in element.pos], dtype=np.float32).reshape(-1, 6)
+    cameras = np.array(scene.cameras or [], dtype=np.float32).reshape(-1, 16)
+
+    header = _RECORD_HEADER.pack(MAGIC, len(meta_bytes), len(poses), len(cameras))
+    return header + meta_bytes + poses.tobytes() + cameras.tobytes()
+
+
+def decode_scene(record: bytes) -> Tuple[str, SceneData]:
+    """ Decode a binary record back into its key and scene. """
+    magic, meta_length, pose_amount, camera_amount = _RECORD_HEADER.unpack_from(record)
+    if magic != MAGIC:
+        raise ValueError("Not a scene record")
+
+    offset = _RECORD_HEADER.size
+    meta = json.loads(record[offset:offset + meta_length])
+    offset += meta_length
+
+    poses = np.frombuffer(record, dtype=np.float32, count=pose_amount * 6, offset=offset).reshape(-1, 6)
+    offset += poses.nbytes
+    cameras = np.frombuffer(record, dtype=np.float32, count=camera_amount * 16, offset=offset).reshape(-1, 4, 4)
+
+    elements = []
+    start = 0
+    for name, amount in meta["elements"]:
+        pos = [PositionData(location=pose[:3].tolist(), orientation=pose[3:].tolist()) for pose in poses[start:start + amount]]
+        elements.append(ElementData(name=name, pos=pos))
+        start += amount
+
+    scene = SceneData(
+        config_path=meta["config_path"],
+        comps=elements[1:],
+        bin=elements[0],
+        cameras=cameras.tolist() if meta["has_cameras"] else None,
+    )
+    return meta["hash"], scene
+
+
+class SceneStore:
+    """ Append-only store of scenes in rolling segment files.
+
+        Every scene is one binary record with its poses and camera matrices as float32 arrays. Records are
+        appended to the newest segment until it grows beyond `segment_bytes`, and an append-only index maps
+        each scene hash to its segment, offset and length for random access. Appends hold an exclusive lock
+        on the index, so several processes can write to the same store.
+    """
+
+    def __init__(self, folder_path: str, segment_bytes: int = 64 * 1024 * 1024):
+        self.folder_path = folder_path
+        self.segment_bytes = segment_bytes
+        self.index_path = os.path.join(folder_path, "index.log")
+        self.index: Dict[str, Tuple[str, int, int]] = {}
+        self._index_size = 0
+
+        os.makedirs(folder_path, exist_ok=True)
+        self.refresh()
+
+    def refresh(self):
+        """ Read the index lines appended since the last refresh. """
+        if not os.path.exists(self.index_path):
+            return
+
+        with open(self.index_path, 'r') as f:
+            f.seek(self._index_size)
+            for line in f:
+                if not line.endswith("\n"):
+                    # Partially written line, read it on the next refresh
+                    break
+                hash, segment, offset, length = line.split()
+                self.index[hash] = (segment, int(offset), int(length))
+                self._index_size += len(line.encode('utf-8'))
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, hash: str) -> bool:
+        return hash in self.index
+
+    def hashes(self) -> List[str]:
+        return list(self.index)
+
+    def _segment_to_append(self) -> str:
+        segments = sorted(name for name in os.listdir(self.folder_path) if name.startswith("segment_"))
+        if segments:
+            newest = segments[-1]
+            if os.path.getsize(os.path.join(self.folder_path, newest)) < self.segment_bytes:
+                return newest
+            number = int(newest[len("segment_"):-len(".bin")]) + 1
+        else:
+            number = 0
+        return f"segment_{number:06d}.bin"
+
+    def append(self, scene: SceneData, hash: Optional[str] = None) -> str:
+        """ Append a scene to the store.
+
+            Args:
+                scene (SceneData): The scene to store.
+                hash (Optional[str]): The key to store the scene under, the hash of the scene if left out.
+
+            Returns:
+                str: The hash the scene is stored under, the same as its JSON file name.
+        """
+        hash = hash or serialize_scene(scene)[1][:16]
+        record = encode_scene(scene, hash)
+
+        with open(self.index_path, 'a') as index_file:
+            fcntl.flock(index_file, fcntl.LOCK_EX)
+            try:
+                self.refresh()
+                if hash in self.index:
+                    return hash
+
+                segment = self._segment_to_append()
+                with open(os.path.join(self.folder_path, segment), 'ab') as f:
+                    offset = f.tell()
+                    f.write(record)
+
+                index_file.write(f"{hash} {segment} {offset} {len(record)}\n")
+                index_file.flush()
+                self.index[hash] = (segment, offset, len(record))
+            finally:
+                fcntl.flock(index_file, fcntl.LOCK_UN)
+
+        return hash
+
+    def get(self, hash: str) -> SceneData:
+        """ Load a single scene by its hash.
+
+            Raises:
+                KeyError: If the scene is not in the store.
+        """
+        if hash not in self.index:
+            self.refresh()
+        segment, offset, length = self.index[hash]
+
+        with open(os.path.join(self.folder_path, segment), 'rb') as f:
+            f.seek(offset)
+            _, scene = decode_scene(f.read(length))
+        return scene
+
+    def items(self) -> Iterator[Tuple[str, SceneData]]:
+        """ Iterate over the stored scenes with their keys, reading segment by segment in file order. """
+        by_segment: Dict[str, List[Tuple[int, int]]] = {}
+        for segment, offset, length in self.index.values():
+            by_segment.setdefault(segment, []).append((offset, length))
+
+        for segment in sorted(by_segment):
+            with open(os.path.join(self.folder_path, segment), 'rb') as f:
+                data = f.read()
+            for offset, length in sorted(by_segment[segment]):
+                yield decode_scene(data[offset:offset + length])
+
+    def __iter__(self) -> Iterator[SceneData]:
+        for _, scene in self.items():
+            yield scene
+
+    def import_folder(self, folder_path: str, remove: bool = False) -> int:
+        """ Append all JSON scenes of a folder to the store.
+
+            Args:
+                folder_path (str): Folder with scene JSON files, like a `complete` folder.
+                remove (bool): Remove the JSON files once they are stored.
+
+            Returns:
+                int: The amount of imported scenes.
+        """
+        imported = 0
+        for file_path in sorted(get_json_files_from_folder(folder_path)):
+            scene = load_scene_from_file(file_path)
+            # Keep the file name as the key, so an export restores the same names
+            self.append(scene, hash=os.path.splitext(os.path.basename(file_path))[0])
+            imported += 1
+            if remove:
+                os.remove(file_path)
+        return imported
+
+    def export_folder(self, folder_path: str) -> int:
+        """ Write every stored scene as a JSON file into a folder.
+
+            Poses are stored as float32, so exported files can differ from the imported ones in the last digits.
+            The files are named after their keys in the store, which are the names of the imported files,
+            and not after the hash of the rounded content.
+
+            Returns:
+                int: The amount of exported scenes.
+        """
+        exported = 0
+        for hash, scene in self.items():
+            save_scene_to_folder(scene, folder_path, name=hash)
+            exported += 1
+        return exported
@@ -2,17 +2,20 @@ import hashlib
 import json
 import os
 from dataclasses import asdict
-from typing import List, Type, TypeVar
+from typing import List, Optional, Tuple, Type, TypeVar
 
 import glob
 import numpy as np
 from dacite import from_dict
 
 from file_schema.config import ConfigData
-from file_schema.scene import SceneData
+from file_schema.scene import ElementArrays, ElementData, PositionData, SceneArrays, SceneData
 
 T = TypeVar("T")
 
+# Config fields added after configs were first hashed, left out of the hash while unset so existing configs keep their folder
+OPTIONAL_CONFIG_FIELDS = ["render_profile"]
+
 def default_serializer(obj):
     """ A custom serializer for JSON serialization.
 
@@ -42,7 +45,13 @@ def hash_data_class(data_class: Type[T]) -> str:
         Returns:
             str: The hash value as a string.
     """
-    d_str = json.dumps(asdict(data_class), default=default_serializer, sort_keys=True).encode('utf-8')
+    dictionary = asdict(data_class)
+    if isinstance(data_class, ConfigData):
+        for field in OPTIONAL_CONFIG_FIELDS:
+            if dictionary[field] is None:
+                del dictionary[field]
+
+    d_str = json.dumps(dictionary, default=default_serializer, sort_keys=True).encode('utf-8')
     hash = hashlib.sha1(d_str).hexdigest()
 
     return hash
@@ -85,16 +94,185 @@ def save_schema_to_folder(data_class: Type[T], folder_path: str):
             folder_path (str): The path of the folder to save the JSON file.
     """
     hash = hash_data_class(data_class)
-    filename = f"{hash[:8]}.json"
+    filename = f"{hash[:16]}.json"
 
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path)
+    os.makedirs(folder_path, exist_ok=True)
 
     file_path = f"{folder_path}/{filename}"
 
-    with open(file_path, 'w') as f:
+    # Write to a partial file and rename it, so readers of the folder never see a half written scene
+    part_path = f"{file_path}.{os.getpid()}.part"
+    with open(part_path, 'w') as f:
         data_class = asdict(data_class)
         json.dump(data_class, f, default=default_serializer, indent=4)
+    os.replace(part_path, file_path)
+
+
+def scene_to_dict(scene: SceneData) -> dict:
+    """ Convert a scene to a dictionary without the reflection and deep copies of `asdict`.
+
+        Args:
+            scene (SceneData): The scene to convert.
+
+        Returns:
+            dict: The same dictionary as `asdict` would return.
+    """
+    def element_to_dict(element: ElementData) -> dict:
+        return {
+            "name": element.name,
+            "pos": [{"location": pos.location, "orientation": pos.orientation} for pos in element.pos],
+        }
+
+    return {
+        "config_path": scene.config_path,
+        "comps": [element_to_dict(element) for element in scene.comps],
+        "bin": element_to_dict(scene.bin),
+        "cameras": scene.cameras,
+    }
+
+
+def scene_from_dict(scene_dict: dict) -> SceneData:
+    """ Build a scene from a dictionary without dacite.
+
+        Args:
+            scene_dict (dict): Dictionary in the scene JSON schema.
+
+        Returns:
+            SceneData: The scene.
+    """
+    def element_from_dict(element: dict) -> ElementData:
+        pos = [PositionData(location=pos["location"], orientation=pos["orientation"]) for pos in element["pos"]]
+        return ElementData(name=element["name"], pos=pos)
+
+    return SceneData(
+        config_path=scene_dict["config_path"],
+        comps=[element_from_dict(element) for element in scene_dict["comps"]],
+        bin=element_from_dict(scene_dict["bin"]),
+        cameras=scene_dict.get("cameras"),
+    )
+
+
+def scene_arrays_from_dict(scene_dict: dict) -> SceneArrays:
+    """ Build an array backed scene from a dictionary, without a PositionData per pose.
+
+        Args:
+            scene_dict (dict): Dictionary in the scene JSON schema.
+
+        Returns:
+            SceneArrays: The scene with the poses of every element as (N, 3) arrays.
+    """
+    def element_to_arrays(element: dict) -> ElementArrays:
+        locations = np.array([pos["location"] for pos in element["pos"]], dtype=float).reshape(-1, 3)
+        orientations = np.array([pos["orientation"] for pos in element["pos"]], dtype=float).reshape(-1, 3)
+        return ElementArrays(name=element["name"], locations=locations, orientations=orientations)
+
+    cameras = scene_dict.get("cameras")
+    return SceneArrays(
+        config_path=scene_dict["config_path"],
+        comps=[element_to_arrays(element) for element in scene_dict["comps"]],
+        bin=element_to_arrays(scene_dict["bin"]),
+        cameras=None if cameras is None else np.asarray(cameras, dtype=float),
+    )
+
+
+def scene_to_arrays(scene: SceneData) -> SceneArrays:
+    """ Convert a scene to its array backed variant. """
+    def element_to_arrays(element: ElementData) -> ElementArrays:
+        locations = np.array([pos.location for pos in element.pos], dtype=float).reshape(-1, 3)
+        orientations = np.array([pos.orientation for pos in element.pos], dtype=float).reshape(-1, 3)
+        return ElementArrays(name=element.name, locations=locations, orientations=orientations)
+
+    return SceneArrays(
+        config_path=scene.config_path,
+        comps=[element_to_arrays(element) for element in scene.comps],
+        bin=element_to_arrays(scene.bin),
+        cameras=None if scene.cameras is None else np.asarray(scene.cameras, dtype=float),
+    )
+
+
+def scene_from_arrays(scene: SceneArrays) -> SceneData:
+    """ Convert an array backed scene back to a scene. """
+    def element_from_arrays(element: ElementArrays) -> ElementData:
+        pos = [PositionData(location=location, orientation=orientation) 
+               for location, orientation in zip(element.locations.tolist(), element.orientations.tolist())]
+        return ElementData(name=element.name, pos=pos)
+
+    return SceneData(
+        config_path=scene.config_path,
+        comps=[element_from_arrays(element) for element in scene.comps],
+        bin=element_from_arrays(scene.bin),
+        cameras=None if scene.cameras is None else scene.cameras.tolist(),
+    )
+
+
+def serialize_scene(scene: SceneData) -> Tuple[bytes, str]:
+    """ Serialize a scene once, and hash the result.
+
+        Args:
+            scene (SceneData): The scene to serialize.
+
+        Returns:
+            Tuple[bytes, str]: The sorted JSON bytes and their hash, equal to `hash_data_class(scene)`.
+    """
+    d_str = json.dumps(scene_to_dict(scene), default=default_serializer, sort_keys=True).encode('utf-8')
+    return d_str, hashlib.sha1(d_str).hexdigest()
+
+
+def load_scene_from_file(file_path: str) -> SceneData:
+    """ Load a scene from a JSON file, like `load_schema_from_file` but without dacite.
+
+        Args:
+            file_path (str): The path of the JSON file.
+
+        Returns:
+            SceneData: The loaded scene.
+    """
+    with open(file_path, 'r') as f:
+        scene_dict = json.load(f)
+    return scene_from_dict(scene_dict)
+
+
+def load_scene_arrays_from_file(file_path: str) -> SceneArrays:
+    """ Load a scene from a JSON file straight into its array backed variant.
+
+        Args:
+            file_path (str): The path of the JSON file.
+
+        Returns:
+            SceneArrays: The loaded scene.
+    """
+    with open(file_path, 'r') as f:
+        scene_dict = json.load(f)
+    return scene_arrays_from_dict(scene_dict)
+
+
+def save_scene_to_folder(scene: SceneData, folder_path: str, name: Optional[str] = None) -> str:
+    """ Save a scene to a JSON file named after its hash, serializing it only once.
+
+        The file holds the same sorted JSON that the hash is computed from, so the file name matches
+        `save_schema_to_folder`, but the content is not indented.
+
+        Args:
+            scene (SceneData): The scene to be saved.
+            folder_path (str): The path of the folder to save the JSON file.
+            name (Optional[str]): File name without extension, the hash of the scene if left out.
+
+        Returns:
+            str: The path of the saved file.
+    """
+    d_str, hash = serialize_scene(scene)
+
+    os.makedirs(folder_path, exist_ok=True)
+
+    file_path = f"{folder_path}/{name or hash[:16]}.json"
+
+    # Write to a partial file and rename it, so readers of the folder never see a half written scene
+    part_path = f"{file_path}.{os.getpid()}.part"
+    with open(part_path, 'wb') as f:
+        f.write(d_str)
+    os.replace(part_path, file_path)
+
+    return file_path
 
 
 def get_json_files_from_folder(folder_path: str) -> List[str]:
@@ -151,15 +329,17 @@ def save_scene(scene: SceneData, config: ConfigData, folder_path: str):
     folder_path = f"{folder_path}{config_name}"
 
     for dir in ["complete", "queue", "tmp"]:
-        if not os.path.exists(f"{folder_path}/{dir}"):
-            os.makedirs(f"{folder_path}/{dir}")
+        os.makedirs(f"{folder_path}/{dir}", exist_ok=True)
 
     queue_folder_path = f"{folder_path}/queue"
-    save_schema_to_folder(scene, queue_folder_path)
+    save_scene_to_folder(scene, queue_folder_path)
 
     config_file_path = f"{folder_path}/{config_name}.json"
     if not os.path.exists(config_file_path):
-        save_schema_to_file(config, config_file_path)
+        # Several simulators may save the config at once, so write it under a private name first
+        part_path = f"{config_file_path}.{os.getpid()}.part"
+        save_schema_to_file(config, part_path)
+        os.replace(part_path, config_file_path)
 
 
 def get_next_sim_folder(folder_path: str) -> str | None:
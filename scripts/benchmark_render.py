@@ -0,0 +1,148 @@
+import blenderproc as bproc
+import sys
+import os
+import json
+import time
+import argparse
+import numpy as np
+from itertools import islice
+from typing import Dict, List
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bin_render import Render
+from file_schema.config import ConfigData
+from file_schema.scene import SceneData
+from file_schema.scene_store import SceneStore
+from file_schema.schema_logic import get_json_files_from_folder, load_scene_from_file, load_schema_from_file
+from entities.render_profile import RENDER_PROFILES, get_render_profile
+
+# Renders the same archived scenes under each render profile and compares the images with a high sample reference.
+# Run it from the repository root, the render loads its resources from there.
+#
+#   blenderproc run scripts/benchmark_render.py --scenes resources/simulations/config_abc123/complete_store --amount 5
+
+
+def load_scenes(folder_path: str, amount: int) -> List[SceneData]:
+    # A folder of scene files, or a scene store
+    json_files = sorted(get_json_files_from_folder(folder_path))
+    if json_files:
+        return [load_scene_from_file(file_path) for file_path in json_files[:amount]]
+    if os.path.isfile(os.path.join(folder_path, "index.log")):
+        return list(islice(SceneStore(folder_path), amount))
+    raise FileNotFoundError(f"No scene files or scene store found in {folder_path}")
+
+
+def resize_image(image: np.ndarray, height: int, width: int) -> np.ndarray:
+    if image.shape[:2] == (height, width):
+        return image.astype(np.float64)
+    # Average blocks of pixels for whole factors, like the renderer does with fewer pixels, nearest pixel otherwise
+    factor_y, factor_x = image.shape[0] // height, image.shape[1] // width
+    if factor_y * height == image.shape[0] and factor_x * width == image.shape[1]:
+        return image.reshape(height, factor_y, width, factor_x, -1).mean(axis=(1, 3))
+    rows = ((np.arange(height) + 0.5) * image.shape[0] / height).astype(int)
+    cols = ((np.arange(width) + 0.5) * image.shape[1] / width).astype(int)
+    return image[rows][:, cols].astype(np.float64)
+
+
+def psnr(image: np.ndarray, reference: np.ndarray) -> float:
+    mse = np.mean((image.astype(np.float64) - reference) ** 2)
+    return float('inf') if mse == 0 else float(10 * np.log10(255.0 ** 2 / mse))
+
+
+def box_filter(image: np.ndarray, size: int) -> np.ndarray:
+    # Mean over every size x size window, from the summed area table
+    table = np.pad(image, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+    return (table[size:, size:] - table[:-size, size:] - table[size:, :-size] + table[:-size, :-size]) / size ** 2
+
+
+def ssim(image: np.ndarray, reference: np.ndarray, window: int = 7) -> float:
+    # SSIM of the luminance with a uniform window
+    weights = np.array([0.299, 0.587, 0.114])
+    x = image[..., :3].astype(np.float64) @ weights
+    y = reference[..., :3] @ weights
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+
+    mean_x, mean_y = box_filter(x, window), box_filter(y, window)
+    var_x = box_filter(x * x, window) - mean_x ** 2
+    var_y = box_filter(y * y, window) - mean_y ** 2
+    cov = box_filter(x * y, window) - mean_x * mean_y
+
+    ssim_map = ((2 * mean_x * mean_y + c1) * (2 * cov + c2)) / ((mean_x ** 2 + mean_y ** 2 + c1) * (var_x + var_y + c2))
+    return float(ssim_map.mean())
+
+
+def render_profile(rend: Render, name: str):
+    rend.set_profile(get_render_profile(name))
+    rend.apply_profile()
+    start = time.perf_counter()
+    colors = bproc.renderer.render()['colors']
+    return colors, time.perf_counter() - start
+
+
+parser = argparse.ArgumentParser(description='Compare the speed and image quality of the render profiles.')
+parser.add_argument('--scenes', nargs='?', required=True, help='Folder with scene files or a scene store, for example a complete_store')
+parser.add_argument('--config', nargs='?', default=None, help='filepath to configuration JSON file, the config of the scenes if left out')
+parser.add_argument('--amount', nargs='?', default=5, help='The number of scenes to render')
+parser.add_argument('--img-amount', nargs='?', default=2, help='Images per scene, the stored camera poses are used first')
+parser.add_argument('--profiles', nargs='?', default='draft,train,eval', help=f'Comma separated profiles to compare, of {", ".join(RENDER_PROFILES)}')
+parser.add_argument('--reference', nargs='?', default='reference', help='The profile the others are compared with')
+parser.add_argument('--random-bg', action=argparse.BooleanOptionalAction, default=True, help="Add a random background, the same one for every profile")
+parser.add_argument('--seed', nargs='?', default=0, help='Seed for the materials, light and background of every scene')
+parser.add_argument('--output', nargs='?', default=None, help='Write the results to this JSON file')
+args = parser.parse_args()
+
+profiles = [get_render_profile(name).name for name in args.profiles.split(",")]
+scenes = load_scenes(args.scenes, int(args.amount))
+img_amount = int(args.img_amount)
+
+config = load_schema_from_file(file_path=args.config or scenes[0].config_path, data_class=ConfigData)
+rend = Render(config_data=config, use_metadata=False, render_profile=args.reference)
+
+seconds: Dict[str, List[float]] = {name: [] for name in [args.reference] + profiles}
+scores: Dict[str, Dict[str, List[float]]] = {name: {"psnr": [], "ssim": []} for name in profiles}
+
+for index, scene in enumerate(scenes):
+    # The scene is set up once, so every profile renders the same materials, light, background and cameras
+    np.random.seed(int(args.seed) + index)
+    scene.cameras = (scene.cameras or [])[:img_amount]
+    rend.setup_scene(scene, random_background=args.random_bg, img_amount=img_amount, random_camera_positions=False)
+
+    # The reference renders first and also absorbs compiling the shaders of the scene
+    reference, elapsed = render_profile(rend, args.reference)
+    seconds[args.reference].append(elapsed / len(reference))
+
+    for name in profiles:
+        colors, elapsed = render_profile(rend, name)
+        seconds[name].append(elapsed / len(colors))
+        for image, reference_image in zip(colors, reference):
+            reference_image = resize_image(reference_image, image.shape[0], image.shape[1])
+            scores[name]["psnr"].append(psnr(image, reference_image))
+            scores[name]["ssim"].append(ssim(image, reference_image))
+
+    rend.reset()
+    print(f"Rendered scene {index + 1}/{len(scenes)} under {len(profiles) + 1} profiles")
+
+results = {
+    "scenes": len(scenes),
+    "images_per_scene": img_amount,
+    "reference": {"profile": args.reference, "seconds_per_image": float(np.mean(seconds[args.reference]))},
+    "profiles": {
+        name: {
+            "profile": vars(RENDER_PROFILES[name]),
+            "seconds_per_image": float(np.mean(seconds[name])),
+            "psnr": float(np.mean(scores[name]["psnr"])),
+            "ssim": float(np.mean(scores[name]["ssim"])),
+        } for name in profiles
+    },
+}
+
+print(f"\n{'profile':<12} {'s/image':>10} {'PSNR (dB)':>10} {'SSIM':>8}")
+print(f"{args.reference:<12} {results['reference']['seconds_per_image']:10.2f} {'-':>10} {'-':>8}")
+for name, result in results["profiles"].items():
+    print(f"{name:<12} {result['seconds_per_image']:10.2f} {result['psnr']:10.2f} {result['ssim']:8.4f}")
+
+if args.output:
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {args.output}")
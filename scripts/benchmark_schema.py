@@ -0,0 +1,69 @@
+import sys
+import os
+import time
+import tempfile
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from file_schema.scene import ElementData, PositionData, SceneData
+from file_schema.schema_logic import (get_json_files_from_folder, hash_data_class, load_scene_arrays_from_file, load_scene_from_file,
+                                      load_schema_from_file, save_schema_to_folder, save_scene_to_folder, scene_from_arrays, scene_to_arrays)
+
+# Compares the dacite based scene schema with the direct loader and the array backed scenes.
+#
+#   python scripts/benchmark_schema.py --scenes 500 --comps 50
+
+
+def random_element(name: str, amount: int) -> ElementData:
+    pos = [PositionData(location=np.random.uniform(-1, 1, 3).tolist(), orientation=np.random.uniform(-np.pi, np.pi, 3).tolist()) for _ in range(amount)]
+    return ElementData(name=name, pos=pos)
+
+
+def random_scene(comp_amount: int, camera_amount: int) -> SceneData:
+    cameras = [np.random.uniform(-1, 1, (4, 4)).tolist() for _ in range(camera_amount)]
+    return SceneData(config_path="config.json", comps=[random_element("comp", comp_amount)], bin=random_element("bin", 1), cameras=cameras)
+
+
+def timed(name: str, function, amount: int):
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    print(f"{name:<28} {amount / seconds:10.0f} scenes/s")
+    return result
+
+
+parser = argparse.ArgumentParser(description='Benchmark loading and saving of scene JSON files.')
+parser.add_argument('--scenes', nargs='?', default='500', help='The number of synthetic scenes')
+parser.add_argument('--comps', nargs='?', default='50', help='The number of components per scene')
+parser.add_argument('--cameras', nargs='?', default='25', help='The number of camera poses per scene')
+args = parser.parse_args()
+
+scenes = [random_scene(int(args.comps), int(args.cameras)) for _ in range(int(args.scenes))]
+
+with tempfile.TemporaryDirectory() as folder:
+    slow_folder = os.path.join(folder, "dacite")
+    fast_folder = os.path.join(folder, "direct")
+    os.makedirs(slow_folder)
+
+    timed("save_schema_to_folder", lambda: [save_schema_to_folder(scene, slow_folder) for scene in scenes], len(scenes))
+    timed("save_scene_to_folder", lambda: [save_scene_to_folder(scene, fast_folder) for scene in scenes], len(scenes))
+
+    slow_files = sorted(get_json_files_from_folder(slow_folder))
+    fast_files = sorted(get_json_files_from_folder(fast_folder))
+    if [os.path.basename(path) for path in slow_files] != [os.path.basename(path) for path in fast_files]:
+        raise RuntimeError("Both save functions must name the scene files the same")
+
+    slow_scenes = timed("load_schema_from_file", lambda: [load_schema_from_file(path, SceneData) for path in slow_files], len(slow_files))
+    fast_scenes = timed("load_scene_from_file", lambda: [load_scene_from_file(path) for path in fast_files], len(fast_files))
+    if slow_scenes != fast_scenes:
+        raise RuntimeError("Both loaders must return the same scenes")
+
+    loaded_arrays = timed("load_scene_arrays_from_file", lambda: [load_scene_arrays_from_file(path) for path in fast_files], len(fast_files))
+    if [scene_from_arrays(scene) for scene in loaded_arrays] != fast_scenes:
+        raise RuntimeError("The array loader must return the same scenes")
+
+    arrays = timed("scene_to_arrays", lambda: [scene_to_arrays(scene) for scene in scenes], len(scenes))
+    timed("scene_from_arrays", lambda: [scene_from_arrays(scene) for scene in arrays], len(arrays))
+    timed("hash_data_class", lambda: [hash_data_class(scene) for scene in scenes], len(scenes))
@@ -1,11 +1,11 @@
-import sys
 import os
+import json
+import hashlib
+import shutil
 import argparse
-
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
-from file_schema.coco import CocoData
-from file_schema.schema_logic import load_schema_from_file, save_schema_to_file
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
 # Recursively searches for a filename in a folder and it's sub folders, up to a 
 def search_files(filename, folderpath='.', depth=-1):
@@ -58,92 +58,410 @@ def folder_difference(input_path: str, output_path: str) -> str:
     
     return res
 
-def find_non_unique_annotations(annotations):
-    seen_ids = set()
-    non_unique_annotations = []
+# Input bytes that may be parsed or waiting for the writer at once, parsed JSON takes several times its file size
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2
+
+
+def hash_file(file_path: str) -> str:
+    sha = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def parse_coco_file(coco_path: str, out_coco_filepath: str, skip_images: int = 0):
+    """ Parse one COCO file and prepare its images and annotations for the merged file.
+
+        Runs in a worker process. Ids are left out of the serialized entries, the writer prepends
+        the new ids, so the order and grouping of the entries is all it needs to know. The first
+        `skip_images` images were merged before from a shorter version of the file, they and their
+        annotations are left out, and the summary tells whether they are still the same.
+
+        Returns:
+            Tuple[dict, List[str], List[Tuple[int, str]], dict]: The info, licenses and categories, the serialized new images,
+                for every new annotation the index of its image among the new images and its serialized remainder, and a summary
+                with the hash of the file, its amounts of images and annotations, and the hashes of all and of the skipped images.
+    """
+    with open(coco_path, 'rb') as f:
+        data = f.read()
+    coco = json.loads(data)
+
+    # Calculate scene path for the current file
+    scene_path = folder_difference(coco_path, out_coco_filepath)
+
+    image_index = {image["id"]: index for index, image in enumerate(coco["images"])}
+    images = []
+    images_hash = hashlib.sha1()
+    skipped_hash = images_hash.hexdigest() if skip_images == 0 else None
+    for index, image in enumerate(coco["images"]):
+        del image["id"]
+        image["file_name"] = scene_path + "/" + image["file_name"]
+        serialized = json.dumps(image)
+        images_hash.update(serialized.encode('utf-8'))
+        if index + 1 == skip_images:
+            skipped_hash = images_hash.hexdigest()
+        if index >= skip_images:
+            images.append(serialized)
+
+    annotations = []
+    skipped_annotations = 0
+    for ann in coco["annotations"]:
+        index = image_index[ann.pop("image_id")]
+        if index < skip_images:
+            skipped_annotations += 1
+            continue
+        del ann["id"]
+        ann["iscrowd"] = 0  # Ensure that iscrowd is set to 0
+        annotations.append((index - skip_images, json.dumps(ann)))
+
+    # Keep the annotations grouped by image in image order, as the ids are handed out in that order
+    annotations.sort(key=lambda item: item[0])
+
+    header = {key: coco[key] for key in ("info", "licenses", "categories")}
+    summary = {
+        "hash": hashlib.sha1(data).hexdigest(),
+        "images": len(coco["images"]),
+        "annotations": len(coco["annotations"]),
+        "images_hash": images_hash.hexdigest(),
+        "skipped_hash": skipped_hash,
+        "skipped_annotations": skipped_annotations,
+    }
+    return header, images, annotations, summary
+
+
+def parse_coco_files(coco_paths: List[str], out_coco_filepath: str, workers: int, skip_images: Optional[Dict[str, int]] = None,
+                     max_bytes: int = DEFAULT_MAX_BYTES):
+    # Parse in a pool of worker processes in the order of the paths. Files are only submitted while the files ahead
+    # of the consumer are fewer than `workers` and smaller than `max_bytes` together, a single larger file still goes
+    skip_images = skip_images or {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        pending_bytes = 0
+        for coco_path in coco_paths:
+            size = os.path.getsize(coco_path)
+            while pending and (len(pending) >= workers or pending_bytes + size > max_bytes):
+                pending_path, pending_size, future = pending.popleft()
+                pending_bytes -= pending_size
+                yield pending_path, future.result()
+            pending.append((coco_path, size, executor.submit(parse_coco_file, coco_path, out_coco_filepath, skip_images.get(coco_path, 0))))
+            pending_bytes += size
+        while pending:
+            coco_path, _, future = pending.popleft()
+            yield coco_path, future.result()
+
+
+class CocoWriter:
+    """ Writes a merged COCO file progressively, one parsed input file at a time.
+
+        Images and annotations are appended to two temporary fragment files, which are joined into the output
+        once all inputs are added, so neither list is ever kept in memory. The fragments are removed on close.
+    """
+
+    def __init__(self, out_coco_filepath: str, header: Optional[dict] = None, img_id_count: int = 0, ann_id_count: int = 0):
+        self.out_coco_filepath = out_coco_filepath
+        prefix = f"{out_coco_filepath}.{os.getpid()}"
+        self.images_path = f"{prefix}.images.part"
+        self.annotations_path = f"{prefix}.annotations.part"
+        self.images_file = open(self.images_path, 'w')
+        self.annotations_file = open(self.annotations_path, 'w')
+        self.header = header
+        self.img_id_count = img_id_count
+        self.ann_id_count = ann_id_count
+
+    def add(self, header: dict, images: List[str], annotations: List[Tuple[int, str]]):
+        # Info, licenses and categories of the first dataset
+        if self.header is None:
+            self.header = header
+
+        # Assign new, unique image ids, and write the entries without their old ids
+        first_image_id = self.img_id_count
+        for image in images:
+            separator = ", " if self.img_id_count else ""
+            self.images_file.write(f'{separator}{{"id": {self.img_id_count}, {image[1:]}')
+            self.img_id_count += 1
+
+        for index, ann in annotations:
+            separator = ", " if self.ann_id_count else ""
+            self.annotations_file.write(f'{separator}{{"id": {self.ann_id_count}, "image_id": {first_image_id + index}, {ann[1:]}')
+            self.ann_id_count += 1
+
+    def flush(self) -> Tuple[int, int]:
+        """ Flush the fragments, and return their sizes. """
+        self.images_file.flush()
+        self.annotations_file.flush()
+        return self.images_file.tell(), self.annotations_file.tell()
+
+    def get_header(self) -> dict:
+        return self.header or {"info": None, "licenses": [], "categories": []}
+
+    def write_output(self):
+        # Join the header and both fragments into the output, and move it into place at once
+        self.flush()
+        part_path = f"{self.out_coco_filepath}.{os.getpid()}.part"
+        with open(part_path, 'w') as out_file:
+            out_file.write(json.dumps(self.get_header())[:-1] + ', "images": [')
+            with open(self.images_path, 'r') as f:
+                shutil.copyfileobj(f, out_file)
+            out_file.write('], "annotations": [')
+            with open(self.annotations_path, 'r') as f:
+                shutil.copyfileobj(f, out_file)
+            out_file.write(']}')
+        os.replace(part_path, self.out_coco_filepath)
+
+    def close(self):
+        self.images_file.close()
+        self.annotations_file.close()
+        for path in (self.images_path, self.annotations_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def merge_coco_datasets(coco_paths: List[str], out_coco_filepath: str, workers: int = 4, max_bytes: int = DEFAULT_MAX_BYTES) -> Tuple[int, int]:
+    """ Merge COCO files into one, giving every image and annotation a new, unique id.
 
-    for annotation in annotations:
-        if annotation.id in seen_ids:
-            non_unique_annotations.append(annotation)
-        else:
-            seen_ids.add(annotation.id)
+        The files are parsed by a pool of worker processes, at most `workers` files and `max_bytes` of input
+        ahead of the writer. Every file is parsed as a whole, so the memory is bounded by the parsed form of
+        `max_bytes` of input, or of the largest input file if that is larger.
 
-    return non_unique_annotations
+        Returns:
+            Tuple[int, int]: The amount of merged images and annotations.
+    """
+    writer = CocoWriter(out_coco_filepath)
+    try:
+        for _, (header, images, annotations, _) in parse_coco_files(coco_paths, out_coco_filepath, workers, max_bytes=max_bytes):
+            writer.add(header, images, annotations)
+        writer.write_output()
+    finally:
+        writer.close()
+
+    return writer.img_id_count, writer.ann_id_count
+
+
+# Free space left after the images of an incremental output, at least this much and at least the size of the images
+MIN_IMAGES_PADDING = 1024 * 1024
+
+
+def copy_range(source, destination, start: int, end: int):
+    source.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        chunk = source.read(min(remaining, 1024 * 1024))
+        destination.write(chunk)
+        remaining -= len(chunk)
+
+
+def rewrite_output(writer: CocoWriter, layout: Optional[dict]) -> dict:
+    """ Write the whole incremental output, with the entries of the previous output and the new ones.
+
+        The images are followed by blank space, which is valid JSON, so later merges can write new images in place.
+
+        Returns:
+            dict: The byte offsets of the images, their free space and the annotations in the new output.
+    """
+    writer.flush()
+    out_coco_filepath = writer.out_coco_filepath
+    part_path = f"{out_coco_filepath}.{os.getpid()}.part"
+    with open(part_path, 'wb') as out_file, open(out_coco_filepath if layout else os.devnull, 'rb') as previous:
+        out_file.write((json.dumps(writer.get_header())[:-1] + ', "images": [').encode())
+        images_start = out_file.tell()
+        if layout:
+            copy_range(previous, out_file, layout["images_start"], layout["images_end"])
+        with open(writer.images_path, 'rb') as f:
+            shutil.copyfileobj(f, out_file)
+        images_end = out_file.tell()
+
+        # Doubling the space of the images keeps the rewrites rare as the dataset grows
+        padding = max(images_end - images_start, MIN_IMAGES_PADDING)
+        out_file.write(b" " * padding)
+        out_file.write(b'], "annotations": [')
+        annotations_start = out_file.tell()
+        if layout:
+            copy_range(previous, out_file, layout["annotations_start"], layout["annotations_end"])
+        with open(writer.annotations_path, 'rb') as f:
+            shutil.copyfileobj(f, out_file)
+        annotations_end = out_file.tell()
+        out_file.write(b']}')
+    os.replace(part_path, out_coco_filepath)
+
+    return {"images_start": images_start, "images_end": images_end, "images_capacity": images_end + padding,
+            "annotations_start": annotations_start, "annotations_end": annotations_end}
+
+
+def append_output(writer: CocoWriter, layout: dict) -> dict:
+    """ Write the new entries into the incremental output in place, the images into their free space
+        and the annotations over the closing brackets at the end.
 
+        Returns:
+            dict: The layout with the new ends of the images and annotations.
+    """
+    writer.flush()
+    with open(writer.out_coco_filepath, 'r+b') as out_file:
+        out_file.seek(layout["annotations_end"])
+        with open(writer.annotations_path, 'rb') as f:
+            shutil.copyfileobj(f, out_file)
+        annotations_end = out_file.tell()
+        out_file.write(b']}')
+        out_file.truncate()
+
+        out_file.seek(layout["images_end"])
+        with open(writer.images_path, 'rb') as f:
+            shutil.copyfileobj(f, out_file)
+        images_end = out_file.tell()
+
+    return {**layout, "images_end": images_end, "annotations_end": annotations_end}
+
+
+def save_merge_index(index: dict, index_path: str):
+    part_path = f"{index_path}.{os.getpid()}.part"
+    with open(part_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(part_path, index_path)
+
+
+def load_merge_index(index_path: str, out_coco_filepath: str) -> Optional[dict]:
+    # The index is only usable together with the output it describes
+    if not os.path.isfile(index_path):
+        return None
+    with open(index_path, 'r') as f:
+        index = json.load(f)
+
+    if index.get("pending") or not index.get("layout"):
+        print("The previous merge was interrupted")
+        return None
+    if not os.path.isfile(out_coco_filepath) or os.path.getsize(out_coco_filepath) != index["layout"]["annotations_end"] + 2:
+        print(f"Output {out_coco_filepath} is missing or was changed")
+        return None
 
-def merge_coco_datasets(coco_paths, out_coco_filepath):
-    coco_data_list = [load_schema_from_file(file_path=coco_path, data_class=CocoData) for coco_path in coco_paths]
+    return index
 
-    # Initialize counters for new image ids and annotation ids
-    img_id_count = 0
-    ann_id_count = 0
 
-    # Create a new CocoData object with info, licenses, and categories from the first dataset
-    merged_coco_data = CocoData(
-        info=coco_data_list[0].info,
-        licenses=coco_data_list[0].licenses,
-        categories=coco_data_list[0].categories,
-        annotations=[],
-        images=[],
-    )
+def get_changed_files(index: dict) -> Optional[List[str]]:
+    """ Find the merged files that changed since, like the COCO file of the last chunk of a BOP dataset that grows.
 
-    # Iterate over each CocoData object (representing a dataset)
-    for data_class, path in zip(coco_data_list, coco_paths):
-        # Create a dictionary mapping image ids to their related annotations
-        image_to_annotations = {image.id: [] for image in data_class.images}
-        for ann in data_class.annotations:
-            image_to_annotations[ann.image_id].append(ann)
+        Returns:
+            Optional[List[str]]: The changed files, or None if a merged file was removed.
+    """
+    changed = []
+    # Unchanged inputs keep their size and modification time, only hash the others
+    for coco_path, entry in index["files"].items():
+        if not os.path.isfile(coco_path):
+            print(f"Merged file {coco_path} was removed")
+            return None
+        stat = os.stat(coco_path)
+        if (stat.st_size, stat.st_mtime_ns) == (entry["size"], entry["mtime_ns"]):
+            continue
+        if hash_file(coco_path) == entry["hash"]:
+            entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            continue
+        if "images_hash" not in entry:
+            print(f"Merged file {coco_path} was changed")
+            return None
+        changed.append(coco_path)
+    return changed
+
+
+def merge_coco_incremental(coco_paths: List[str], out_coco_filepath: str, workers: int = 4, max_bytes: int = DEFAULT_MAX_BYTES) -> Tuple[int, int]:
+    """ Merge only the COCO files and the images of grown files that were not merged before, and append them.
+
+        A sidecar index next to the output records the merged files with their hashes and amounts of images and
+        annotations, together with the byte offsets of the image and annotation lists in the output. New entries
+        are written into the output in place, so a merge costs as much as the new data. Only when the free space
+        after the images runs out is the output rewritten, with twice the space.
+
+        A merged file that has grown since, with its earlier images unchanged, only adds the images at its end and
+        their annotations, which get the next ids of the output. When a merged file was removed or its earlier
+        images changed, the output no longer matches the inputs, so everything is merged again from scratch.
+
+        Returns:
+            Tuple[int, int]: The total amount of images and annotations in the output.
+    """
+    index_path = f"{out_coco_filepath}.index.json"
+    index = load_merge_index(index_path, out_coco_filepath)
+    changed_paths = get_changed_files(index) if index else None
 
-        # Calculate scene path for current data_class
-        scene_path = folder_difference(path, out_coco_filepath)
+    if index is None or changed_paths is None:
+        print("Merging all files from scratch")
+        index = {"header": None, "images": 0, "annotations": 0, "layout": None, "files": {}}
+        changed_paths = []
 
-        # Iterate over each image in the dataset
-        for image in data_class.images:
-            old_image_id = image.id  # Save the old image id
-            image.id = img_id_count  # Assign a new, unique image id
-            image.file_name = scene_path + "/" + image.file_name  # Update the file name with scene path
-            merged_coco_data.images.append(image)  # Add the image to the merged dataset
-            img_id_count += 1  # Increment the image id counter
+    new_paths = [path for path in coco_paths if os.path.abspath(path) not in index["files"]]
+    print(f"{len(new_paths)} new and {len(changed_paths)} grown of {len(coco_paths)} files")
+    if not new_paths and not changed_paths and index["layout"]:
+        return index["images"], index["annotations"]
 
-            # Assign new, unique ids to each annotation associated with the current image
-            for ann in image_to_annotations[old_image_id]:
-                ann.id = ann_id_count  # Assign a new, unique annotation id
-                ann.image_id = image.id  # Update the image id in the annotation
-                ann.iscrowd = 0  # Ensure that iscrowd is set to 0
-                merged_coco_data.annotations.append(ann)  # Add the annotation to the merged dataset
-                ann_id_count += 1  # Increment the annotation id counter
+    skip_images = {coco_path: index["files"][coco_path]["images"] for coco_path in changed_paths}
+    writer = CocoWriter(out_coco_filepath, index["header"], index["images"], index["annotations"])
+    rewritten = False
+    try:
+        for coco_path, (header, images, annotations, summary) in parse_coco_files(changed_paths + new_paths, out_coco_filepath, workers, skip_images, max_bytes):
+            entry = index["files"].get(os.path.abspath(coco_path))
+            if entry and (summary["skipped_hash"] != entry["images_hash"] or summary["skipped_annotations"] != entry["annotations"]):
+                # Not only grown, the entries merged before changed as well
+                print(f"Merged file {coco_path} was changed")
+                rewritten = True
+                break
 
-    return merged_coco_data
+            writer.add(header, images, annotations)
+            stat = os.stat(coco_path)
+            index["files"][os.path.abspath(coco_path)] = {
+                "hash": summary["hash"],
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "images": summary["images"],
+                "annotations": summary["annotations"],
+                "images_hash": summary["images_hash"],
+            }
 
+        # An output left half written by an interrupted merge is merged again from scratch
+        layout = index["layout"]
+        if not rewritten:
+            save_merge_index({**index, "pending": True}, index_path)
+            images_size, _ = writer.flush()
+            if layout and layout["images_end"] + images_size <= layout["images_capacity"]:
+                layout = append_output(writer, layout)
+            else:
+                layout = rewrite_output(writer, layout)
+    finally:
+        writer.close()
 
+    if rewritten:
+        os.remove(index_path)
+        return merge_coco_incremental(coco_paths, out_coco_filepath, workers, max_bytes)
 
+    index.update(header=writer.header, images=writer.img_id_count, annotations=writer.ann_id_count, layout=layout)
+    save_merge_index(index, index_path)
 
-# Define command line arguments
-parser = argparse.ArgumentParser(description='Merge COCO datasets and find non-unique annotations.')
-parser.add_argument('--folderpath', type=str, help='Path to the folder containing COCO files.')
-parser.add_argument('--filename', type=str, default="scene_gt_coco.json" ,help='Name of the COCO file to merge.')
-args = parser.parse_args()
+    return writer.img_id_count, writer.ann_id_count
 
-# Set the input folder path, input COCO filename, and output COCO file path
-in_folder_path = args.folderpath
-in_coco_filename = args.filename
-out_coco_filepath = in_folder_path + "/" + in_coco_filename
 
-# Search directory for all files with the defined COCO filename and return their filepath
-coco_paths = search_files(filename=in_coco_filename, folderpath=in_folder_path, depth=2)
-coco_paths.sort()
+if __name__ == "__main__":
 
-# Merge the COCO datasets from the input files into a new dataset
-new_coco_data = merge_coco_datasets(coco_paths, out_coco_filepath)
+    # Define command line arguments
+    parser = argparse.ArgumentParser(description='Merge COCO datasets into one file with unique ids.')
+    parser.add_argument('--folderpath', type=str, help='Path to the folder containing COCO files.')
+    parser.add_argument('--filename', type=str, default="scene_gt_coco.json" ,help='Name of the COCO file to merge.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='The number of COCO files parsed in parallel.')
+    parser.add_argument('--max-inflight-mb', type=int, default=DEFAULT_MAX_BYTES // 1024 ** 2, help='The size of the COCO files parsed or waiting at once, in MB.')
+    parser.add_argument('--incremental', action=argparse.BooleanOptionalAction, default=False, help='Only merge files that were not merged into the output before.')
+    args = parser.parse_args()
 
-# Find annotations with non-unique IDs in the new COCO dataset
-non_unique_annotations = find_non_unique_annotations(new_coco_data.annotations)
+    # Set the input folder path, input COCO filename, and output COCO file path
+    in_folder_path = args.folderpath
+    in_coco_filename = args.filename
+    out_coco_filepath = in_folder_path + "/" + in_coco_filename
 
-# Print the IDs of annotations with non-unique IDs
-for annotation in non_unique_annotations:
-    print(f"Annotation with non-unique id {annotation.id} found.")
+    # Search directory for all files with the defined COCO filename and return their filepath
+    coco_paths = search_files(filename=in_coco_filename, folderpath=in_folder_path, depth=2)
+    coco_paths.sort()
 
-# Save the merged dataset to disk
-print("Saving to disk, please wait")
-save_schema_to_file(data_class=new_coco_data, file_path=out_coco_filepath)
+    # The output has the same name as the inputs, do not merge a previous result into the new one
+    coco_paths = [path for path in coco_paths if os.path.abspath(path) != os.path.abspath(out_coco_filepath)]
 
+    # Merge the COCO datasets from the input files into a new dataset, written to disk while merging
+    print("Merging and saving to disk, please wait")
+    if args.incremental:
+        image_amount, annotation_amount = merge_coco_incremental(coco_paths, out_coco_filepath, workers=args.workers, max_bytes=args.max_inflight_mb * 1024 ** 2)
+    else:
+        image_amount, annotation_amount = merge_coco_datasets(coco_paths, out_coco_filepath, workers=args.workers, max_bytes=args.max_inflight_mb * 1024 ** 2)
+    print(f"Merged {image_amount} images and {annotation_amount} annotations from {len(coco_paths)} files into {out_coco_filepath}")
@@ -0,0 +1,304 @@
+import os
+import glob
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Checks rendered COCO annotations for empty images, tiny and truncated masks, RLE masks that do not
+# match their area or bbox, and class imbalance. Works on merged COCO files and on BOP dataset folders.
+#
+#   python scripts/dataset_qa.py data/bin_dataset --workers 8 --report qa_report.json --rejected rejected.jsonl
+
+
+def rle_statistics(counts: List[List[int]], heights: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Area, bounding box and pixel total of uncompressed column major RLE masks, without decoding them.
+
+        Args:
+            counts (List[List[int]]): RLE counts per mask, alternating background and foreground runs.
+            heights (np.ndarray): Mask height per mask.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: Areas (N,), boxes (N, 4) as [x, y, width, height]
+                with zeros for empty masks, and the sum of all counts per mask (N,).
+    """
+    amount = len(counts)
+    lengths = np.fromiter((len(c) for c in counts), dtype=np.int64, count=amount)
+    runs = np.fromiter(chain.from_iterable(counts), dtype=np.int64, count=int(lengths.sum()))
+    mask_index = np.repeat(np.arange(amount), lengths)
+    first_run = np.cumsum(lengths) - lengths
+
+    # Pixel offset of every run within its own mask
+    run_end = np.cumsum(runs)
+    run_start = run_end - runs
+    has_runs = lengths > 0
+    base = np.repeat(run_start[first_run[has_runs]], lengths[has_runs])
+    run_start -= base
+    run_end -= base
+
+    # Odd runs are foreground
+    foreground = ((np.arange(len(runs)) - np.repeat(first_run, lengths)) % 2 == 1) & (runs > 0)
+    totals = np.bincount(mask_index, weights=runs, minlength=amount).astype(np.int64)
+    areas = np.bincount(mask_index[foreground], weights=runs[foreground], minlength=amount).astype(np.int64)
+
+    # Column major pixel index p is at column p // h and row p % h, runs over several columns cover every row
+    index = mask_index[foreground]
+    h = heights[index]
+    first_pixel = run_start[foreground]
+    last_pixel = run_end[foreground] - 1
+    x0, x1 = first_pixel // h, last_pixel // h
+    single_column = x0 == x1
+    y0 = np.where(single_column, first_pixel % h, 0)
+    y1 = np.where(single_column, last_pixel % h, h - 1)
+
+    big = np.iinfo(np.int64).max
+    x_min, y_min = np.full(amount, big), np.full(amount, big)
+    x_max, y_max = np.full(amount, -1), np.full(amount, -1)
+    np.minimum.at(x_min, index, x0)
+    np.minimum.at(y_min, index, y0)
+    np.maximum.at(x_max, index, x1)
+    np.maximum.at(y_max, index, y1)
+
+    empty = areas == 0
+    boxes = np.stack([x_min, y_min, x_max - x_min + 1, y_max - y_min + 1], axis=1)
+    boxes[empty] = 0
+    return areas, boxes, totals
+
+
+def analyze_coco_file(coco_path: str, batch_size: int = 100000) -> dict:
+    """ Load one COCO file and compute the statistics of all its annotations in batches.
+
+        Runs in a worker process and only returns flat arrays, the checks are done on the combined arrays.
+    """
+    with open(coco_path, 'r') as f:
+        coco = json.load(f)
+
+    images = coco["images"]
+    image_ids = np.array([image["id"] for image in images], dtype=np.int64)
+    image_sizes = np.array([[image["width"], image["height"]] for image in images], dtype=np.int64).reshape(-1, 2)
+    row_of_image = {image_id: row for row, image_id in enumerate(image_ids.tolist())}
+
+    annotations = coco["annotations"]
+    amount = len(annotations)
+    image_rows = np.fromiter((row_of_image.get(ann["image_id"], -1) for ann in annotations), dtype=np.int64, count=amount)
+    category_ids = np.fromiter((ann["category_id"] for ann in annotations), dtype=np.int64, count=amount)
+    stored_areas = np.fromiter((ann["area"] for ann in annotations), dtype=np.float64, count=amount)
+    stored_boxes = np.array([ann["bbox"] for ann in annotations], dtype=np.float64).reshape(-1, 4)
+
+    rle_areas = np.zeros(amount, dtype=np.int64)
+    rle_boxes = np.zeros((amount, 4), dtype=np.int64)
+    malformed = np.zeros(amount, dtype=bool)
+
+    for start in range(0, amount, batch_size):
+        batch = annotations[start:start + batch_size]
+        segmentations = [ann["segmentation"] for ann in batch]
+
+        # Compressed string RLE and polygons are not written by BlenderProc, they are reported as malformed
+        uncompressed = np.array([isinstance(segmentation, dict) and isinstance(segmentation.get("counts"), list) and "size" in segmentation
+                                 for segmentation in segmentations], dtype=bool)
+
+        # Only RLE carries its [height, width], the others fall back to the size of their image
+        rows = image_rows[start:start + len(batch)]
+        sizes = np.zeros((len(batch), 2), dtype=np.int64)
+        sizes[rows >= 0] = image_sizes[rows[rows >= 0]][:, ::-1]
+        sizes[uncompressed] = np.array([segmentation["size"] for segmentation, valid in zip(segmentations, uncompressed) if valid],
+                                       dtype=np.int64).reshape(-1, 2)
+        counts = [segmentation["counts"] if valid else [] for segmentation, valid in zip(segmentations, uncompressed)]
+
+        areas, boxes, totals = rle_statistics(counts, np.maximum(sizes[:, 0], 1))
+        rle_areas[start:start + len(batch)] = areas
+        rle_boxes[start:start + len(batch)] = boxes
+        malformed[start:start + len(batch)] = ~uncompressed | (totals != sizes[:, 0] * sizes[:, 1])
+
+    return {
+        "path": coco_path,
+        "image_ids": image_ids,
+        "image_sizes": image_sizes,
+        "file_names": [image["file_name"] for image in images],
+        "categories": coco.get("categories", []),
+        "image_rows": image_rows,
+        "category_ids": category_ids,
+        "stored_areas": stored_areas,
+        "stored_boxes": stored_boxes,
+        "rle_areas": rle_areas,
+        "rle_boxes": rle_boxes,
+        "malformed": malformed,
+    }
+
+
+def find_coco_files(paths: List[str], filename: str) -> List[str]:
+    # Folders are searched for the COCO files of the BOP chunks, a merged file at the top of the folder is skipped
+    coco_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = glob.glob(os.path.join(path, "**", filename), recursive=True)
+            coco_paths += sorted(p for p in found if os.path.dirname(os.path.abspath(p)) != os.path.abspath(path))
+        else:
+            coco_paths.append(path)
+    return coco_paths
+
+
+def check_file(result: dict, args) -> Tuple[dict, List[dict]]:
+    """ Run the checks on the statistics of one file.
+
+        Returns:
+            Tuple[dict, List[dict]]: The issue counts, and the rejected images with their reasons.
+    """
+    image_amount = len(result["image_ids"])
+    rows = result["image_rows"]
+    known = rows >= 0
+    widths = np.where(known, result["image_sizes"][np.maximum(rows, 0), 0] if image_amount else 0, 0)
+    heights = np.where(known, result["image_sizes"][np.maximum(rows, 0), 1] if image_amount else 0, 0)
+
+    areas = result["rle_areas"]
+    boxes = result["rle_boxes"]
+    valid = ~result["malformed"]
+
+    issues = {
+        "malformed_rle": ~valid,
+        "unknown_image": ~known,
+        "area_mismatch": valid & (np.abs(areas - result["stored_areas"]) > args.tolerance),
+        "bbox_mismatch": valid & (areas > 0) & (np.abs(boxes - result["stored_boxes"]).max(axis=1) > args.tolerance),
+        "empty_mask": valid & (areas == 0),
+        "tiny_mask": valid & (areas > 0) & (areas < args.min_area),
+        # Masks touching the image border are cut off by it
+        "truncated_mask": valid & (areas > 0) & known & (
+            (boxes[:, 0] == 0) | (boxes[:, 1] == 0) | (boxes[:, 0] + boxes[:, 2] >= widths) | (boxes[:, 1] + boxes[:, 3] >= heights)),
+    }
+    counts = {name: int(flags.sum()) for name, flags in issues.items()}
+
+    # Images without a single usable mask
+    usable = valid & (areas >= args.min_area)
+    usable_per_image = np.bincount(rows[known & usable], minlength=image_amount)
+    empty_images = usable_per_image == 0
+    counts["empty_image"] = int(empty_images.sum())
+
+    rejecting = ["malformed_rle", "area_mismatch", "bbox_mismatch"] + [name for name in ("tiny_mask", "truncated_mask") if name in args.reject]
+    reasons: Dict[int, set] = {}
+    for name in rejecting:
+        for row in np.unique(rows[issues[name] & known]):
+            reasons.setdefault(int(row), set()).add(name)
+    for row in np.flatnonzero(empty_images):
+        reasons.setdefault(int(row), set()).add("empty_image")
+
+    rejected = [{
+        "file": result["path"],
+        "image_id": int(result["image_ids"][row]),
+        "file_name": result["file_names"][row],
+        "reasons": sorted(names),
+    } for row, names in sorted(reasons.items())]
+
+    return counts, rejected
+
+
+def class_statistics(results: List[dict]) -> dict:
+    # Annotations, images and mask areas per category over all files
+    category_ids = np.concatenate([result["category_ids"] for result in results]) if results else np.zeros(0, dtype=np.int64)
+    areas = np.concatenate([result["rle_areas"] for result in results]) if results else np.zeros(0, dtype=np.int64)
+    names = {category["id"]: category["name"] for result in results for category in result["categories"]}
+
+    statistics = {}
+    for category_id in sorted(set(names) | set(np.unique(category_ids).tolist())):
+        selected = category_ids == category_id
+        category_areas = areas[selected]
+        images = sum(len(np.unique(result["image_rows"][result["category_ids"] == category_id])) for result in results)
+        statistics[str(category_id)] = {
+            "name": names.get(category_id),
+            "annotations": int(selected.sum()),
+            "images": images,
+            "median_area": float(np.median(category_areas)) if len(category_areas) else 0.0,
+            "mean_area": float(category_areas.mean()) if len(category_areas) else 0.0,
+        }
+
+    annotation_counts = np.array([entry["annotations"] for entry in statistics.values()])
+    return {
+        "per_class": statistics,
+        "missing_classes": [key for key, entry in statistics.items() if entry["annotations"] == 0],
+        # Most over least frequent class, among the classes that occur
+        "imbalance_ratio": float(annotation_counts.max() / annotation_counts[annotation_counts > 0].min()) if (annotation_counts > 0).any() else None,
+    }
+
+
+def image_statistics(results: List[dict]) -> dict:
+    # Distribution of annotations and covered pixels per image
+    per_image_annotations = []
+    per_image_coverage = []
+    for result in results:
+        image_amount = len(result["image_ids"])
+        if image_amount == 0:
+            continue
+        known = result["image_rows"] >= 0
+        rows = result["image_rows"][known]
+        per_image_annotations.append(np.bincount(rows, minlength=image_amount))
+        pixels = result["image_sizes"].prod(axis=1).clip(min=1)
+        per_image_coverage.append(np.bincount(rows, weights=result["rle_areas"][known], minlength=image_amount) / pixels)
+
+    if not per_image_annotations:
+        return {}
+
+    annotations = np.concatenate(per_image_annotations)
+    coverage = np.concatenate(per_image_coverage)
+    percentiles = [5, 50, 95]
+    return {
+        "annotations_per_image": dict(zip([f"p{p}" for p in percentiles], np.percentile(annotations, percentiles).tolist()), mean=float(annotations.mean())),
+        "mask_coverage": dict(zip([f"p{p}" for p in percentiles], np.percentile(coverage, percentiles).tolist()), mean=float(coverage.mean())),
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Check COCO annotations of rendered datasets and report statistics.')
+    parser.add_argument('paths', nargs='+', help='Merged COCO files, or BOP dataset folders to search for COCO files')
+    parser.add_argument('--filename', type=str, default="scene_gt_coco.json", help='Name of the COCO files in dataset folders')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='The number of COCO files analyzed in parallel')
+    parser.add_argument('--min-area', type=int, default=100, help='Masks with fewer pixels are reported as tiny')
+    parser.add_argument('--tolerance', type=float, default=1, help='Allowed difference in pixels between the RLE mask and the stored area and bbox')
+    parser.add_argument('--reject', nargs='*', default=[], choices=["tiny_mask", "truncated_mask"], help='Also reject images with these mask issues')
+    parser.add_argument('--report', type=str, default="qa_report.json", help='Where to write the report')
+    parser.add_argument('--rejected', type=str, default="rejected.jsonl", help='Where to write the rejected images, one JSON line each')
+    args = parser.parse_args()
+
+    start = time.time()
+    coco_paths = find_coco_files(args.paths, args.filename)
+    print(f"Checking {len(coco_paths)} COCO files")
+
+    results = []
+    issue_counts: Dict[str, int] = {}
+    rejected_amount = 0
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor, open(args.rejected, 'w') as rejected_file:
+        for result in executor.map(analyze_coco_file, coco_paths):
+            counts, rejected = check_file(result, args)
+            for name, count in counts.items():
+                issue_counts[name] = issue_counts.get(name, 0) + count
+            for entry in rejected:
+                rejected_file.write(json.dumps(entry) + "\n")
+            rejected_amount += len(rejected)
+
+            # Keep only what the dataset wide statistics need
+            for key in ("stored_areas", "stored_boxes", "rle_boxes", "malformed", "file_names"):
+                del result[key]
+            results.append(result)
+
+    report = {
+        "files": len(coco_paths),
+        "images": sum(len(result["image_ids"]) for result in results),
+        "annotations": sum(len(result["category_ids"]) for result in results),
+        "rejected_images": rejected_amount,
+        "issues": issue_counts,
+        "images_statistics": image_statistics(results),
+        "classes": class_statistics(results),
+        "seconds": time.time() - start,
+    }
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=4)
+
+    print(f"Checked {report['images']} images and {report['annotations']} annotations in {report['seconds']:.1f} seconds")
+    for name, count in issue_counts.items():
+        if count:
+            print(f"  {name}: {count}")
+    print(f"Rejected {rejected_amount} images, see {args.rejected} and {args.report}")
@@ -0,0 +1,21 @@
+import sys
+import os
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from file_schema.bop_shards import finalize_shards, get_committed_shards
+
+# Merge the scene shards written by `bin_render.py --sharded-output` into standard BOP chunks.
+# Safe to run while renders are still writing shards, only completed shards are merged.
+#
+#   python scripts/finalize_bop.py --output-dir data
+
+parser = argparse.ArgumentParser(description='Merge rendered scene shards into BOP chunks with merged BOP and COCO files.')
+parser.add_argument('--output-dir', nargs='?', default='data', help='The BOP output folder of the render')
+parser.add_argument('--frames-per-chunk', nargs='?', default='1000', help='The maximum amount of images per chunk')
+args = parser.parse_args()
+
+shards = len(get_committed_shards(args.output_dir))
+images = finalize_shards(args.output_dir, frames_per_chunk=int(args.frames_per_chunk))
+print(f"Merged {images} images from {shards} shards into {args.output_dir}")
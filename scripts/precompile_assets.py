@@ -0,0 +1,131 @@
+import blenderproc as bproc
+
+import sys
+import os
+import json
+import shutil
+import subprocess
+import time
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from file_schema.config import ConfigData
+from file_schema.schema_logic import load_schema_from_file
+from entities.component import Component
+from entities.bin import Bin
+
+# Precompiles the downsampled meshes, prepared .blend libraries and convex decompositions of all bins and components in a config,
+# so the simulator only hits the caches in resources/obj_cache, resources/blend_cache and resources/vhacd/decomp_cache on startup.
+#
+#   blenderproc run scripts/precompile_assets.py --config config.json --workers 4
+
+
+vhacd_path = 'resources/vhacd'
+cache_path = vhacd_path + '/decomp_cache'
+
+
+def get_assets(config_data: ConfigData):
+    # Every distinct mesh path once, bins are loaded as passive and components as active rigid bodies
+    assets = {"walls": ("walls", None)}
+    for bin_data in config_data.bins:
+        assets.setdefault(bin_data.path, ("bin", bin_data))
+    for comp_data in config_data.components:
+        assets.setdefault(comp_data.path, ("component", comp_data))
+    return list(assets.values())
+
+
+def precompile(assets, output_file: str):
+    # Loading an entity the way the simulator does fills both caches
+    bproc.init()
+    manifest = []
+
+    for kind, data in assets:
+        start = time.time()
+        
+        if kind == "walls":
+            # Same plane as the Walls of the simulator
+            wall = bproc.object.create_primitive('PLANE', scale=[20, 20, 1], rotation=[-1.570796, 0, 0])
+            wall.enable_rigidbody(active=False, collision_shape="COMPOUND")
+            wall.build_convex_decomposition_collision_shape(vhacd_path, cache_dir=cache_path)
+            name, source_path, simulation_path = "walls", None, None
+        else:
+            entity = Bin(data) if kind == "bin" else Component(data)
+            entity.load(build_convex=True, downsample_mesh=True)
+            name, source_path, simulation_path = data.name, data.path, entity.path
+
+        manifest.append({
+            "name": name,
+            "kind": kind,
+            "source_path": source_path,
+            "simulation_path": simulation_path,
+            "decomposition_cache": cache_path,
+            "seconds": time.time() - start,
+        })
+        print(f"Precompiled {name} in {manifest[-1]['seconds']:.1f} seconds")
+
+    with open(output_file, 'w') as f:
+        json.dump(manifest, f, indent=4)
+
+
+def run_workers(args, asset_indices, workers: int):
+    # Split the assets over independent blenderproc processes
+    blenderproc = shutil.which("blenderproc")
+    if blenderproc is None:
+        raise FileNotFoundError("The blenderproc command is needed to launch precompile workers")
+
+    processes = []
+    for index in range(min(workers, len(asset_indices))):
+        output_file = f"{args.manifest}.worker_{index}.part"
+        command = [
+            blenderproc, "run", os.path.abspath(__file__),
+            "--config", str(args.config),
+            "--assets", ",".join(str(i) for i in asset_indices[index::workers]),
+            "--worker-output", output_file,
+        ]
+        processes.append((subprocess.Popen(command), output_file))
+
+    manifest = []
+    for process, output_file in processes:
+        if process.wait() != 0:
+            print(f"Precompile worker {process.pid} failed with exit code {process.returncode}")
+            continue
+        with open(output_file, 'r') as f:
+            manifest += json.load(f)
+        os.remove(output_file)
+
+    return manifest
+
+
+parser = argparse.ArgumentParser(description='Precompile downsampled meshes and convex decompositions for a config.')
+parser.add_argument('--config', nargs='?', default='config.json', help='filepath to configuration JSON file')
+parser.add_argument('--workers', nargs='?', default=os.cpu_count(), help='The number of assets to precompile in parallel')
+parser.add_argument('--manifest', nargs='?', default='resources/asset_manifest.json', help='Where to write the manifest of precompiled assets')
+parser.add_argument('--assets', nargs='?', default=None, help=argparse.SUPPRESS)
+parser.add_argument('--worker-output', nargs='?', default=None, help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+config_data = load_schema_from_file(file_path=str(args.config), data_class=ConfigData)
+assets = get_assets(config_data)
+
+if args.assets is not None:
+    # Worker process, precompile the assigned share of the assets
+    precompile([assets[int(i)] for i in args.assets.split(",")], args.worker_output)
+    sys.exit()
+
+start = time.time()
+os.makedirs(os.path.dirname(args.manifest) or ".", exist_ok=True)
+asset_indices = list(range(len(assets)))
+manifest = []
+
+# V-HACD is downloaded and built on first use, do that in a single worker before fanning out
+if not os.path.exists(os.path.join(vhacd_path, "v-hacd")):
+    manifest += run_workers(args, asset_indices[:1], 1)
+    asset_indices = asset_indices[1:]
+
+manifest += run_workers(args, asset_indices, int(args.workers))
+
+with open(args.manifest, 'w') as f:
+    json.dump({"config": str(args.config), "assets": manifest}, f, indent=4)
+
+print(f"Precompiled {len(manifest)} of {len(assets)} assets in {time.time() - start:.1f} seconds, manifest saved to {args.manifest}")
@@ -0,0 +1,28 @@
+import sys
+import os
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from file_schema.scene_store import SceneStore
+
+# Convert between folders of scene JSON files and a binary scene store
+#
+#   python scripts/scene_store.py import resources/simulations/config_xxxxxx/complete resources/simulations/config_xxxxxx/complete_store --remove
+#   python scripts/scene_store.py export resources/simulations/config_xxxxxx/complete_store ./exported_scenes
+
+parser = argparse.ArgumentParser(description='Import scene JSON files into a scene store, or export a scene store to JSON files.')
+parser.add_argument('command', choices=['import', 'export'], help='Direction of the conversion')
+parser.add_argument('source', type=str, help='Folder with scene JSON files to import, or the scene store to export')
+parser.add_argument('destination', type=str, help='The scene store to import into, or the folder to export to')
+parser.add_argument('--remove', action=argparse.BooleanOptionalAction, default=False, help='Remove the JSON files after importing them')
+args = parser.parse_args()
+
+if args.command == 'import':
+    store = SceneStore(args.destination)
+    amount = store.import_folder(args.source, remove=args.remove)
+    print(f"Imported {amount} scenes, the store now holds {len(store)} scenes")
+else:
+    store = SceneStore(args.source)
+    amount = store.export_folder(args.destination)
+    print(f"Exported {amount} scenes to {args.destination}")
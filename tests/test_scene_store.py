@@ -0,0 +1,46 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from file_schema.scene import ElementData, PositionData, SceneData
+from file_schema.scene_store import SceneStore
+from file_schema.schema_logic import get_json_files_from_folder, load_scene_from_file, save_scene_to_folder
+
+
+def random_scene(rng: np.random.Generator) -> SceneData:
+    # Full precision poses, which the store rounds to float32
+    def element(name: str, amount: int) -> ElementData:
+        return ElementData(name=name, pos=[PositionData(location=rng.random(3).tolist(), orientation=rng.random(3).tolist()) for _ in range(amount)])
+
+    return SceneData(config_path="config.json", comps=[element("obj_000001", 5), element("obj_000002", 3)], bin=element("box_bin", 1),
+                     cameras=[np.eye(4).tolist()])
+
+
+def get_names(folder_path: str):
+    return sorted(os.path.basename(path) for path in get_json_files_from_folder(folder_path))
+
+
+def test_export_keeps_the_imported_names(tmp_path):
+    rng = np.random.default_rng(0)
+    source = str(tmp_path / "complete")
+    for _ in range(4):
+        save_scene_to_folder(random_scene(rng), source)
+    names = get_names(source)
+
+    store = SceneStore(str(tmp_path / "store"))
+    assert store.import_folder(source, remove=True) == 4
+    assert sorted(f"{hash}.json" for hash in store.hashes()) == names
+
+    destination = str(tmp_path / "exported")
+    assert store.export_folder(destination) == 4
+    assert get_names(destination) == names
+
+    # The exported scenes can be imported again under the same keys
+    again = SceneStore(str(tmp_path / "again"))
+    again.import_folder(destination)
+    assert sorted(again.hashes()) == sorted(store.hashes())
+    for name in names:
+        scene = load_scene_from_file(os.path.join(destination, name))
+        assert np.allclose(scene.comps[0].pos[0].location, store.get(name[:-len(".json")]).comps[0].pos[0].location)
@@ -0,0 +1,54 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from entities.slot_layout import (SLOT_SPACING, WALL_SIZE, get_parked_component_location, get_parked_wall_offset, get_slot_offset,
+                                  get_wall_bounds)
+
+# A small bin of the example config and a large one, in meters
+BIN_SHAPES = [[0.42, 0.3, 0.1], [2.0, 1.5, 0.8]]
+
+
+def overlaps(a: np.ndarray, b: np.ndarray) -> bool:
+    # Two axis aligned boxes, given as their low and high corners
+    return bool(np.all(a[0] <= b[1]) and np.all(b[0] <= a[1]))
+
+
+def get_slot_bounds(bin_shape, index: int) -> np.ndarray:
+    # The walls of a slot enclose its bin and the region the components are dropped from
+    walls = get_wall_bounds(bin_shape, get_slot_offset(index))
+    return np.array([walls.min(axis=(0, 1)), walls.max(axis=(0, 1))])
+
+
+@pytest.mark.parametrize("bin_shape", BIN_SHAPES)
+@pytest.mark.parametrize("bins_per_run", [1, 2, 4, 10, 11, 64])
+def test_slots_never_overlap_parked_walls(bin_shape, bins_per_run):
+    parked_walls = get_wall_bounds([0, 0, 0], get_parked_wall_offset(bins_per_run))
+    for index in range(bins_per_run):
+        slot = get_slot_bounds(bin_shape, index)
+        for wall in parked_walls:
+            assert not overlaps(slot, wall), f"Slot {index} of {bins_per_run} touches a parked wall"
+
+
+@pytest.mark.parametrize("bin_shape", BIN_SHAPES)
+@pytest.mark.parametrize("bins_per_run", [1, 2, 4, 10, 11, 64])
+def test_slots_never_reach_parked_components(bin_shape, bins_per_run):
+    parked = get_parked_component_location(bins_per_run)
+    for index in range(bins_per_run):
+        slot = get_slot_bounds(bin_shape, index)
+        assert not overlaps(slot, np.array([parked, parked])), f"Slot {index} of {bins_per_run} reaches the parked components"
+        # The pose sampler only checks components within 100 meters of a slot
+        assert np.linalg.norm(parked - get_slot_offset(index)) > 100
+
+
+@pytest.mark.parametrize("bin_shape", BIN_SHAPES)
+def test_slots_never_overlap_each_other(bin_shape):
+    for index in range(1, 16):
+        assert not overlaps(get_slot_bounds(bin_shape, index - 1), get_slot_bounds(bin_shape, index))
+
+
+def test_walls_fit_between_slots():
+    assert SLOT_SPACING > WALL_SIZE